@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+admission.py has the admission control of the write endpoints: per
+endpoint class, a limit on the requests running at once with a bounded
+queue of waiting ones, shed when their deadline passes, and a token bucket
+per client. Writes flooding a worker can then only hold a few of its
+threads and pooled connections, the others stay free for the read pages.
+Every worker process enforces its own limits
+"""
+
+import collections
+import math
+import threading
+import time
+
+# reasons a request is rejected
+RATE_LIMITED = 'rate_limited'
+QUEUE_FULL = 'queue_full'
+DEADLINE = 'deadline'
+
+Rejection = collections.namedtuple('Rejection', ['reason', 'retry_after'])
+
+
+class TokenBuckets():
+    """
+    Token bucket per client: a client may send burst requests at once, then
+    rate requests per second. The buckets of the max_clients most recently
+    seen clients are kept, a client seen again after its bucket was dropped
+    starts with a full one
+    """
+
+    def __init__(self, rate, burst, max_clients):
+        """
+        :param rate: tokens added per second
+        :param burst: capacity of a bucket
+        :param max_clients: number of buckets kept
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, client):
+        """
+        Takes one token of the bucket of client
+        :param client: client key, e.g. its address
+        :return: 0 if a token was taken, otherwise seconds until the next one
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class AdmissionController():
+    """
+    Admission of the requests of one endpoint class: at most concurrency of
+    them run at once, up to queue_size more wait for a slot for at most
+    max_wait_seconds, the others are rejected at once
+    """
+
+    def __init__(self, name, concurrency, queue_size, max_wait_seconds, rate_limit=None):
+        """
+        :param name: endpoint class
+        :param concurrency: requests running at once
+        :param queue_size: requests waiting for a slot
+        :param max_wait_seconds: deadline of a waiting request
+        :param rate_limit: TokenBuckets of the clients, None for no rate limit
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_wait_seconds = max_wait_seconds
+        self.rate_limit = rate_limit
+        self.rejected = collections.Counter()
+        self._running = 0
+        self._queued = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, client):
+        """
+        Admits a request of client, waiting for a slot if needed
+        :param client: client key, e.g. its address
+        :return: None if admitted (release has to be called once it is done),
+                 otherwise the Rejection
+        """
+        if self.rate_limit is not None:
+            wait = self.rate_limit.take(client)
+            if wait:
+                return self._reject(RATE_LIMITED, wait)
+        deadline = time.monotonic() + self.max_wait_seconds
+        with self._condition:
+            # requests already waiting go first
+            if self._running < self.concurrency and not self._queued:
+                self._running += 1
+                return None
+            if self._queued >= self.queue_size:
+                return self._reject(QUEUE_FULL, self.max_wait_seconds)
+            self._queued += 1
+            try:
+                while self._running >= self.concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        # a slot freed for this request goes to the next one
+                        self._condition.notify()
+                        return self._reject(DEADLINE, self.max_wait_seconds)
+                    self._condition.wait(remaining)
+                self._running += 1
+                return None
+            finally:
+                self._queued -= 1
+
+    def release(self):
+        """
+        Frees the slot of an admitted request
+        :return:
+        """
+        with self._condition:
+            self._running -= 1
+            self._condition.notify()
+
+    def _reject(self, reason, retry_after):
+        """
+        :param reason: RATE_LIMITED, QUEUE_FULL or DEADLINE
+        :param retry_after: seconds the client should wait before retrying
+        :return: Rejection, retry_after rounded up to whole seconds
+        """
+        with self._condition:
+            self.rejected[reason] += 1
+        return Rejection(reason, max(1, int(math.ceil(retry_after))))
+
+    @property
+    def stats(self):
+        """
+        :return: number of running and of waiting requests
+        """
+        with self._condition:
+            return {'running': self._running, 'queued': self._queued}
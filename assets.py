@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+assets.py has the content hash fingerprints of the static files:
+url_for('static', ...) adds the fingerprint of the file to its url, and the
+files requested with their current fingerprint are cached by browsers for
+good, a changed file gets a new url
+"""
+
+import hashlib
+import os
+import threading
+from flask import request
+from werkzeug.security import safe_join
+
+# query argument carrying the fingerprint
+FINGERPRINT_ARGUMENT = 'v'
+
+
+class StaticFingerprints():
+    """
+    Fingerprints of the files of the static folder of an app, recomputed
+    when a file changes
+    """
+
+    def __init__(self, max_age_seconds, length=12):
+        """
+        :param max_age_seconds: browser cache lifetime of the fingerprinted urls
+        :param length: hex digits of the content hash kept
+        """
+        self.max_age_seconds = max_age_seconds
+        self.length = length
+        self.folder = None
+        # filename -> (mtime, size, fingerprint)
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def fingerprint(self, filename):
+        """
+        :param filename: path relative to the static folder
+        :return: hash of the content of the file, None if it does not exist
+        """
+        path = safe_join(self.folder, filename)
+        try:
+            stat = os.stat(path)
+        except (OSError, TypeError):
+            return None
+        with self._lock:
+            known = self._fingerprints.get(filename)
+        if known is not None and known[:2] == (stat.st_mtime, stat.st_size):
+            return known[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as static_file:
+            for block in iter(lambda: static_file.read(64 * 1024), b''):
+                digest.update(block)
+        fingerprint = digest.hexdigest()[:self.length]
+        with self._lock:
+            self._fingerprints[filename] = (stat.st_mtime, stat.st_size, fingerprint)
+        return fingerprint
+
+    def add_fingerprint(self, endpoint, values):
+        """
+        url_defaults hook adding the fingerprint to the static urls
+        :param endpoint:
+        :param values: url values, updated in place
+        :return:
+        """
+        if endpoint == 'static' and 'filename' in values \
+                and FINGERPRINT_ARGUMENT not in values:
+            fingerprint = self.fingerprint(values['filename'])
+            if fingerprint is not None:
+                values[FINGERPRINT_ARGUMENT] = fingerprint
+
+    def set_cache_headers(self, response):
+        """
+        after_request hook making the static files requested with their
+        current fingerprint immutable, a stale fingerprint keeps the
+        default headers
+        :param response:
+        :return: response
+        """
+        if request.endpoint != 'static' or response.status_code not in (200, 304):
+            return response
+        fingerprint = request.args.get(FINGERPRINT_ARGUMENT)
+        if fingerprint and fingerprint == self.fingerprint(request.view_args['filename']):
+            response.headers['Cache-Control'] = 'public, max-age={0}, immutable'.format(
+                self.max_age_seconds)
+            response.headers.pop('Expires', None)
+        return response
+
+    def init_app(self, app):
+        """
+        Fingerprints the static files of app
+        :param app: flask app
+        :return:
+        """
+        self.folder = app.static_folder
+        app.url_defaults(self.add_fingerprint)
+        app.after_request(self.set_cache_headers)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+"""
+async_api.py has a read-only asyncio tier of the student API, served next
+to the Flask app: /api/students, /api/classes/<id> and
+/api/classes/<id>/students run concurrently on one event loop with an
+asyncpg pool of their own, so slow reads wait on the database without
+holding a worker thread each. The statements are built from the tables of
+models.py and the responses have the format of the Flask routes
+
+    python3 async_api.py --port 8081
+"""
+
+import argparse
+import itertools
+import logging
+import re
+import uuid
+import asyncpg
+from aiohttp import web
+from sqlalchemy import bindparam, select, tuple_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import aliased
+import configuration as CONFIGURATION
+import models
+
+_DIALECT = postgresql.dialect(paramstyle='format')
+_PLACEHOLDER = re.compile(r'%(s|%)')
+POOL_KEY = 'pool'
+
+
+class Statement():
+    """
+    SQLAlchemy core statement compiled once to the $n placeholders of asyncpg
+    """
+
+    def __init__(self, statement):
+        """
+        :param statement: statement whose parameters are named bindparams
+        """
+        compiled = statement.compile(dialect=_DIALECT)
+        positions = itertools.count(1)
+        self.sql = _PLACEHOLDER.sub(
+            lambda match: '${0}'.format(next(positions)) if match.group(1) == 's' else '%',
+            compiled.string)
+        self.parameter_names = compiled.positiontup
+
+    def arguments(self, parameters):
+        """
+        :param parameters: dict of bindparam name -> value
+        :return: list of the values in placeholder order
+        """
+        return [parameters[name] for name in self.parameter_names]
+
+
+def _record_columns(model, record_type):
+    """
+    :param model: mapped class
+    :param record_type: namedtuple class whose fields are columns of model
+    :return: list of the columns in field order
+    """
+    return [getattr(model, field) for field in record_type._fields]
+
+
+_STUDENT_COLUMNS = _record_columns(models.Student, models.StudentRecord)
+_STUDENT_ORDER = (models.Student.created_on, models.Student.id)
+STUDENTS_FIRST_PAGE = Statement(select(_STUDENT_COLUMNS).order_by(*_STUDENT_ORDER).limit(
+    bindparam('limit')))
+STUDENTS_NEXT_PAGE = Statement(select(_STUDENT_COLUMNS).where(
+    tuple_(*_STUDENT_ORDER) > tuple_(bindparam('created_on'), bindparam('id'))).order_by(
+        *_STUDENT_ORDER).limit(bindparam('limit')))
+ROSTER = Statement(select(_STUDENT_COLUMNS).where(
+    models.Student.class_id == bindparam('class_id')).order_by(*_STUDENT_ORDER))
+_LEADER = aliased(models.Student)
+CLASS_VIEW = Statement(select(
+    _record_columns(models.StudentClass, models.StudentClassRecord) +
+    _record_columns(_LEADER, models.StudentRecord)).select_from(
+        models.StudentClass.__table__.outerjoin(
+            _LEADER, _LEADER.id == models.StudentClass.class_leader)).where(
+                models.StudentClass.id == bindparam('class_id')))
+
+
+def get_page_size(request):
+    """
+    Reads the page_size query argument and clamps it to the configured limits
+    :param request: aiohttp request
+    :return: page size
+    """
+    try:
+        page_size = int(request.query.get('page_size') or CONFIGURATION.DEFAULT_PAGE_SIZE)
+    except ValueError:
+        page_size = CONFIGURATION.DEFAULT_PAGE_SIZE
+    return max(1, min(page_size, CONFIGURATION.MAX_PAGE_SIZE))
+
+
+def parse_uuid(value):
+    """
+    :param value: id from the url
+    :return: normalized id, None if value is not a uuid
+    """
+    try:
+        return str(uuid.UUID(value))
+    except ValueError:
+        return None
+
+
+async def fetch(request, statement, **parameters):
+    """
+    :param request: aiohttp request
+    :param statement: Statement
+    :param parameters: values of its bindparams
+    :return: list of asyncpg records
+    """
+    return await request.app[POOL_KEY].fetch(statement.sql, *statement.arguments(parameters))
+
+
+async def list_students(request):
+    """
+    GET method to list students page by page, like /api/students of the Flask app
+    :param request:
+    :return: page of students along with next_cursor
+    """
+    page_size = get_page_size(request)
+    cursor = request.query.get('cursor')
+    try:
+        if cursor:
+            created_on, row_id = models.PageCursor.decode(cursor)
+            rows = await fetch(request, STUDENTS_NEXT_PAGE, created_on=created_on,
+                               id=str(uuid.UUID(row_id)), limit=page_size + 1)
+        else:
+            rows = await fetch(request, STUDENTS_FIRST_PAGE, limit=page_size + 1)
+    except ValueError as exception:
+        logging.error("Failed to list students due to %s", exception)
+        return web.json_response({'message': 'Invalid cursor'}, status=400)
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to list students due to %s", exception)
+        return web.json_response({'message': 'Failed to list students'}, status=400)
+    students = [models.StudentRecord._make(row) for row in rows[:page_size]]
+    next_cursor = None
+    if len(rows) > page_size:
+        next_cursor = models.PageCursor.encode(students[-1].created_on, students[-1].id)
+    return web.json_response({'students': [student.serialize for student in students],
+                              'next_cursor': next_cursor})
+
+
+async def get_class(request):
+    """
+    GET method to get a class with its leader
+    :param request:
+    :return: class with its leader (None if it has none)
+    """
+    class_id = parse_uuid(request.match_info['class_id'])
+    try:
+        rows = await fetch(request, CLASS_VIEW, class_id=class_id) if class_id else []
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to get class %s due to %s", class_id, exception)
+        return web.json_response({'message': 'Failed to get class'}, status=400)
+    if not rows:
+        return web.json_response({'message': 'Class not found'}, status=404)
+    class_fields = len(models.StudentClassRecord._fields)
+    course = models.StudentClassRecord._make(rows[0][:class_fields]).serialize
+    leader = models.StudentRecord._make(rows[0][class_fields:])
+    course['leader'] = leader.serialize if leader.id else None
+    return web.json_response(course)
+
+
+async def list_roster(request):
+    """
+    GET method to list the students of a class
+    :param request:
+    :return: students of the class, by creation time
+    """
+    class_id = parse_uuid(request.match_info['class_id'])
+    if class_id is None:
+        return web.json_response({'message': 'Class not found'}, status=404)
+    try:
+        rows = await fetch(request, ROSTER, class_id=class_id)
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to list the students of class %s due to %s", class_id, exception)
+        return web.json_response({'message': 'Failed to list students'}, status=400)
+    return web.json_response({'students': [models.StudentRecord._make(row).serialize
+                                           for row in rows]})
+
+
+async def _init_connection(connection):
+    """
+    uuids are exchanged as strings, like the UUID columns of models.py
+    :param connection: new asyncpg connection of the pool
+    :return:
+    """
+    await connection.set_type_codec('uuid', encoder=str, decoder=str,
+                                    schema='pg_catalog', format='text')
+
+
+def get_db_url():
+    """
+    :return: asyncpg dsn of the database the Flask app uses, unless
+             ASYNC_API_DB_URL_ENV_VAR names another one (e.g. a replica)
+    """
+    url = CONFIGURATION.ASYNC_API_DB_URL or models.APP.config['SQLALCHEMY_DATABASE_URI']
+    # asyncpg does not know the SQLAlchemy driver suffix, e.g. postgresql+psycopg2
+    return re.sub(r'^(\w+)\+\w+://', r'\1://', url)
+
+
+async def _open_pool(app):
+    app[POOL_KEY] = await asyncpg.create_pool(
+        get_db_url(), min_size=CONFIGURATION.ASYNC_API_POOL_MIN_SIZE,
+        max_size=CONFIGURATION.ASYNC_API_POOL_MAX_SIZE,
+        command_timeout=CONFIGURATION.ASYNC_API_COMMAND_TIMEOUT_SECONDS,
+        init=_init_connection)
+
+
+async def _close_pool(app):
+    await app[POOL_KEY].close()
+
+
+def create_app():
+    """
+    :return: aiohttp application of the read-only API
+    """
+    app = web.Application()
+    app.router.add_get('/api/students', list_students)
+    app.router.add_get('/api/classes/{class_id}', get_class)
+    app.router.add_get('/api/classes/{class_id}/students', list_roster)
+    app.on_startup.append(_open_pool)
+    app.on_cleanup.append(_close_pool)
+    return app
+
+
+def main():
+    """
+    command line entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=CONFIGURATION.ASYNC_API_HOST)
+    parser.add_argument('--port', type=int, default=CONFIGURATION.ASYNC_API_PORT)
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(create_app(), host=arguments.host, port=arguments.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+batch.py has the operations of the /batch endpoint, each one applied with the
+DAO methods of its form endpoint in the unit of work of the request
+"""
+
+import logging
+from models import StudentDAO
+from models import StudentClassDAO
+import models
+from forms import parse_datetime, parse_version
+
+
+def _batch_add_student(operation):
+    """
+    :param operation: dict with student_name and class_id
+    :return: dict of the result fields
+    """
+    if not operation.get('student_name'):
+        raise ValueError("student_name is required")
+    student = StudentDAO.add_student(class_id=operation.get('class_id'),
+                                     student_name=operation['student_name'])
+    return {'id': student.id}
+
+
+def _batch_update_student(operation):
+    """
+    :param operation: dict with student_id, student_name and version
+    :return: dict of the result fields
+    """
+    if not StudentDAO.update_student(operation.get('student_id'),
+                                     operation.get('student_name'),
+                                     parse_version(operation.get('version'))):
+        raise ValueError("Student {0} does not exist".format(operation.get('student_id')))
+    return {'id': operation['student_id']}
+
+
+def _batch_delete_student(operation):
+    """
+    :param operation: dict with student_id and course_id
+    :return: dict of the result fields
+    """
+    filters = {'id': operation.get('student_id')}
+    if operation.get('course_id'):
+        filters['class_id'] = operation['course_id']
+    if not StudentDAO.delete_student(**filters):
+        raise ValueError("Student {0} does not exist".format(operation.get('student_id')))
+    return {'id': operation['student_id']}
+
+
+def _batch_delete_students(operation):
+    """
+    :param operation: dict with student_ids, class_id, created_after and created_before
+    :return: dict of the result fields
+    """
+    student_ids = operation.get('student_ids')
+    if student_ids is not None and not isinstance(student_ids, list):
+        raise ValueError("student_ids must be a list")
+    deleted, _ = StudentDAO.delete_students(
+        student_ids=student_ids, class_id=operation.get('class_id'),
+        created_after=parse_datetime(operation.get('created_after')),
+        created_before=parse_datetime(operation.get('created_before')))
+    return {'deleted': len(deleted)}
+
+
+def _batch_assign_students(operation):
+    """
+    :param operation: dict with assignments, student id -> class id
+    :return: dict of the result fields
+    """
+    assignments = operation.get('assignments')
+    if not isinstance(assignments, dict):
+        raise ValueError("assignments must map student ids to class ids")
+    failed = [student_id for student_id, success in
+              StudentDAO.assign_classes(assignments).items() if not success]
+    if failed:
+        raise ValueError("Failed to assign class to {0}".format(', '.join(failed)))
+    return {'assigned': len(assignments)}
+
+
+def _batch_add_class(operation):
+    """
+    :param operation: dict with class_name
+    :return: dict of the result fields
+    """
+    classes = StudentClassDAO.add_class(operation.get('class_name'))
+    if classes is None:
+        raise ValueError("class_name is required")
+    return {'id': classes.id}
+
+
+def _batch_update_class_details(operation):
+    """
+    :param operation: dict with class_id, class_name, class_leader_id and version
+    :return: dict of the result fields
+    """
+    if not StudentClassDAO.update_class_details(
+            class_id=operation.get('class_id'), class_name=operation.get('class_name'),
+            class_leader_id=operation.get('class_leader_id'),
+            expected_version=parse_version(operation.get('version'))):
+        raise ValueError("Class {0} does not exist".format(operation.get('class_id')))
+    return {'id': operation['class_id']}
+
+
+# op -> (XSRF token message of its form endpoint, function applying it)
+BATCH_OPERATIONS = {
+    'add_student': (StudentDAO.XSRF_TOKEN_MESSAGE, _batch_add_student),
+    'update_student': (StudentDAO.XSRF_TOKEN_MESSAGE, _batch_update_student),
+    'delete_student': (StudentDAO.XSRF_TOKEN_MESSAGE, _batch_delete_student),
+    'delete_students': (StudentDAO.XSRF_TOKEN_MESSAGE, _batch_delete_students),
+    'assign_students': (StudentDAO.XSRF_TOKEN_MESSAGE, _batch_assign_students),
+    'add_class': (StudentClassDAO.XSRF_TOKEN_MESSAGE, _batch_add_class),
+    'update_class_details': (StudentClassDAO.XSRF_TOKEN_MESSAGE, _batch_update_class_details),
+}
+
+
+def apply_batch_operation(operation):
+    """
+    Applies one operation of a /batch request with the DAO methods used by
+    the matching form endpoint
+    :param operation: dict with op and the fields of the form endpoint
+    :return: dict describing the result of the operation
+    :raises ValueError: if the operation is incomplete or its target does not exist
+    :raises models.VersionConflict: if an update was sent with an outdated version
+    """
+    result = {'op': operation['op']}
+    result.update(BATCH_OPERATIONS[operation['op']][1](operation))
+    return result
+
+
+def batch_failure(index, exception):
+    """
+    :param index: index of the operation which failed
+    :param exception: exception it raised, the batch is rolled back
+    :return: response message with the index of the operation along with status code
+    """
+    if isinstance(exception, models.VersionConflict):
+        logging.warning("Batch rolled back, operation %s failed: %s", index, exception)
+        return ({'message': str(exception), 'index': index}, 409)
+    if isinstance(exception, ValueError):
+        logging.warning("Batch rolled back, operation %s failed: %s", index, exception)
+        return ({'message': str(exception), 'index': index}, 400)
+    logging.error("Batch rolled back, operation %s failed due to %s", index, exception)
+    return ({'message': 'Failed to apply operation', 'index': index}, 400)
@@ -0,0 +1,8 @@
+"""
+benchmarks has the data seeder, the load generator and the micro benchmarks
+of StudentManagement, run them from the repository root e.g.
+
+    python3 -m benchmarks.seed --scale medium
+    python3 -m benchmarks.loadgen --in-process --mix balanced --output before.json
+    python3 -m benchmarks.compare before.json after.json
+"""
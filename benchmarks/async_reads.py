@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+async_reads.py compares the concurrent-request throughput of the read
+routes served by the Flask app and by the asyncio tier (async_api.py):
+student pages, class views and rosters requested by many keep-alive
+clients at once, for every concurrency level
+
+    python3 -m benchmarks.async_reads --sync-target http://localhost:5000 \\
+        --async-target http://localhost:8081 --concurrency 8 32 128 --duration 20
+
+Both servers must run on the same seeded database (benchmarks.seed)
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from benchmarks import report
+from benchmarks.loadgen import HttpClient, run_threads
+
+OPERATIONS = ('students', 'class', 'roster')
+
+
+def sample_class_ids(target):
+    """
+    :param target: base url of one of the servers
+    :return: list of class ids
+    """
+    status, body = HttpClient(target).request('GET', '/api/classes?page_size=500')
+    if status != 200:
+        raise RuntimeError("Could not list the classes of {0}: {1}".format(target, status))
+    return [std_class['id'] for std_class in json.loads(body.decode('utf-8'))['classes']]
+
+
+def request_for(operation, class_ids, generator, page_size):
+    """
+    :param operation: one of OPERATIONS
+    :param class_ids: sampled class ids
+    :param generator: random generator of the client
+    :param page_size: students per page
+    :return: path of the request
+    """
+    if operation == 'students':
+        return '/api/students?page_size={0}'.format(page_size)
+    class_id = generator.choice(class_ids)
+    if operation == 'class':
+        return '/api/classes/{0}'.format(class_id)
+    return '/api/classes/{0}/students'.format(class_id)
+
+
+def run_level(target, class_ids, concurrency, duration, page_size, seed):
+    """
+    :param target: base url of the server
+    :param class_ids: sampled class ids
+    :param concurrency: number of concurrent clients
+    :param duration: seconds the clients send requests
+    :param page_size: students per page
+    :param seed: random seed
+    :return: dict of operation -> summary, and 'all' for every request
+    """
+    samples = {operation: [] for operation in OPERATIONS}
+    errors = {operation: 0 for operation in OPERATIONS}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(index):
+        generator = random.Random(seed + index)
+        http = HttpClient(target)
+        while time.perf_counter() < deadline:
+            operation = generator.choice(OPERATIONS)
+            path = request_for(operation, class_ids, generator, page_size)
+            start = time.perf_counter()
+            try:
+                status, _ = http.request('GET', path)
+                succeeded = status == 200
+            except Exception:  # pylint: disable=broad-except
+                succeeded = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples[operation].append(elapsed)
+                errors[operation] += 0 if succeeded else 1
+
+    elapsed = run_threads([threading.Thread(target=client, args=(index,))
+                           for index in range(concurrency)])
+    summaries = {operation: report.summarize(samples[operation], errors[operation], elapsed)
+                 for operation in OPERATIONS}
+    summaries['all'] = report.summarize([latency for operation in OPERATIONS
+                                         for latency in samples[operation]],
+                                        sum(errors.values()), elapsed)
+    return summaries
+
+
+def main():
+    """
+    command line entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sync-target', required=True, help='base url of the Flask app')
+    parser.add_argument('--async-target', required=True, help='base url of async_api.py')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 128])
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='json file to write the results to')
+    arguments = parser.parse_args()
+
+    class_ids = sample_class_ids(arguments.sync_target)
+    summaries = {}
+    for concurrency in arguments.concurrency:
+        for tier, target in (('sync', arguments.sync_target),
+                             ('async', arguments.async_target)):
+            for operation, summary in run_level(target, class_ids, concurrency,
+                                                arguments.duration, arguments.page_size,
+                                                arguments.seed).items():
+                summaries['{0}_c{1}_{2}'.format(tier, concurrency, operation)] = summary
+    report.print_table(summaries)
+    if arguments.output:
+        report.save(report.build_result('async_reads', {
+            'sync_target': arguments.sync_target, 'async_target': arguments.async_target,
+            'concurrency': arguments.concurrency, 'duration': arguments.duration,
+            'page_size': arguments.page_size, 'seed': arguments.seed}, summaries),
+                    arguments.output)
+
+
+if __name__ == '__main__':
+    main()
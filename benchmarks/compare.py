@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+compare.py prints the difference between two benchmark results saved with
+--output, e.g. before and after a change
+
+    python3 -m benchmarks.compare baseline.json candidate.json
+"""
+
+import argparse
+import collections
+from benchmarks import report
+
+COLUMNS = ('throughput', 'p50_ms', 'p95_ms', 'p99_ms')
+SKIPPED = ('count', 'errors', 'rejected', 'max_ms')
+
+
+def change(before, after):
+    """
+    :param before: baseline value
+    :param after: candidate value
+    :return: relative change formatted as a signed percentage
+    """
+    if before is None or after is None:
+        return 'n/a'
+    if not before:
+        return '+inf%' if after else '+0.0%'
+    return '{0:+.1f}%'.format((after - before) * 100.0 / before)
+
+
+def compare(baseline, candidate):
+    """
+    :param baseline: result dict
+    :param candidate: result dict
+    :return: dict of operation -> ordered dict of column -> 'before -> after (change)'
+    """
+    rows = {}
+    before_results = baseline['results']
+    after_results = candidate['results']
+    for operation in sorted(set(before_results) | set(after_results)):
+        before = before_results.get(operation, {})
+        after = after_results.get(operation, {})
+        # benchmark specific metrics e.g. index sizes come after the common ones
+        columns = COLUMNS + tuple(sorted((set(before) | set(after)) - set(COLUMNS) - set(SKIPPED)))
+        rows[operation] = collections.OrderedDict((column, '{0} -> {1} ({2})'.format(
+            before.get(column), after.get(column), change(before.get(column), after.get(column))))
+                                                  for column in columns)
+    return rows
+
+
+def main():
+    """
+    command line entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    arguments = parser.parse_args()
+    baseline = report.load(arguments.baseline)
+    candidate = report.load(arguments.candidate)
+    if baseline.get('parameters') != candidate.get('parameters'):
+        print('Warning: the runs used different parameters {0} and {1}'.format(
+            baseline.get('parameters'), candidate.get('parameters')))
+    for operation, columns in compare(baseline, candidate).items():
+        print(operation)
+        for column, value in columns.items():
+            print('  {0:<16} {1}'.format(column, value))
+
+
+if __name__ == '__main__':
+    main()
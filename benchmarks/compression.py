@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+compression.py measures the bytes sent for the home page, the largest
+course page, the student list and a stylesheet with every content encoding
+the app supports, the server side latency of the requests and the time the
+body takes to cross a link of the given bandwidth
+
+    python3 -m benchmarks.compression --repeat 20 --mbps 10 --output compression.json
+
+Run benchmarks.seed first
+"""
+
+import argparse
+import re
+import time
+from benchmarks import report
+
+# brotli is only measured when the brotli package is installed
+ENCODINGS = ('identity', 'gzip', 'br')
+
+
+def measure(client, url, encoding, repeat, mbps):
+    """
+    :param client: flask test client
+    :param url: url requested
+    :param encoding: Accept-Encoding sent
+    :param repeat: number of requests
+    :param mbps: link bandwidth in megabits per second
+    :return: summary with the bytes of the body and their transfer time in ms
+    """
+    latencies = []
+    body_bytes = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        request_start = time.perf_counter()
+        response = client.get(url, headers={'Accept-Encoding': encoding})
+        body_bytes = len(response.get_data())
+        latencies.append(time.perf_counter() - request_start)
+        response.close()
+    summary = report.summarize(latencies, 0, time.perf_counter() - start)
+    summary['bytes'] = body_bytes
+    summary['encoding'] = response.headers.get('Content-Encoding', 'identity')
+    summary['transfer_ms'] = round(body_bytes * 8 / (mbps * 1000), 3)
+    return summary
+
+
+def run(handler, repeat, mbps):
+    """
+    :param handler: handler module
+    :param repeat: requests per url and encoding
+    :param mbps: link bandwidth in megabits per second
+    :return: dict of '<page>_<encoding>' -> summary
+    """
+    client = handler.app.test_client()
+    home = client.get('/').get_data(as_text=True)
+    with handler.app.app_context():
+        models = handler.models
+        largest_class = models.DB.session.query(models.Student.class_id).filter(
+            models.Student.class_id.isnot(None)).group_by(models.Student.class_id).order_by(
+                models.DB.func.count().desc()).limit(1).scalar()
+        models.DB.session.remove()
+    urls = {'home': '/', 'students': '/api/students'}
+    if largest_class is not None:
+        urls['course'] = '/showCourse/{0}'.format(largest_class)
+    stylesheet = re.search(r'href="(/static/[^"]+\.css[^"]*)"', home)
+    if stylesheet:
+        urls['css'] = stylesheet.group(1)
+    summaries = {}
+    for name, url in urls.items():
+        for encoding in ENCODINGS:
+            summary = measure(client, url, encoding, repeat, mbps)
+            if summary['encoding'] == encoding:
+                summaries['{0}_{1}'.format(name, encoding)] = summary
+    return summaries
+
+
+def main():
+    """
+    command line entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20, help='requests per url and encoding')
+    parser.add_argument('--mbps', type=float, default=10, help='link bandwidth in Mbit/s')
+    parser.add_argument('--output', help='json file to write the results to')
+    arguments = parser.parse_args()
+
+    import handler  # pylint: disable=import-outside-toplevel
+
+    summaries = run(handler, arguments.repeat, arguments.mbps)
+    report.print_table(summaries, ('bytes', 'transfer_ms', 'p50_ms', 'p99_ms'))
+    if arguments.output:
+        report.save(report.build_result('compression', {
+            'repeat': arguments.repeat, 'mbps': arguments.mbps}, summaries), arguments.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+ids.py compares random (uuid4) and time ordered (uuid7) primary keys: it
+inserts the same rows into two copies of the student table, one per id
+generator, in small committed batches like the app does, and reports the
+insert throughput and the size of the indexes afterwards
+
+    python3 -m benchmarks.ids --rows 200000 --output ids.json
+"""
+
+import argparse
+import datetime
+import time
+import uuid
+from sqlalchemy import text
+from benchmarks import report
+
+GENERATORS = ('uuid4', 'uuid7')
+
+
+def insert_rows(models, table, generate_id, rows, batch_size, class_ids):
+    """
+    :param models: models module
+    :param table: name of the scratch table
+    :param generate_id: function returning a new id
+    :param rows: number of rows to insert
+    :param batch_size: rows per committed batch
+    :param class_ids: ids the class_id column is filled from
+    :return: tuple of batch latencies and elapsed seconds
+    """
+    session = models.DB.session
+    statement = text("INSERT INTO {0} (id, name, class_id, created_on) "
+                     "VALUES (:id, :name, :class_id, :created_on)".format(table))
+    latencies = []
+    start = time.perf_counter()
+    for offset in range(0, rows, batch_size):
+        batch_start = time.perf_counter()
+        session.execute(statement, [{
+            'id': generate_id(), 'name': 'Student {0}'.format(index),
+            'class_id': class_ids[index % len(class_ids)], 'created_on': datetime.datetime.now()}
+                                    for index in range(offset, min(rows, offset + batch_size))])
+        session.commit()
+        latencies.append(time.perf_counter() - batch_start)
+    return latencies, time.perf_counter() - start
+
+
+def index_sizes(models, table):
+    """
+    :param models: models module
+    :param table: name of the scratch table
+    :return: dict of index name -> size in bytes
+    """
+    return dict(models.DB.session.execute(text(
+        "SELECT indexrelid::regclass::text, pg_relation_size(indexrelid) "
+        "FROM pg_index WHERE indrelid = CAST(:table AS regclass)"), {'table': table}).fetchall())
+
+
+def run(models, rows, batch_size):
+    """
+    :param models: models module
+    :param rows: rows inserted per generator
+    :param batch_size: rows per committed batch
+    :return: dict of generator -> summary with index sizes
+    """
+    session = models.DB.session
+    class_ids = [models.uuid7() for _ in range(100)]
+    generators = {'uuid4': lambda: str(uuid.uuid4()), 'uuid7': models.uuid7}
+    summaries = {}
+    for name in GENERATORS:
+        table = 'bench_student_{0}'.format(name)
+        session.execute(text("DROP TABLE IF EXISTS {0}".format(table)))
+        # same columns and indexes as student, without its foreign keys
+        session.execute(text("CREATE TABLE {0} (LIKE student INCLUDING DEFAULTS "
+                             "INCLUDING INDEXES)".format(table)))
+        session.commit()
+        try:
+            latencies, elapsed = insert_rows(models, table, generators[name], rows, batch_size,
+                                             class_ids)
+            summary = report.summarize(latencies, 0, elapsed)
+            summary['rows_per_second'] = round(rows / elapsed, 1)
+            sizes = index_sizes(models, table)
+            summary['index_bytes'] = sum(sizes.values())
+            summary['pkey_bytes'] = sum(size for index, size in sizes.items()
+                                        if index.endswith('_pkey'))
+            summaries[name] = summary
+        finally:
+            session.rollback()
+            session.execute(text("DROP TABLE IF EXISTS {0}".format(table)))
+            session.commit()
+    return summaries
+
+
+def main():
+    """
+    command line entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--output', help='json file to write the results to')
+    arguments = parser.parse_args()
+
+    import models  # pylint: disable=import-outside-toplevel
+
+    with models.APP.app_context():
+        summaries = run(models, arguments.rows, arguments.batch_size)
+    report.print_table(summaries, ('rows_per_second', 'p50_ms', 'p99_ms', 'pkey_bytes',
+                                   'index_bytes'))
+    if arguments.output:
+        report.save(report.build_result('ids', {'rows': arguments.rows,
+                                                'batch_size': arguments.batch_size},
+                                        summaries), arguments.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+"""
+loadgen.py drives the routes of StudentManagement with a weighted mix of
+operations from concurrent clients and reports throughput and p50/p95/p99
+latency per operation
+
+    python3 -m benchmarks.loadgen --in-process --mix balanced --duration 30
+    python3 -m benchmarks.loadgen --target http://localhost:5000 --concurrency 16
+
+--in-process calls the app through the flask test client, no server and no
+network are needed, only the database the app is configured with. Every
+client sends from an address of its own and the admission control of the
+write endpoints is off unless --admission-control is given; for --target
+start the server with STUDENT_MANAGEMENT_ADMISSION_CONTROL=0 to measure the
+same way. Requests rejected with 429 or 503 are counted apart from the
+errors and left out of the latencies
+"""
+
+import argparse
+import http.client
+import itertools
+import random
+import threading
+import time
+import urllib.parse
+from benchmarks import report
+
+MIXES = {
+    'read-heavy': {'home': 30, 'course': 50, 'add_student': 5, 'assign_students': 5,
+                   'update_student': 7, 'delete_student': 3},
+    'balanced': {'home': 25, 'course': 35, 'add_student': 10, 'assign_students': 10,
+                 'update_student': 12, 'delete_student': 8},
+    'write-heavy': {'home': 10, 'course': 20, 'add_student': 25, 'assign_students': 15,
+                    'update_student': 20, 'delete_student': 10},
+}
+SAMPLE_PAGES = 20
+# answers of the admission control, counted as rejected instead of failed
+REJECTED_STATUSES = (429, 503)
+
+
+class HttpClient():
+    """
+    Keep-alive client of a running server, one per worker thread
+    """
+
+    def __init__(self, target):
+        """
+        :param target: base url e.g. http://localhost:5000
+        """
+        parsed = urllib.parse.urlparse(target)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+
+    def request(self, method, path, form=None):
+        """
+        :param method: http method
+        :param path: path with query string
+        :param form: dict sent as form body
+        :return: tuple of status code and body bytes
+        """
+        body = urllib.parse.urlencode(form) if form is not None else None
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if form is not None else {}
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            return response.status, response.read()
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            raise
+
+
+class InProcessClient():
+    """
+    Client calling the app through the flask test client
+    """
+
+    def __init__(self, app, remote_addr='127.0.0.1'):
+        """
+        :param app: flask app
+        :param remote_addr: address the requests come from, the key of the rate limits
+        """
+        self.client = app.test_client()
+        self.remote_addr = remote_addr
+
+    def request(self, method, path, form=None):
+        """
+        :param method: http method
+        :param path: path with query string
+        :param form: dict sent as form body
+        :return: tuple of status code and body bytes
+        """
+        response = self.client.open(path, method=method, data=form,
+                                    environ_base={'REMOTE_ADDR': self.remote_addr})
+        return response.status_code, response.data
+
+
+class Workload():
+    """
+    Shared state of a run: sampled ids, xsrf tokens, latency samples and the
+    counts of failed and of rejected requests
+    """
+
+    def __init__(self, student_ids, unassigned_ids, class_ids, tokens, random_seed):
+        self.student_ids = student_ids
+        self.unassigned_ids = unassigned_ids
+        self.class_ids = class_ids
+        self.student_token, self.class_token = tokens
+        self.random_seed = random_seed
+        self.samples = {}
+        self.errors = {}
+        self.rejected = {}
+        self.lock = threading.Lock()
+
+    def record(self, operation, elapsed, status):
+        """
+        :param operation: operation name
+        :param elapsed: latency in seconds
+        :param status: http status code, None if the request failed without one
+        :return:
+        """
+        with self.lock:
+            if status in REJECTED_STATUSES:
+                # answered without doing the work, its latency would flatter the percentiles
+                self.rejected[operation] = self.rejected.get(operation, 0) + 1
+                return
+            self.samples.setdefault(operation, []).append(elapsed)
+            if status is None or status >= 400:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def pop_student(self, generator):
+        """
+        :param generator: random generator of the worker
+        :return: a sampled student id removed from the pool, None if empty
+        """
+        with self.lock:
+            if not self.student_ids:
+                return None
+            index = generator.randrange(len(self.student_ids))
+            self.student_ids[index], self.student_ids[-1] = \
+                self.student_ids[-1], self.student_ids[index]
+            return self.student_ids.pop()
+
+    # one return per operation of MIXES
+    def request_for(self, operation, generator):  # pylint: disable=too-many-return-statements
+        """
+        :param operation: operation name
+        :param generator: random generator of the worker
+        :return: (method, path, form) of the operation or None if not possible
+        """
+        if operation == 'home':
+            return 'GET', '/', None
+        if operation == 'course' and self.class_ids:
+            return 'GET', '/showCourse/{0}'.format(generator.choice(self.class_ids)), None
+        if operation == 'add_student':
+            form = {'student_name': 'Load {0}'.format(generator.randrange(10 ** 9)),
+                    'xsrf_token': self.student_token}
+            if self.class_ids and generator.random() < 0.9:
+                form['class_id'] = generator.choice(self.class_ids)
+            return 'POST', '/add_student', form
+        if operation == 'assign_students' and self.class_ids:
+            pool = self.unassigned_ids or self.student_ids
+            if pool:
+                return 'POST', '/assign_students', {
+                    generator.choice(pool): generator.choice(self.class_ids) for _ in range(10)}
+        if operation == 'update_student' and self.student_ids:
+            return 'PUT', '/update_student', {
+                'student_id': generator.choice(self.student_ids),
+                'student_name': 'Renamed {0}'.format(generator.randrange(10 ** 9)),
+                'xsrf_token': self.student_token}
+        if operation == 'delete_student':
+            student_id = self.pop_student(generator)
+            if student_id:
+                return 'POST', '/delete_student', {'student_id': student_id,
+                                                   'xsrf_token': self.student_token}
+        return None
+
+
+def sample_ids(client, path, key, pages):
+    """
+    Collects ids through the paginated json apis
+
+    :param client: HttpClient or InProcessClient
+    :param path: api path
+    :param key: key of the rows in the response
+    :param pages: maximum number of pages
+    :return: list of ids
+    """
+    import json  # pylint: disable=import-outside-toplevel
+
+    ids = []
+    cursor = None
+    for _ in range(pages):
+        query = {'page_size': 500}
+        if cursor:
+            query['cursor'] = cursor
+        status, body = client.request('GET', '{0}?{1}'.format(path, urllib.parse.urlencode(query)))
+        if status != 200:
+            break
+        page = json.loads(body.decode('utf-8'))
+        ids.extend(row['id'] for row in page[key])
+        cursor = page.get('next_cursor')
+        if not cursor:
+            break
+    return ids
+
+
+def worker(workload, client, mix, deadline, index):
+    """
+    Runs operations drawn from mix until deadline
+
+    :param workload: Workload
+    :param client: HttpClient or InProcessClient
+    :param mix: dict of operation -> weight
+    :param deadline: time.perf_counter() value to stop at
+    :param index: worker number, seeds its generator
+    :return:
+    """
+    generator = random.Random(workload.random_seed + index)
+    operations = sorted(mix)
+    weights = [mix[operation] for operation in operations]
+    while time.perf_counter() < deadline:
+        operation = generator.choices(operations, weights)[0]
+        planned = workload.request_for(operation, generator)
+        if planned is None:
+            continue
+        method, path, form = planned
+        start = time.perf_counter()
+        try:
+            status, _ = client.request(method, path, form)
+        except (http.client.HTTPException, OSError):
+            status = None
+        workload.record(operation, time.perf_counter() - start, status)
+
+
+def sample_workload(client):
+    """
+    :param client: HttpClient or InProcessClient
+    :return: (student ids, unassigned student ids, class ids, xsrf tokens) of a run
+    """
+    import models  # pylint: disable=import-outside-toplevel
+
+    return (sample_ids(client, '/api/students', 'students', SAMPLE_PAGES),
+            sample_ids(client, '/api/students/unassigned', 'students', 2),
+            sample_ids(client, '/api/classes', 'classes', SAMPLE_PAGES),
+            (str(models.XSRFToken.create_xsrf_token(models.StudentDAO.XSRF_TOKEN_MESSAGE)),
+             str(models.XSRFToken.create_xsrf_token(models.StudentClassDAO.XSRF_TOKEN_MESSAGE))))
+
+
+def run_threads(threads):
+    """
+    Starts the client threads of a run and waits for all of them
+
+    :param threads: list of threads not started yet
+    :return: elapsed seconds
+    """
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def summarize_workload(workload, elapsed):
+    """
+    :param workload: Workload of the measured phase
+    :param elapsed: seconds the phase ran
+    :return: dict of operation -> summary, with an 'all' entry
+    """
+    summaries = {operation: report.summarize(
+        workload.samples.get(operation, []), workload.errors.get(operation, 0), elapsed,
+        workload.rejected.get(operation, 0))
+                 for operation in set(workload.samples) | set(workload.rejected)}
+    summaries['all'] = report.summarize(
+        [sample for samples in workload.samples.values() for sample in samples],
+        sum(workload.errors.values()), elapsed, sum(workload.rejected.values()))
+    return summaries
+
+
+def run(client_factory, mix_name, concurrency, duration, warmup, random_seed):
+    """
+    :param client_factory: function returning a new client
+    :param mix_name: key of MIXES
+    :param concurrency: number of concurrent clients
+    :param duration: measured seconds
+    :param warmup: seconds run before measuring
+    :param random_seed: seed of the generators
+    :return: dict of operation -> summary, with an 'all' entry
+    """
+    student_ids, unassigned_ids, class_ids, tokens = sample_workload(client_factory())
+    for phase_duration, measured in ((warmup, False), (duration, True)):
+        if phase_duration <= 0:
+            continue
+        workload = Workload(list(student_ids), unassigned_ids, class_ids, tokens, random_seed)
+        deadline = time.perf_counter() + phase_duration
+        elapsed = run_threads([threading.Thread(target=worker, args=(
+            workload, client_factory(), MIXES[mix_name], deadline, index))
+                               for index in range(concurrency)])
+        student_ids = workload.student_ids
+        if measured:
+            return summarize_workload(workload, elapsed)
+    return {}
+
+
+def main():
+    """
+    command line entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--target', help='base url of a running server')
+    target.add_argument('--in-process', action='store_true',
+                        help='call the app through the flask test client')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='balanced')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--admission-control', action='store_true',
+                        help='keep the admission control of the app on (--in-process)')
+    parser.add_argument('--output', help='json file to write the results to')
+    arguments = parser.parse_args()
+
+    if arguments.in_process:
+        import configuration  # pylint: disable=import-outside-toplevel
+        configuration.ADMISSION_CONTROL_ENABLED = arguments.admission_control
+        import handler  # pylint: disable=import-outside-toplevel
+        client_numbers = itertools.count(1)
+
+        def client_factory():
+            number = next(client_numbers)
+            return InProcessClient(handler.app, '10.0.{0}.{1}'.format(number // 256, number % 256))
+    else:
+        def client_factory():
+            return HttpClient(arguments.target)
+
+    summaries = run(client_factory, arguments.mix, arguments.concurrency, arguments.duration,
+                    arguments.warmup, arguments.seed)
+    report.print_table(summaries)
+    if arguments.output:
+        report.save(report.build_result('loadgen', {
+            'target': arguments.target or 'in-process', 'mix': arguments.mix,
+            'concurrency': arguments.concurrency, 'duration': arguments.duration,
+            'seed': arguments.seed, 'admission_control': arguments.admission_control},
+                                        summaries), arguments.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+projections.py compares the ORM list methods of StudentDAO, which return
+session tracked Student objects, with their read-only StudentRecord
+variants: latency of every call and peak memory allocated while building
+the result (tracemalloc)
+
+    python3 -m benchmarks.projections --repeat 5 --output projections.json
+
+Run benchmarks.seed first
+"""
+
+import argparse
+import time
+import tracemalloc
+from benchmarks import report
+
+# name -> (ORM method, projection method) of StudentDAO, the class ones take a class id
+METHODS = (
+    ('all', 'get_all_students', 'get_all_student_records'),
+    ('class', 'get_students_class_id', 'get_student_records_by_class_id'),
+    ('unassigned', 'get_all_unassigned_students', 'get_unassigned_student_records'),
+)
+
+
+def measure(models, method, arguments, repeat):
+    """
+    :param models: models module
+    :param method: StudentDAO method
+    :param arguments: positional arguments of method
+    :param repeat: number of calls
+    :return: summary with the rows returned and the peak memory in bytes of one call
+    """
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        # a fresh session every call, like every request gets
+        models.DB.session.remove()
+        call_start = time.perf_counter()
+        method(*arguments)
+        latencies.append(time.perf_counter() - call_start)
+    summary = report.summarize(latencies, 0, time.perf_counter() - start)
+    # tracing slows allocations down a lot, so memory is measured by a separate call
+    models.DB.session.remove()
+    tracemalloc.start()
+    summary['rows'] = len(method(*arguments))
+    summary['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    models.DB.session.remove()
+    return summary
+
+
+def run(models, repeat):
+    """
+    :param models: models module
+    :param repeat: calls per method
+    :return: dict of '<name>_orm' / '<name>_records' -> summary
+    """
+    largest_class = models.DB.session.query(models.Student.class_id).filter(
+        models.Student.class_id.isnot(None)).group_by(models.Student.class_id).order_by(
+            models.DB.func.count().desc()).limit(1).scalar()
+    summaries = {}
+    for name, orm_method, records_method in METHODS:
+        arguments = (largest_class,) if name == 'class' else ()
+        for kind, method in (('orm', orm_method), ('records', records_method)):
+            summaries['{0}_{1}'.format(name, kind)] = measure(
+                models, getattr(models.StudentDAO, method), arguments, repeat)
+    return summaries
+
+
+def main():
+    """
+    command line entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='calls per method')
+    parser.add_argument('--output', help='json file to write the results to')
+    arguments = parser.parse_args()
+
+    import models  # pylint: disable=import-outside-toplevel
+
+    with models.APP.app_context():
+        summaries = run(models, arguments.repeat)
+    report.print_table(summaries, ('rows', 'p50_ms', 'p99_ms', 'peak_bytes'))
+    if arguments.output:
+        report.save(report.build_result('projections', {'repeat': arguments.repeat},
+                                        summaries), arguments.output)
+
+
+if __name__ == '__main__':
+    main()
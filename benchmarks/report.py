@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+report.py has the helpers shared by the benchmarks to summarize latency
+samples and to save, load and print the results
+"""
+
+import json
+import platform
+import time
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile
+
+    :param sorted_values: ascending list of values
+    :param fraction: e.g. 0.95
+    :return: value at fraction, None for an empty list
+    """
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed_seconds, rejected=0):
+    """
+    :param latencies: list of latencies in seconds
+    :param errors: number of failed operations
+    :param elapsed_seconds: wall clock duration of the run
+    :param rejected: number of operations rejected by admission control (429/503),
+                     not part of latencies
+    :return: dict with count, errors, rejected, throughput and p50/p95/p99/max in ms
+    """
+    ordered = sorted(latencies)
+
+    def in_ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        'count': len(ordered),
+        'errors': errors,
+        'rejected': rejected,
+        'throughput': round(len(ordered) / elapsed_seconds, 2) if elapsed_seconds else 0,
+        'p50_ms': in_ms(percentile(ordered, 0.50)),
+        'p95_ms': in_ms(percentile(ordered, 0.95)),
+        'p99_ms': in_ms(percentile(ordered, 0.99)),
+        'max_ms': in_ms(ordered[-1] if ordered else None),
+    }
+
+
+def build_result(name, parameters, summaries):
+    """
+    :param name: benchmark name
+    :param parameters: dict of the parameters of the run
+    :param summaries: dict of operation -> summarize() result
+    :return: result dict ready to be saved
+    """
+    return {
+        'benchmark': name,
+        'parameters': parameters,
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'results': summaries,
+    }
+
+
+def save(result, path):
+    """
+    :param result: result dict
+    :param path: output json file
+    :return:
+    """
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(result, output, indent=2, sort_keys=True)
+
+
+def load(path):
+    """
+    :param path: json file written by save
+    :return: result dict
+    """
+    with open(path, encoding='utf-8') as result_file:
+        return json.load(result_file)
+
+
+def print_table(summaries, columns=('count', 'errors', 'rejected', 'throughput', 'p50_ms',
+                                    'p95_ms', 'p99_ms', 'max_ms')):
+    """
+    Prints one row per operation
+
+    :param summaries: dict of operation -> dict of metrics
+    :param columns: metrics to print
+    :return:
+    """
+    width = max([len('operation')] + [len(name) for name in summaries])
+    print('  '.join(['operation'.ljust(width)] + [column.rjust(10) for column in columns]))
+    for name in sorted(summaries):
+        print('  '.join([name.ljust(width)] + [
+            str(summaries[name].get(column, '')).rjust(10) for column in columns]))
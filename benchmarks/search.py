@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+search.py measures the latency of StudentDAO.search_students on the seeded
+data with prefix queries and queries containing a typo
+
+    python3 -m benchmarks.search --queries 500 --output search.json
+
+Run benchmarks.seed first, the queries are built from its names
+"""
+
+import argparse
+import random
+import time
+from benchmarks import report
+from benchmarks.seed import FIRST_NAMES, LAST_NAMES
+
+
+def make_queries(generator, count):
+    """
+    :param generator: random generator
+    :param count: number of queries per kind
+    :return: dict of kind -> list of queries
+    """
+    queries = {'prefix': [], 'typo': [], 'last_name': []}
+    for _ in range(count):
+        first, last = generator.choice(FIRST_NAMES), generator.choice(LAST_NAMES)
+        full = '{0} {1}'.format(first, last).lower()
+        queries['prefix'].append(full[:generator.randint(2, len(full))])
+        position = generator.randrange(len(full))
+        queries['typo'].append(full[:position] + full[position + 1:])
+        queries['last_name'].append(last.lower())
+    return queries
+
+
+def run(models, queries, limit):
+    """
+    :param models: models module
+    :param queries: dict of kind -> list of queries
+    :param limit: results per query
+    :return: dict of kind -> summary
+    """
+    summaries = {}
+    models.StudentDAO.search_students('warm up', limit=limit)
+    for kind, kind_queries in queries.items():
+        latencies = []
+        start = time.perf_counter()
+        for query in kind_queries:
+            query_start = time.perf_counter()
+            models.StudentDAO.search_students(query, limit=limit)
+            latencies.append(time.perf_counter() - query_start)
+        summaries[kind] = report.summarize(latencies, 0, time.perf_counter() - start)
+    return summaries
+
+
+def main():
+    """
+    command line entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', type=int, default=500, help='queries per kind')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='json file to write the results to')
+    arguments = parser.parse_args()
+
+    import models  # pylint: disable=import-outside-toplevel
+
+    with models.APP.app_context():
+        if models.DB.engine.dialect.name != 'postgresql':
+            backend = 'in-process'
+        else:
+            backend = 'trigram' if models.trigram_search_available() else 'prefix'
+        summaries = run(models, make_queries(random.Random(arguments.seed), arguments.queries),
+                        arguments.limit)
+    print('search backend: {0}'.format(backend))
+    report.print_table(summaries)
+    if arguments.output:
+        report.save(report.build_result('search', {
+            'queries': arguments.queries, 'limit': arguments.limit, 'seed': arguments.seed,
+            'backend': backend}, summaries), arguments.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+seed.py fills student and studentclass with generated data at a given scale
+
+    python3 -m benchmarks.seed --scale small|medium|large [--truncate]
+    python3 -m benchmarks.seed --students 250000 --classes 1000
+
+The db url is the one of the app, set STUDENT_MANAGEMENT_DB_URL to point it
+at a local or throwaway PostgreSQL
+"""
+
+import argparse
+import csv
+import datetime
+import io
+import random
+import time
+
+SCALES = {
+    'small': (10000, 10),
+    'medium': (100000, 500),
+    'large': (1000000, 5000),
+}
+BATCH_SIZE = 50000
+FIRST_NAMES = ('Aarav', 'Alice', 'Amelia', 'Ana', 'Arjun', 'Ben', 'Carlos', 'Chloe', 'Daniel',
+               'Diya', 'Elena', 'Emma', 'Ethan', 'Fatima', 'Grace', 'Hana', 'Isaac', 'Ivan',
+               'Jack', 'John', 'Karan', 'Leila', 'Liam', 'Lucas', 'Maria', 'Mateo', 'Mei',
+               'Mohammed', 'Noah', 'Olivia', 'Priya', 'Rahul', 'Sara', 'Sofia', 'Tom', 'Yuki')
+LAST_NAMES = ('Ahmed', 'Brown', 'Chen', 'Costa', 'Davis', 'Dubois', 'Garcia', 'Gupta', 'Hansen',
+              'Ivanov', 'Johnson', 'Kim', 'Kowalski', 'Lee', 'Martin', 'Mehta', 'Miller',
+              'Moreau', 'Nguyen', 'Novak', 'Okafor', 'Patel', 'Rossi', 'Sato', 'Schmidt',
+              'Sharma', 'Silva', 'Singh', 'Smith', 'Tanaka', 'Taylor', 'Wang', 'Weber', 'Wilson')
+
+
+def copy_classes(models, classes):
+    """
+    :param models: models module
+    :param classes: list of (id, name, created_on)
+    :return:
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(classes)
+    buffer.seek(0)
+    cursor = models.DB.session.connection().connection.cursor()
+    cursor.copy_expert("COPY studentclass (id, name, created_on) FROM STDIN WITH (FORMAT csv)",
+                       buffer)
+    cursor.close()
+
+
+def student_row(models, generator, class_ids, unassigned_ratio, created_on):
+    """
+    :param models: models module
+    :param generator: random generator of the seed
+    :param class_ids: ids of the seeded classes
+    :param unassigned_ratio: share of students without a class
+    :param created_on: creation datetime of the student
+    :return: (id, name, class_id, created_on) of a generated student
+    """
+    class_id = None
+    if class_ids and generator.random() >= unassigned_ratio:
+        class_id = generator.choice(class_ids)
+    return (models.uuid7(created_on), '{0} {1}'.format(
+        generator.choice(FIRST_NAMES), generator.choice(LAST_NAMES)), class_id, created_on)
+
+
+def seed(models, students, classes, unassigned_ratio, truncate, random_seed):
+    """
+    Generates classes, students (a share of them unassigned) and one
+    leader per class
+
+    :param models: models module
+    :param students: number of students
+    :param classes: number of classes
+    :param unassigned_ratio: share of students without a class
+    :param truncate: empty the tables first
+    :param random_seed: seed of the generator, same seed same data
+    :return:
+    """
+    generator = random.Random(random_seed)
+    session = models.DB.session
+    start = time.perf_counter()
+    if truncate:
+        session.execute("TRUNCATE student, studentclass, class_statistics, "
+                        "class_statistics_delta")
+
+    created_on = datetime.datetime.now() - datetime.timedelta(days=365)
+    class_ids = [models.uuid7(created_on) for _ in range(classes)]
+    copy_classes(models, [(class_id, 'Class {0}'.format(index), created_on)
+                          for index, class_id in enumerate(class_ids)])
+    session.commit()
+
+    step = datetime.timedelta(seconds=365 * 24 * 3600 / max(students, 1))
+    for offset in range(0, students, BATCH_SIZE):
+        models.StudentDAO.copy_students([
+            student_row(models, generator, class_ids, unassigned_ratio, created_on + step * index)
+            for index in range(offset, min(students, offset + BATCH_SIZE))])
+        session.commit()
+        print('{0} students'.format(min(students, offset + BATCH_SIZE)))
+
+    session.execute(
+        "UPDATE studentclass SET class_leader = leaders.id FROM ("
+        "SELECT DISTINCT ON (class_id) class_id, id FROM student "
+        "WHERE class_id IS NOT NULL ORDER BY class_id, created_on) AS leaders "
+        "WHERE studentclass.id = leaders.class_id")
+    session.commit()
+    session.execute("ANALYZE student")
+    session.execute("ANALYZE studentclass")
+    session.commit()
+    models.ClassStatisticsDAO.rebuild()
+    models.CLASS_CACHE.invalidate()
+    print('Seeded {0} students and {1} classes in {2:.1f}s'.format(
+        students, classes, time.perf_counter() - start))
+
+
+def main():
+    """
+    command line entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--students', type=int, help='overrides the students of --scale')
+    parser.add_argument('--classes', type=int, help='overrides the classes of --scale')
+    parser.add_argument('--unassigned-ratio', type=float, default=0.1)
+    parser.add_argument('--truncate', action='store_true', help='empty the tables first')
+    parser.add_argument('--seed', type=int, default=42)
+    arguments = parser.parse_args()
+
+    import models  # pylint: disable=import-outside-toplevel
+
+    students, classes = SCALES[arguments.scale]
+    with models.APP.app_context():
+        models.DB.create_all(bind=None)
+        seed(models, arguments.students if arguments.students is not None else students,
+             arguments.classes if arguments.classes is not None else classes,
+             arguments.unassigned_ratio, arguments.truncate, arguments.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""
+cache.py has a bounded in-process LRU cache with TTL and hit/miss counters,
+and an optional file based backend which shares invalidations between
+the worker processes of the app
+"""
+
+import fcntl
+import os
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class FileInvalidationBackend():
+    """
+    Keeps one generation counter per namespace in a file of a directory
+    shared by every worker process, bumping it invalidates the namespace
+    for all of them
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: directory holding the generation files
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, namespace):
+        """
+        :param namespace:
+        :return: path of the generation file of namespace
+        """
+        return os.path.join(self.directory, '{0}.generation'.format(namespace))
+
+    def get_generation(self, namespace):
+        """
+        :param namespace:
+        :return: current generation of namespace
+        """
+        try:
+            with open(self._path(namespace), 'rb') as generation_file:
+                return int(generation_file.read() or 0)
+        except (IOError, ValueError):
+            return 0
+
+    def bump(self, namespace):
+        """
+        Increments the generation of namespace under an exclusive file lock
+        :param namespace:
+        :return: new generation
+        """
+        file_descriptor = os.open(self._path(namespace), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(file_descriptor, fcntl.LOCK_EX)
+            try:
+                generation = int(os.read(file_descriptor, 32) or 0) + 1
+            except ValueError:
+                generation = 1
+            os.lseek(file_descriptor, 0, os.SEEK_SET)
+            os.ftruncate(file_descriptor, 0)
+            os.write(file_descriptor, str(generation).encode('ascii'))
+            return generation
+        finally:
+            os.close(file_descriptor)
+
+
+class LRUCache():
+    """
+    Thread safe least recently used cache with a maximum number of entries,
+    a time to live and hit/miss counters. When a backend is given the cache
+    is emptied as soon as another process invalidates the same namespace
+    """
+
+    def __init__(self, namespace, max_entries, ttl_seconds, backend=None):
+        """
+        :param namespace: name used for the shared invalidations
+        :param max_entries: maximum number of cached entries
+        :param ttl_seconds: seconds after which an entry expires
+        :param backend: optional FileInvalidationBackend
+        """
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = backend.get_generation(namespace) if backend else 0
+
+    def _sync_generation(self):
+        """
+        Empties the cache if another process invalidated the namespace,
+        must be called with the lock held
+        """
+        if self.backend:
+            generation = self.backend.get_generation(self.namespace)
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+
+    def get(self, key):
+        """
+        :param key:
+        :return: cached value or MISSING
+        """
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        """
+        get without taking the lock
+        """
+        self._sync_generation()
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        """
+        :param key:
+        :param value:
+        :return:
+        """
+        with self._lock:
+            self._set(key, value)
+
+    def _set(self, key, value):
+        """
+        set without taking the lock
+        """
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        """
+        Read-through lookup, on a miss the value is loaded and cached unless
+        it is None or the cache was invalidated while loading
+
+        :param key:
+        :param loader: function returning the value of key
+        :return: value
+        """
+        with self._lock:
+            value = self._get(key)
+            generation = self._generation
+        if value is not MISSING:
+            return value
+        value = loader()
+        if value is not None:
+            with self._lock:
+                self._sync_generation()
+                if generation == self._generation:
+                    self._set(key, value)
+        return value
+
+    def invalidate(self):
+        """
+        Empties the cache of this process and, with a backend, of every other one
+        :return:
+        """
+        with self._lock:
+            if self.backend:
+                self._generation = self.backend.bump(self.namespace)
+            else:
+                self._generation += 1
+            self._entries.clear()
+
+    @property
+    def stats(self):
+        """
+        :return: dict with hits, misses and current size
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+class VersionCounter():
+    """
+    Monotonic data version, shared between worker processes through the
+    backend when one is given
+    """
+
+    def __init__(self, namespace, backend=None):
+        """
+        :param namespace: name of the counter in the backend
+        :param backend: optional FileInvalidationBackend
+        """
+        self.namespace = namespace
+        self.backend = backend
+        self._value = 0
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        """
+        :return: current version
+        """
+        if self.backend:
+            return self.backend.get_generation(self.namespace)
+        return self._value
+
+    def bump(self):
+        """
+        :return: new version
+        """
+        if self.backend:
+            return self.backend.bump(self.namespace)
+        with self._lock:
+            self._value += 1
+            return self._value
+
+
+def get_invalidation_backend(directory):
+    """
+    :param directory: shared directory or None
+    :return: FileInvalidationBackend for directory, None to keep invalidations per process
+    """
+    if directory:
+        return FileInvalidationBackend(directory)
+    return None
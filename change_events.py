@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""
+change_events.py stages the change events of the DAO writes in the session and
+publishes them once their transaction committed, through PostgreSQL NOTIFY or the
+broker of the process
+"""
+
+import logging
+from sqlalchemy import event, text
+import configuration as CONFIGURATION
+import cache
+import events
+from database import DB
+from students import StudentRecord
+
+
+EVENT_BROKER = events.EventBroker(CONFIGURATION.EVENTS_HISTORY_SIZE,
+                                  CONFIGURATION.EVENTS_MAX_QUEUED)
+PENDING_EVENTS_KEY = 'pending_events'
+# functions called with the events staged by every committed transaction of
+# this process, whichever broker publishes them
+COMMIT_HOOKS = []
+
+
+def _connect_event_listener():
+    """
+    :return: psycopg2 connection of the engine settings, outside of the pool
+    """
+    connection = DB.engine.raw_connection()
+    connection.detach()
+    return connection.connection
+
+
+EVENT_LISTENER = events.PostgresListener(EVENT_BROKER, _connect_event_listener,
+                                         CONFIGURATION.EVENTS_CHANNEL)
+
+
+def register_commit_hook(hook):
+    """
+    :param hook: function taking the list of the (event_type, class_ids, data)
+                 staged by a transaction, called once it committed and before
+                 its write bumps DATA_VERSION
+    :return:
+    """
+    COMMIT_HOOKS.append(hook)
+
+
+def events_use_notify():
+    """
+    :return: True if the events are fanned out through PostgreSQL NOTIFY
+    """
+    return CONFIGURATION.EVENTS_BROKER == 'postgres' and DB.engine.dialect.name == 'postgresql'
+
+
+def emit_event(event_type, class_ids, data):
+    """
+    Stages a change event, published to the /events streams once the
+    current transaction commits and dropped if it rolls back
+    :param event_type: SSE event type, e.g. student_updated
+    :param class_ids: classes whose pages show the change, None for the unassigned students
+    :param data: json serializable event data
+    :return:
+    """
+    DB.session.info.setdefault(PENDING_EVENTS_KEY, []).append(
+        (event_type, sorted({class_id and str(class_id) for class_id in class_ids},
+                            key=str), data))
+
+
+def emit_student_event(event_type, student, previous_class_id=cache.MISSING):
+    """
+    :param event_type: student_added, student_updated or student_deleted
+    :param student: Student or StudentRecord
+    :param previous_class_id: class the student moved from (None if it had
+                              none), only when it changed class
+    :return:
+    """
+    # ids of raw statements come back as uuid.UUID
+    data = StudentRecord(str(student.id), student.name, student.class_id and str(student.class_id),
+                         student.created_on, student.updated_on, student.version).serialize
+    class_ids = [student.class_id]
+    if previous_class_id is not cache.MISSING:
+        data['previous_class_id'] = previous_class_id and str(previous_class_id)
+        class_ids.append(previous_class_id)
+    emit_event(event_type, class_ids, data)
+
+
+def pending_events(session):
+    """
+    :param session: session about to commit
+    :return: its staged events, collapsed into one reload event of the
+             touched classes when there are more than EVENTS_MAX_PER_TRANSACTION
+    """
+    staged = session.info.get(PENDING_EVENTS_KEY)
+    if not staged or len(staged) <= CONFIGURATION.EVENTS_MAX_PER_TRANSACTION:
+        return staged or []
+    class_ids = sorted({class_id for _, event_class_ids, _ in staged
+                        for class_id in event_class_ids}, key=str)
+    return [('reload', class_ids, {})]
+
+
+def notification_payload(event_type, class_ids, data):
+    """
+    :param event_type: SSE event type
+    :param class_ids: classes touched by the event
+    :param data: json serializable event data
+    :return: NOTIFY payload of the event, or of a reload of every page (no
+             class ids) when it would exceed EVENTS_MAX_NOTIFY_BYTES
+    """
+    payload = events.encode_notification(event_type, class_ids, data)
+    if len(payload.encode('utf-8')) > CONFIGURATION.EVENTS_MAX_NOTIFY_BYTES:
+        logging.info("Sending a reload of every page instead of a %s event of %s classes",
+                     event_type, len(class_ids))
+        payload = events.encode_notification('reload', [], {})
+    return payload
+
+
+@event.listens_for(DB.session, 'before_commit')
+def _notify_events(session):
+    """
+    Sends the staged events with NOTIFY in the committing transaction,
+    PostgreSQL delivers them to the listeners only if it commits
+    """
+    if session.info.get(PENDING_EVENTS_KEY) and events_use_notify():
+        for event_type, class_ids, data in pending_events(session):
+            session.execute(text("SELECT pg_notify(:channel, :payload)"), {
+                'channel': CONFIGURATION.EVENTS_CHANNEL,
+                'payload': notification_payload(event_type, class_ids, data)})
+
+
+@event.listens_for(DB.session, 'after_commit')
+def _publish_events(session):
+    """
+    Hands the staged events to the COMMIT_HOOKS, and publishes them to the
+    streams of this process when they are not fanned out through NOTIFY
+    """
+    staged = session.info.get(PENDING_EVENTS_KEY)
+    if staged:
+        for hook in COMMIT_HOOKS:
+            try:
+                hook(staged)
+            except Exception as exception:  # pylint: disable=broad-except
+                logging.warning("Commit hook %s failed due to %s", hook.__name__, exception)
+        if not events_use_notify():
+            for event_type, class_ids, data in pending_events(session):
+                EVENT_BROKER.publish(event_type, class_ids, data)
+    session.info.pop(PENDING_EVENTS_KEY, None)
+
+
+@event.listens_for(DB.session, 'after_soft_rollback')
+def _drop_events(session, previous_transaction):  # pylint: disable=unused-argument
+    """
+    Drops the events of rolled back changes
+    """
+    session.info.pop(PENDING_EVENTS_KEY, None)
+
+
+def subscribe_events(class_ids=None, last_event_id=None):
+    """
+    :param class_ids: only the events of these classes (None for the unassigned
+                      students), None for all events
+    :param last_event_id: Last-Event-ID of a reconnecting client
+    :return: events.Subscription, to be passed to EVENT_BROKER.unsubscribe
+    """
+    if events_use_notify():
+        EVENT_LISTENER.start()
+    return EVENT_BROKER.subscribe(class_ids=class_ids, last_event_id=last_event_id)
@@ -0,0 +1,594 @@
+#!/usr/bin/env python
+"""
+classes.py has the StudentClass and class statistics tables and their DAO
+"""
+
+import datetime
+from collections import namedtuple
+from sqlalchemy import any_, case, cast, func, or_, select, text
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects.postgresql import ARRAY, UUID, insert as postgresql_insert
+import configuration as CONFIGURATION
+from database import (DB, Base, CLASS_CACHE, uuid7, save_changes, discard_changes, replica_read,
+                      stream_records, get_keyset_page, expire_loaded, update_versioned)
+from change_events import emit_event
+from students import Student, StudentRecord
+
+
+class StudentClass(DB.Model, Base):
+    """
+    This is a StudentClass for db connection with PostgreSQL.
+    Attributes:
+        id (int): ID of class.
+        name (string): name of class.
+        class_id (int): student id of class leader.
+        created_on (datetime): created on time and date.
+        updated_on (datetime): updated on time and date.
+        version (int): incremented by every update, checked by the updates.
+        closed_on (datetime): time the class was closed, its students get archived.
+    """
+    XSRF_TOKEN_MESSAGE = "StudentClassDAO_XSRF_TOKEN_MESSAGE"
+    __tablename__ = 'studentclass'
+    __table_args__ = (DB.Index('ix_studentclass_created_on_id', 'created_on', 'id'),)
+    id = DB.Column(UUID, primary_key=True, index=True, default=uuid7)
+    name = DB.Column(DB.String(100))
+    # class_leader = DB.Column(UUID, nullable=True, index=True, Foriegn)
+    class_leader = DB.Column(UUID, DB.ForeignKey('student.id'), nullable=True, index=True)
+    created_on = DB.Column(DB.DateTime)
+    updated_on = DB.Column(DB.DateTime, index=False, nullable=True)
+    version = DB.Column(DB.Integer, nullable=False, server_default='1')
+    closed_on = DB.Column(DB.DateTime, nullable=True)
+    __mapper_args__ = {'version_id_col': version}
+
+    # read-only, StudentClassDAO.get_course_view joins them in one statement
+    leader = DB.relationship('Student', foreign_keys=[class_leader], viewonly=True,
+                             lazy='raise')
+    students = DB.relationship('Student', foreign_keys='Student.class_id', viewonly=True,
+                               lazy='raise', order_by='(Student.created_on, Student.id)')
+
+    def __init__(self, name):
+        """
+        initialization of student class object
+
+        :param name:
+        """
+        self.name = name
+        self.created_on = datetime.datetime.now()
+
+    @property
+    def get_name(self):
+        """
+        :return: name of the class
+        """
+        return self.name
+
+    @property
+    def get_class_leader(self):
+        """
+        :return: class_leader for particular class
+        """
+        return self.class_leader
+
+    @property
+    def get_created_on(self):
+        """
+        :return: time of creation
+        """
+        return self.created_on
+
+    @property
+    def serialize(self):
+        """
+        :return: json serializable dict of the class
+        """
+        return {
+            'id': self.id,
+            'name': self.name,
+            'class_leader': self.class_leader,
+            'created_on': self.created_on.isoformat() if self.created_on else None,
+            'updated_on': self.updated_on.isoformat() if self.updated_on else None,
+            'version': self.version,
+            'closed_on': self.closed_on.isoformat() if self.closed_on else None,
+        }
+
+
+class StudentClassRecord(namedtuple('StudentClassRecord', ['id', 'name', 'class_leader',
+                                                         'created_on', 'updated_on',
+                                                         'version', 'closed_on'])):
+    """
+    Read-only snapshot of a StudentClass row, safe to share between requests
+    and threads through CLASS_CACHE
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_model(cls, class_obj):
+        """
+        :param class_obj: StudentClass object
+        :return: StudentClassRecord of class_obj, None if class_obj is None
+        """
+        if class_obj is None:
+            return None
+        return cls(class_obj.id, class_obj.name, class_obj.class_leader,
+                   class_obj.created_on, class_obj.updated_on, class_obj.version,
+                   class_obj.closed_on)
+
+    @property
+    def serialize(self):
+        """
+        :return: json serializable dict of the class
+        """
+        return StudentClass.serialize.fget(self)
+
+
+class CourseView(namedtuple('CourseView', ['course', 'leader', 'students'])):
+    """
+    Read-only class page: StudentClassRecord of the class, StudentRecord of
+    its leader (None without leader) and the StudentRecord of its students
+    by creation time
+    """
+    __slots__ = ()
+
+
+class StudentClassDAO(StudentClass):
+    """
+        This is a StudentClass Data access object for db connection with
+        PostgreSQL and perform CRUD operations
+    """
+    EXPORT_COLUMNS = ('id', 'name', 'class_leader', 'created_on', 'updated_on', 'version',
+                      'closed_on')
+
+    @staticmethod
+    def add_class(class_name):
+        """
+        To create a class with given class_name
+        :param class_name:
+        :return: class object, None without class_name
+        """
+        classes = None
+        if class_name:
+            classes = StudentClass(name=class_name)
+            DB.session.add(classes)
+            DB.session.flush()
+            emit_event('class_added', (classes.id,), classes.serialize)
+            save_changes(invalidate_classes=True)
+        return classes
+
+    @staticmethod
+    def get_all_classes():
+        """
+        To get all the classes, served from CLASS_CACHE when possible
+        :return: tuple of StudentClassRecord
+        """
+        return CLASS_CACHE.get_or_load(('all',), lambda: tuple(
+            StudentClassRecord.from_model(class_obj) for class_obj in StudentClass.query.all()))
+
+    @staticmethod
+    @replica_read
+    def get_classes_page(cursor=None, page_size=None):
+        """
+        To get one page of classes ordered by creation time using keyset pagination
+        :param cursor: next_cursor of the previous page, None for the first page
+        :param page_size: number of classes in the page, capped at MAX_PAGE_SIZE
+        :return: tuple of classes and next_cursor (None on the last page)
+        """
+        return get_keyset_page(StudentClass.query, StudentClass, cursor=cursor,
+                               page_size=page_size)
+
+    @staticmethod
+    @replica_read
+    def iter_classes():
+        """
+        To stream all the classes through a server-side cursor
+        :return: iterable of StudentClassRecord, tuples in EXPORT_COLUMNS order
+        """
+        query = DB.session.query(*[getattr(StudentClass, column)
+                                   for column in StudentClassDAO.EXPORT_COLUMNS])
+        return stream_records(query, StudentClassRecord, CONFIGURATION.EXPORT_FETCH_SIZE)
+
+    @staticmethod
+    def get_class_by_id(class_id):
+        """
+        To get class by id, served from CLASS_CACHE when possible
+        :param class_id:
+        :return: StudentClassRecord
+        """
+        current_class = None
+        if class_id:
+            current_class = CLASS_CACHE.get_or_load(
+                ('id', class_id), lambda: StudentClassRecord.from_model(
+                    StudentClass.query.filter_by(id=class_id).first()))
+        return current_class
+
+    @staticmethod
+    @replica_read
+    def get_course_view(class_id, with_students=True):
+        """
+        To get a class together with its leader and its students in one joined
+        statement, as read-only rows: one row per student, the class and
+        leader columns repeated on each
+        :param class_id:
+        :param with_students: also load the students (the active ones), an
+                              empty list otherwise
+        :return: CourseView, None if not found
+        """
+        if not class_id:
+            return None
+        leader = aliased(Student)
+        leader_join = StudentClass.leader.of_type(leader)  # pylint: disable=no-member
+        class_fields = len(StudentClassRecord._fields)
+        leader_fields = class_fields + len(StudentRecord._fields)
+        query = DB.session.query(
+            *([getattr(StudentClass, field) for field in StudentClassRecord._fields] +
+              [getattr(leader, field) for field in StudentRecord._fields])).outerjoin(
+                  leader_join).filter(StudentClass.id == class_id)
+        if with_students:
+            query = query.add_columns(
+                *[getattr(Student, field) for field in StudentRecord._fields]).outerjoin(
+                    StudentClass.students).order_by(Student.created_on, Student.id)
+        rows = DB.session.execute(query.statement).fetchall()
+        if not rows:
+            return None
+        first = rows[0]
+        return CourseView(
+            StudentClassRecord._make(first[:class_fields]),
+            StudentRecord._make(first[class_fields:leader_fields])
+            if first[class_fields] is not None else None,
+            [StudentRecord._make(row[leader_fields:]) for row in rows
+             if with_students and row[leader_fields] is not None])
+
+    @staticmethod
+    def cache_stats():
+        """
+        :return: hit/miss counters and size of the class cache
+        """
+        return CLASS_CACHE.stats
+
+    @staticmethod
+    def get_existing_class_ids(class_ids):
+        """
+        To check which of the given class ids exist, with one query
+        :param class_ids: iterable of class ids
+        :return: set of the class ids which exist
+        """
+        class_ids = list(class_ids)
+        if not class_ids:
+            return set()
+        rows = DB.session.query(StudentClass.id).filter(StudentClass.id.in_(class_ids)).all()
+        return {str(row.id) for row in rows}
+
+    @staticmethod
+    def update_class_details(class_id=None, class_name=None, class_leader_id=None,
+                             expected_version=None):
+        """
+        To update the existing class details by provind various fields, in
+        one conditional UPDATE
+        :param class_id:
+        :param class_name:
+        :param class_leader_id:
+        :param expected_version: version the class was read at, None to
+                                 overwrite any version
+        :return: StudentClassRecord, None if not found
+        :raises VersionConflict: if the class changed since expected_version
+        """
+        if not class_id:
+            return None
+        if not (class_leader_id or class_name):
+            return StudentClassRecord.from_model(
+                StudentClass.query.filter_by(id=class_id).first())
+        values = {'updated_on': datetime.datetime.now()}
+        if class_leader_id:
+            values['class_leader'] = class_leader_id
+        if class_name:
+            values['name'] = class_name
+        course = update_versioned(StudentClass, StudentClassRecord, class_id, expected_version,
+                                  **values)
+        if course:
+            emit_event('class_updated', (course.id,), course.serialize)
+            save_changes(invalidate_classes=True)
+        return course
+
+    @staticmethod
+    def close_class(class_id, expected_version=None):
+        """
+        To close a class, its students are moved to the archive by the next
+        archive_students run
+        :param class_id:
+        :param expected_version: version the class was read at, None to
+                                 overwrite any version
+        :return: StudentClassRecord, None if not found
+        :raises VersionConflict: if the class changed since expected_version
+        """
+        if not class_id:
+            return None
+        now = datetime.datetime.now()
+        course = update_versioned(StudentClass, StudentClassRecord, class_id, expected_version,
+                                  closed_on=now, updated_on=now)
+        if course:
+            emit_event('class_updated', (course.id,), course.serialize)
+            save_changes(invalidate_classes=True)
+        return course
+
+    @staticmethod
+    def clear_class_leaders(condition):
+        """
+        To clear class_leader of the classes matching condition, before their
+        leaders are deleted, without saving
+        :param condition: sqlalchemy condition on StudentClass
+        :return: number of classes which lost their leader
+        """
+        rows = DB.session.execute(StudentClass.__table__.update().where(condition).values(
+            class_leader=None, version=StudentClass.version + 1).returning(
+                StudentClass.id, StudentClass.version)).fetchall()
+        expire_loaded(StudentClass, [row[0] for row in rows])
+        for row in rows:
+            emit_event('class_updated', (row[0],), {'id': row[0], 'class_leader': None,
+                                                    'version': row[1]})
+        return len(rows)
+
+    @staticmethod
+    def get_all_class_by_leader(student_id):
+        """
+        To get all the classes by leader
+        :param student_id:
+        :return: class object
+        """
+        classes = StudentClass.query.filter_by(class_leader=student_id).first()
+        return classes
+
+
+# class_statistics key of the students without class
+UNASSIGNED_CLASS_KEY = '00000000-0000-0000-0000-000000000000'
+
+
+class ClassStatistics(DB.Model, Base):
+    """
+        Enrollment counters of a class, the ClassStatisticsDelta rows of the DAO
+        methods which add, move or delete students folded in.
+        Attributes:
+            class_id (uuid): class id, UNASSIGNED_CLASS_KEY for students without class.
+            student_count (int): number of students in the class.
+            last_enrolled_on (datetime): latest enrolled_on of the students of the class.
+            updated_on (datetime): time of the last change of the counters.
+    """
+    __tablename__ = 'class_statistics'
+    class_id = DB.Column(UUID, primary_key=True)
+    student_count = DB.Column(DB.Integer, nullable=False, default=0)
+    last_enrolled_on = DB.Column(DB.DateTime, nullable=True)
+    updated_on = DB.Column(DB.DateTime, nullable=True)
+
+
+class ClassStatisticsDelta(DB.Model, Base):
+    """
+        Change of the enrollment counters of a class, appended by the DAO
+        methods in their transaction and folded into class_statistics by
+        ClassStatisticsDAO.compact, so the writers never update a shared row.
+        Attributes:
+            id (int): order of the changes.
+            class_id (uuid): class id, UNASSIGNED_CLASS_KEY for students without class.
+            student_count (int): students added minus students removed.
+            last_enrolled_on (datetime): latest enrolled_on of the added students.
+            left_class (bool): students left the class, its last_enrolled_on is recomputed.
+    """
+    __tablename__ = 'class_statistics_delta'
+    id = DB.Column(DB.BigInteger, primary_key=True, autoincrement=True)
+    class_id = DB.Column(UUID, nullable=False)
+    student_count = DB.Column(DB.Integer, nullable=False)
+    last_enrolled_on = DB.Column(DB.DateTime, nullable=True)
+    left_class = DB.Column(DB.Boolean, nullable=False, default=False)
+
+
+class ClassStatisticsRecord(namedtuple('ClassStatisticsRecord', ['class_id', 'name',
+                                                                 'student_count',
+                                                                 'last_enrolled_on'])):
+    """
+    Statistics of one class as served by /api/classes/stats
+    """
+    __slots__ = ()
+
+    @property
+    def serialize(self):
+        """
+        :return: json serializable dict of the statistics
+        """
+        return {
+            'class_id': str(self.class_id),
+            'name': self.name,
+            'student_count': self.student_count,
+            'last_enrolled_on': self.last_enrolled_on.isoformat()
+                                if self.last_enrolled_on else None,
+        }
+
+
+class ClassStatisticsDAO(ClassStatistics):
+    """
+        This is a ClassStatistics Data access object keeping the per class
+        counters up to date incrementally and rebuilding them from student
+    """
+
+    @staticmethod
+    def record_changes(added=(), removed=()):
+        """
+        Records enrollment changes in the current transaction as one delta
+        row per class involved, with one INSERT. No counter row is updated,
+        so concurrent transactions do not wait for each other, e.g. on the
+        row of the unassigned students; compact folds the deltas later
+
+        :param added: iterable of (class_id or None, enrolled_on) of students
+                      added to a class (None: added without class)
+        :param removed: iterable of class_id or None of students which left it
+        :return:
+        """
+        deltas = {}
+        for class_id, enrolled_on in added:
+            key = str(class_id) if class_id else UNASSIGNED_CLASS_KEY
+            count, latest = deltas.get(key, (0, None))
+            if class_id and enrolled_on and (latest is None or enrolled_on > latest):
+                latest = enrolled_on
+            deltas[key] = (count + 1, latest)
+        left_classes = set()
+        for class_id in removed:
+            key = str(class_id) if class_id else UNASSIGNED_CLASS_KEY
+            count, latest = deltas.get(key, (0, None))
+            deltas[key] = (count - 1, latest)
+            if class_id:
+                left_classes.add(key)
+        if not deltas:
+            return
+        DB.session.execute(ClassStatisticsDelta.__table__.insert().values([
+            {'class_id': key, 'student_count': count, 'last_enrolled_on': latest,
+             'left_class': key in left_classes}
+            for key, (count, latest) in sorted(deltas.items())]))
+
+    @staticmethod
+    def _apply_deltas(deltas, left_classes):
+        """
+        Adds folded deltas to the counters, with one upsert for all the
+        classes involved on PostgreSQL, an update (or insert) per class on
+        other databases. Classes which lost a student get their
+        last_enrolled_on recomputed from their roster
+
+        :param deltas: dict of class key -> (student count change, latest enrolled_on)
+        :param left_classes: keys of the classes which lost a student
+        :return:
+        """
+        now = datetime.datetime.now()
+        table = ClassStatistics.__table__
+        postgresql = DB.session.connection().dialect.name == 'postgresql'
+        # sorted keys, concurrent compactions lock the rows in the same order
+        if postgresql:
+            statement = postgresql_insert(table).values([
+                {'class_id': key, 'student_count': count, 'last_enrolled_on': latest,
+                 'updated_on': now} for key, (count, latest) in sorted(deltas.items())])
+            DB.session.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.class_id], set_={
+                    'student_count': table.c.student_count + statement.excluded.student_count,
+                    'last_enrolled_on': func.greatest(table.c.last_enrolled_on,
+                                                      statement.excluded.last_enrolled_on),
+                    'updated_on': statement.excluded.updated_on}))
+        else:
+            for key, (count, latest) in sorted(deltas.items()):
+                values = {'student_count': table.c.student_count + count, 'updated_on': now}
+                if latest is not None:
+                    values['last_enrolled_on'] = case(
+                        [(or_(table.c.last_enrolled_on.is_(None),
+                              table.c.last_enrolled_on < latest), latest)],
+                        else_=table.c.last_enrolled_on)
+                if not DB.session.execute(table.update().where(
+                        table.c.class_id == key).values(**values)).rowcount:
+                    DB.session.execute(table.insert().values(
+                        class_id=key, student_count=count, last_enrolled_on=latest,
+                        updated_on=now))
+        if left_classes:
+            DB.session.execute(table.update().where(
+                table.c.class_id == any_(cast(sorted(left_classes), ARRAY(UUID)))
+                if postgresql else table.c.class_id.in_(sorted(left_classes))).values(
+                    last_enrolled_on=select([func.max(Student.enrolled_on)]).where(
+                        Student.class_id == table.c.class_id).as_scalar()))
+
+    @staticmethod
+    def compact(limit=None):
+        """
+        Folds the oldest delta rows into the counters, in a transaction of its
+        own, run by the idle job workers. Delta rows locked by a concurrent
+        compaction are skipped. The statistics read are the same before and
+        after, DATA_VERSION is not bumped
+
+        :param limit: maximum number of delta rows, CLASS_STATISTICS_COMPACT_BATCH if None
+        :return: number of delta rows folded
+        """
+        table = ClassStatisticsDelta.__table__
+        columns = [table.c.class_id, table.c.student_count, table.c.last_enrolled_on,
+                   table.c.left_class]
+        oldest = select([table.c.id]).order_by(table.c.id).limit(
+            limit or CONFIGURATION.CLASS_STATISTICS_COMPACT_BATCH)
+        try:
+            if DB.session.connection().dialect.name == 'postgresql':
+                rows = DB.session.execute(table.delete().where(table.c.id.in_(
+                    oldest.with_for_update(skip_locked=True))).returning(*columns)).fetchall()
+            else:
+                rows = DB.session.execute(oldest.column(table.c.class_id).column(
+                    table.c.student_count).column(table.c.last_enrolled_on).column(
+                        table.c.left_class)).fetchall()
+                if rows:
+                    DB.session.execute(table.delete().where(
+                        table.c.id.in_([row[0] for row in rows])))
+                rows = [row[1:] for row in rows]
+            deltas = {}
+            left_classes = set()
+            for class_id, count, enrolled_on, left_class in rows:
+                key = str(class_id)
+                total, latest = deltas.get(key, (0, None))
+                if enrolled_on and (latest is None or enrolled_on > latest):
+                    latest = enrolled_on
+                deltas[key] = (total + count, latest)
+                if left_class:
+                    left_classes.add(key)
+            if deltas:
+                ClassStatisticsDAO._apply_deltas(deltas, left_classes)
+            DB.session.commit()
+        except Exception:
+            DB.session.rollback()
+            raise
+        return len(rows)
+
+    @staticmethod
+    def rebuild():
+        """
+        Recomputes every counter from the student table, correcting any drift,
+        and drops the pending deltas. Writers wait for the rebuild, readers
+        keep seeing the old counters
+        :return: number of class_statistics rows written
+        """
+        try:
+            DB.session.execute(text(
+                "LOCK TABLE class_statistics, class_statistics_delta IN EXCLUSIVE MODE"))
+            DB.session.execute(text("DELETE FROM class_statistics_delta"))
+            DB.session.execute(text("DELETE FROM class_statistics"))
+            written = DB.session.execute(text(
+                "INSERT INTO class_statistics "
+                "(class_id, student_count, last_enrolled_on, updated_on) "
+                "SELECT coalesce(class_id, CAST(:unassigned AS uuid)), count(*), "
+                "max(enrolled_on), now() FROM student GROUP BY class_id"),
+                                         {'unassigned': UNASSIGNED_CLASS_KEY}).rowcount
+            save_changes()
+        except Exception:
+            discard_changes()
+            raise
+        return written
+
+    @staticmethod
+    @replica_read
+    def get_class_statistics():
+        """
+        To get the statistics of every class, ordered by class creation time:
+        the counters plus the deltas not compacted yet. Classes which lost a
+        student since the last compaction get last_enrolled_on from their roster
+        :return: tuple of list of ClassStatisticsRecord and the unassigned students count
+        """
+        delta = ClassStatisticsDelta.__table__
+        pending = DB.session.query(
+            delta.c.class_id, func.sum(delta.c.student_count).label('student_count'),
+            func.max(delta.c.last_enrolled_on).label('last_enrolled_on'),
+            func.count(case([(delta.c.left_class, 1)])).label('left_class')).group_by(
+                delta.c.class_id).subquery()
+        last_enrolled_on = case([
+            (pending.c.left_class > 0, select([func.max(Student.enrolled_on)]).where(
+                Student.class_id == StudentClass.id).as_scalar()),
+            (or_(ClassStatistics.last_enrolled_on.is_(None),
+                 pending.c.last_enrolled_on > ClassStatistics.last_enrolled_on),
+             pending.c.last_enrolled_on)], else_=ClassStatistics.last_enrolled_on)
+        rows = DB.session.query(
+            StudentClass.id, StudentClass.name,
+            func.coalesce(ClassStatistics.student_count, 0) +
+            func.coalesce(pending.c.student_count, 0), last_enrolled_on).outerjoin(
+                ClassStatistics, ClassStatistics.class_id == StudentClass.id).outerjoin(
+                    pending, pending.c.class_id == StudentClass.id).order_by(
+                        StudentClass.created_on, StudentClass.id).all()
+        counted, pending_count = DB.session.query(
+            select([ClassStatistics.student_count]).where(
+                ClassStatistics.class_id == UNASSIGNED_CLASS_KEY).as_scalar(),
+            select([func.sum(delta.c.student_count)]).where(
+                delta.c.class_id == UNASSIGNED_CLASS_KEY).as_scalar()).one()
+        return ([ClassStatisticsRecord(*row) for row in rows],
+                (counted or 0) + (pending_count or 0))
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""
+compression.py has the gzip / brotli content encoding of the responses,
+negotiated from the Accept-Encoding of the request. Brotli is used when the
+optional brotli package is installed, gzip otherwise
+"""
+
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP = 'gzip'
+BROTLI = 'br'
+# preferred first when the client accepts both with the same quality
+ENCODINGS = (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+# statuses whose body must not be encoded
+_UNENCODED_STATUSES = (204, 206, 304)
+
+
+class Compressor():
+    """
+    Incremental gzip or brotli compressor
+    """
+
+    def __init__(self, encoding, gzip_level, brotli_quality):
+        """
+        :param encoding: GZIP or BROTLI
+        :param gzip_level: zlib compression level
+        :param brotli_quality: brotli quality
+        """
+        if encoding == BROTLI:
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data):
+        """
+        :param data: bytes
+        :return: compressed bytes available so far, possibly empty
+        """
+        if self._brotli is not None:
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def flush(self):
+        """
+        :return: the compressed bytes of all the data given so far, the
+                 client can decode them without waiting for the end
+        """
+        if self._brotli is not None:
+            return self._brotli.flush()
+        return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        """
+        :return: the last compressed bytes, ending the stream
+        """
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+class ResponseCompressor():
+    """
+    Encodes the responses of compressible mimetypes with the best encoding
+    the client accepts. Buffered responses are compressed at once when they
+    have at least min_bytes, streamed ones chunk by chunk with a flush after
+    every chunk, so each export batch or event still reaches the client as
+    soon as it is produced. A strong ETag gets the encoding as suffix, the
+    encoded representation differs from the identity one
+    """
+
+    def __init__(self, mimetypes, min_bytes, gzip_level, brotli_quality, streaming=True):
+        """
+        :param mimetypes: mimetypes which are compressed
+        :param min_bytes: smaller buffered bodies are sent as they are
+        :param gzip_level: zlib compression level
+        :param brotli_quality: brotli quality
+        :param streaming: False leaves the streamed responses uncompressed
+        """
+        self.mimetypes = frozenset(mimetypes)
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.streaming = streaming
+
+    def negotiate(self, response):
+        """
+        Adds Vary: Accept-Encoding to the compressible responses
+        :param response: response of the current request
+        :return: encoding to apply to response, None to send it as it is
+        """
+        if response.mimetype not in self.mimetypes:
+            return None
+        response.vary.add('Accept-Encoding')
+        if (response.status_code < 200 or response.status_code in _UNENCODED_STATUSES
+                or 'Content-Encoding' in response.headers
+                or 'no-transform' in response.cache_control):
+            return None
+        if response.is_streamed and not response.direct_passthrough:
+            if not self.streaming:
+                return None
+            # e.g. the error pages of werkzeug, which are streamed with a length
+            length = response.content_length
+        else:
+            length = response.calculate_content_length()
+        if length is not None and length < self.min_bytes:
+            return None
+        return request.accept_encodings.best_match(ENCODINGS)
+
+    def compress(self, data, encoding):
+        """
+        :param data: bytes
+        :param encoding: GZIP or BROTLI
+        :return: compressed bytes
+        """
+        compressor = Compressor(encoding, self.gzip_level, self.brotli_quality)
+        return compressor.compress(data) + compressor.finish()
+
+    def iter_compress(self, chunks, encoding, charset='utf-8'):
+        """
+        :param chunks: iterable of text or byte chunks, closed when done
+        :param encoding: GZIP or BROTLI
+        :param charset: encoding of the text chunks
+        :return: generator of compressed byte chunks, one per chunk
+        """
+        compressor = Compressor(encoding, self.gzip_level, self.brotli_quality)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode(charset)
+                data = compressor.compress(chunk) + compressor.flush()
+                if data:
+                    yield data
+            yield compressor.finish()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    @staticmethod
+    def set_encoded(response, encoding, data=None):
+        """
+        Marks response as encoded, with data as its body when given
+        :param response:
+        :param encoding: GZIP or BROTLI
+        :param data: already compressed body, None if the body is encoded by the caller
+        :return:
+        """
+        if data is not None:
+            response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        response.headers.pop('Accept-Ranges', None)
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag('{0}-{1}'.format(etag, encoding))
+
+    def encode(self, response):
+        """
+        after_request hook compressing response when the client accepts it
+        :param response:
+        :return: response
+        """
+        encoding = self.negotiate(response)
+        if encoding is None:
+            return response
+        if response.is_streamed and not response.direct_passthrough:
+            response.response = self.iter_compress(response.response, encoding,
+                                                   response.charset)
+            response.headers.pop('Content-Length', None)
+            self.set_encoded(response, encoding)
+            return response
+        # e.g. a static file, small enough to be read at once
+        response.direct_passthrough = False
+        data = response.get_data()
+        if len(data) < self.min_bytes:
+            return response
+        self.set_encoded(response, encoding, self.compress(data, encoding))
+        return response.make_conditional(request.environ)
+
+    def init_app(self, app):
+        """
+        Compresses the responses of app
+        :param app: flask app
+        :return:
+        """
+        app.after_request(self.encode)
@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+"""
+database.py has the Flask-SQLAlchemy setup of the app: the session routing reads to
+the replicas, the unit of work of the DAO writes, the caches they invalidate and the
+helpers shared by the DAOs (ids, keyset pages, versioned updates)
+"""
+
+import collections
+import contextlib
+import datetime
+import functools
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import NewType
+import base64
+from flask import Flask
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import and_, tuple_
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.declarative import declarative_base
+import configuration as CONFIGURATION
+import cache
+import metrics
+
+
+# new type
+Uuid = NewType('Uuid', str)
+
+APP = Flask(__name__)
+APP.config['SQLALCHEMY_DATABASE_URI'] = \
+    CONFIGURATION.ProductionDBServiceURL.get_production_mode_db_url()
+APP.config['SECRET_KEY'] = CONFIGURATION.DB_APP_CONFIG_SECRET_KEY
+APP.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = \
+    CONFIGURATION.DB_APP_CONFIG_SQLALCHEMY_TRACK_MODIFICATIONS
+APP.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': CONFIGURATION.DB_POOL_SIZE,
+    'max_overflow': CONFIGURATION.DB_POOL_MAX_OVERFLOW,
+    'pool_timeout': CONFIGURATION.DB_POOL_TIMEOUT_SECONDS,
+    'pool_recycle': CONFIGURATION.DB_POOL_RECYCLE_SECONDS,
+    'pool_pre_ping': CONFIGURATION.DB_POOL_PRE_PING,
+    'poolclass': metrics.TimedQueuePool,
+}
+REPLICA_BIND_KEYS = ['replica{0}'.format(index)
+                     for index in range(len(CONFIGURATION.REPLICA_DB_URLS))]
+APP.config['SQLALCHEMY_BINDS'] = dict(zip(REPLICA_BIND_KEYS, CONFIGURATION.REPLICA_DB_URLS))
+# session.info keys: replica bind of the running replica_read call, reads forced to the primary
+# (read your writes, cache fills) and whether the session wrote
+REPLICA_BIND_KEY = 'replica_bind'
+READ_PRIMARY_KEY = 'read_primary'
+WROTE_KEY = 'wrote'
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session sending the statements of replica_read DAO calls to the replica
+    chosen for them, everything else (and every flush) to the primary
+    """
+
+    def __init__(self, db, **options):
+        """
+        :param db: RoutingSQLAlchemy the session belongs to
+        :param options: keyword arguments of SignallingSession
+        """
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        """
+        :param mapper:
+        :param clause:
+        :return: engine the statement runs on
+        """
+        bind_key = self.info.get(REPLICA_BIND_KEY)
+        if bind_key is not None and not self._flushing:
+            return self.db.get_engine(self.app, bind=bind_key)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """
+    SQLAlchemy extension whose sessions are RoutingSession
+    """
+
+    def create_session(self, options):
+        """
+        :param options: keyword arguments of the session class
+        :return: session factory
+        """
+        return sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+DB = RoutingSQLAlchemy(APP)
+Base = declarative_base()
+
+INVALIDATION_BACKEND = cache.get_invalidation_backend(CONFIGURATION.CACHE_INVALIDATION_DIR)
+CLASS_CACHE = cache.LRUCache('studentclass', CONFIGURATION.CLASS_CACHE_MAX_ENTRIES,
+                             CONFIGURATION.CLASS_CACHE_TTL_SECONDS, backend=INVALIDATION_BACKEND)
+# bumped by every DAO write, keys the rendered page and fragment caches
+DATA_VERSION = cache.VersionCounter('data', backend=INVALIDATION_BACKEND)
+
+
+# last (unix ms, counter) handed out by uuid7, keeps ids monotonic within a process
+_UUID7_STATE = [0, 0]
+_UUID7_LOCK = threading.Lock()
+
+
+def uuid7(timestamp=None):
+    """
+    Method to generate uuid as primary key for student and student_class.
+    The ids follow the UUIDv7 layout: 48 bits of unix time in ms, a 12 bit
+    counter and 62 random bits, so new rows land at the right edge of the
+    primary key and foreign key indexes instead of at random pages
+    :param timestamp: datetime to build the id for, defaults to now
+    :return: string as uuid
+    """
+    random_bits = int.from_bytes(os.urandom(8), 'big') & 0x3FFFFFFFFFFFFFFF
+    if timestamp is not None:
+        unix_ms = int(timestamp.timestamp() * 1000)
+        counter = random_bits >> 50
+    else:
+        with _UUID7_LOCK:
+            unix_ms = max(int(time.time() * 1000), _UUID7_STATE[0])
+            if unix_ms == _UUID7_STATE[0]:
+                counter = _UUID7_STATE[1] + 1
+                if counter > 0xFFF:
+                    unix_ms, counter = unix_ms + 1, 0
+            else:
+                # start low in the 12 bits, leaves room to count up within the ms
+                counter = random_bits >> 53
+            _UUID7_STATE[0], _UUID7_STATE[1] = unix_ms, counter
+    value = (unix_ms & 0xFFFFFFFFFFFF) << 80 | 0x7 << 76 | counter << 64 | 0x2 << 62 | random_bits
+    return str(uuid.UUID(int=value))
+
+
+UNIT_OF_WORK_KEY = 'unit_of_work'
+
+
+class UnitOfWork():
+    """
+    UnitOfWork collects the changes staged by the DAO methods of one request
+    (or of one /batch call) so they are committed in one transaction, with
+    the cache invalidations they need applied once after the commit
+    """
+
+    def __init__(self):
+        self.changed = False
+        self.invalidate_classes = False
+        self.rollback_only = False
+
+
+@contextlib.contextmanager
+def unit_of_work():
+    """
+    Runs the enclosed DAO calls in one transaction. Inside it save_changes
+    only flushes, the commit happens when the block ends, unless it raised
+    or rollback_only was set. Nested calls join the outer unit of work
+    :return: UnitOfWork
+    """
+    session = DB.session
+    work = session.info.get(UNIT_OF_WORK_KEY)
+    if work is not None:
+        yield work
+        return
+    work = session.info[UNIT_OF_WORK_KEY] = UnitOfWork()
+    try:
+        yield work
+        if work.rollback_only:
+            session.rollback()
+        else:
+            session.commit()
+            if work.changed:
+                DATA_VERSION.bump()
+        if work.invalidate_classes:
+            # also after a rollback, class reads of the aborted transaction may be cached
+            CLASS_CACHE.invalidate()
+    except Exception:
+        session.rollback()
+        if work.invalidate_classes:
+            CLASS_CACHE.invalidate()
+        raise
+    finally:
+        session.info.pop(UNIT_OF_WORK_KEY, None)
+
+
+def save_changes(invalidate_classes=False):
+    """
+    Called by the DAO methods once their changes are staged: commits them and
+    bumps DATA_VERSION, or only flushes them inside a unit_of_work
+    :param invalidate_classes: the changes touch classes, CLASS_CACHE is invalidated
+    :return:
+    """
+    DB.session.info[WROTE_KEY] = True
+    work = DB.session.info.get(UNIT_OF_WORK_KEY)
+    if work is not None:
+        DB.session.flush()
+        work.changed = True
+        work.invalidate_classes = work.invalidate_classes or invalidate_classes
+        return
+    DB.session.commit()
+    DATA_VERSION.bump()
+    if invalidate_classes:
+        CLASS_CACHE.invalidate()
+
+
+def discard_changes():
+    """
+    Rolls back the staged changes after a failed DAO call, inside a
+    unit_of_work the whole unit is marked to be rolled back
+    :return:
+    """
+    work = DB.session.info.get(UNIT_OF_WORK_KEY)
+    if work is not None:
+        work.rollback_only = True
+    DB.session.rollback()
+
+
+class ReplicaRouter():
+    """
+    Picks the replica of each replica_read call, round robin over the
+    replicas which did not fail in the last retry_seconds
+    """
+
+    def __init__(self, bind_keys, retry_seconds):
+        """
+        :param bind_keys: SQLALCHEMY_BINDS keys of the replicas
+        :param retry_seconds: seconds a failed replica is skipped
+        """
+        self.bind_keys = list(bind_keys)
+        self.retry_seconds = retry_seconds
+        self.reads = collections.Counter()
+        self.failovers = collections.Counter()
+        self._failed_until = {}
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    def choose(self):
+        """
+        :return: bind key of the replica to read from, None to read from the primary
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = [bind_key for bind_key in self.bind_keys
+                         if self._failed_until.get(bind_key, 0) <= now]
+            if not available:
+                return None
+            bind_key = available[next(self._turn) % len(available)]
+            self.reads[bind_key] += 1
+            return bind_key
+
+    def mark_failed(self, bind_key):
+        """
+        :param bind_key: replica whose read failed
+        :return:
+        """
+        with self._lock:
+            self._failed_until[bind_key] = time.monotonic() + self.retry_seconds
+            self.failovers[bind_key] += 1
+
+
+REPLICA_ROUTER = ReplicaRouter(REPLICA_BIND_KEYS, CONFIGURATION.REPLICA_RETRY_SECONDS)
+
+
+def _keeps_its_bind(session):
+    """
+    :param session: DB.session
+    :return: True when a replica_read call must not pick a replica: an outer
+             call already did, or the session has to see its own writes
+    """
+    info = session.info
+    if REPLICA_BIND_KEY in info or info.get(READ_PRIMARY_KEY) or info.get(WROTE_KEY):
+        return True
+    return (info.get(UNIT_OF_WORK_KEY) is not None
+            or bool(session.new or session.dirty or session.deleted))
+
+
+def replica_read(method):
+    """
+    Decorator of read-only DAO methods running them on a replica, unless
+    the session has to see its own writes: inside a unit_of_work, once it
+    wrote or has pending changes, and when READ_PRIMARY_KEY is set. A call
+    failing to reach its replica is retried on the primary
+    :param method: DAO method, executing its statements before it returns
+    :return: wrapped method
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        session = DB.session
+        info = session.info
+        if not REPLICA_ROUTER.bind_keys or _keeps_its_bind(session):
+            return method(*args, **kwargs)
+        bind_key = REPLICA_ROUTER.choose()
+        if bind_key is None:
+            return method(*args, **kwargs)
+        info[REPLICA_BIND_KEY] = bind_key
+        try:
+            return method(*args, **kwargs)
+        except (OperationalError, PoolTimeoutError) as exception:
+            logging.warning("Replica %s failed, reading from the primary: %s", bind_key, exception)
+            REPLICA_ROUTER.mark_failed(bind_key)
+            info.pop(REPLICA_BIND_KEY, None)
+            session.rollback()
+            return method(*args, **kwargs)
+        finally:
+            info.pop(REPLICA_BIND_KEY, None)
+    return wrapper
+
+
+def read_from_primary():
+    """
+    Sends the reads of the rest of the session to the primary, e.g. for a
+    client which just wrote
+    :return:
+    """
+    DB.session.info[READ_PRIMARY_KEY] = True
+
+
+@contextlib.contextmanager
+def use_primary():
+    """
+    Sends the reads of the enclosed block to the primary, for data cached
+    per DATA_VERSION which must not be older than that version
+    :return:
+    """
+    info = DB.session.info
+    previous = info.get(READ_PRIMARY_KEY)
+    info[READ_PRIMARY_KEY] = True
+    try:
+        yield
+    finally:
+        if previous is None:
+            info.pop(READ_PRIMARY_KEY, None)
+        else:
+            info[READ_PRIMARY_KEY] = previous
+
+
+def session_wrote():
+    """
+    :return: True if the session saved changes
+    """
+    return bool(DB.session.info.get(WROTE_KEY))
+
+
+class PageCursor():
+    """
+    PageCursor encodes the (created_on, id) keyset of the last row of a page
+    into an opaque token, so the next page can continue right after it
+    """
+    DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+    @staticmethod
+    def encode(created_on, row_id):
+        """
+        :param created_on: created_on of the last row of the page
+        :param row_id: id of the last row of the page
+        :return: url safe cursor string
+        """
+        payload = json.dumps([created_on.strftime(PageCursor.DATETIME_FORMAT), str(row_id)])
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode(cursor):
+        """
+        :param cursor: cursor string returned by encode
+        :return: tuple of created_on and id
+        :raises ValueError: if the cursor is malformed
+        """
+        try:
+            created_on, row_id = json.loads(
+                base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+            return datetime.datetime.strptime(created_on, PageCursor.DATETIME_FORMAT), row_id
+        except (TypeError, ValueError, UnicodeError) as exception:
+            raise ValueError("Invalid page cursor") from exception
+
+
+def query_records(query, record_type):
+    """
+    Runs a column query as a plain SQL statement, skipping the ORM row
+    processing and the identity map, and wraps every row in record_type
+
+    :param query: query of the columns of record_type, in field order
+    :param record_type: namedtuple class
+    :return: list of record_type
+    """
+    return [record_type._make(row) for row in DB.session.execute(query.statement).fetchall()]
+
+
+def stream_records(query, record_type, fetch_size):
+    """
+    Like query_records but streamed through a server-side cursor, fetch_size
+    rows per round trip. The statement is executed right away, on the
+    database the caller is routed to, the rows are fetched while iterating
+
+    :param query: query of the columns of record_type, in field order
+    :param record_type: namedtuple class
+    :param fetch_size: rows fetched per round trip
+    :return: generator of record_type
+    """
+    result = DB.session.execute(query.statement.execution_options(stream_results=True))
+
+    def fetch():
+        try:
+            rows = result.fetchmany(fetch_size)
+            while rows:
+                for row in rows:
+                    yield record_type._make(row)
+                rows = result.fetchmany(fetch_size)
+        finally:
+            result.close()
+    return fetch()
+
+
+def get_keyset_page(query, model, cursor=None, page_size=None, record_type=None):
+    """
+    Fetches one page of query ordered by (created_on, id) starting after cursor
+
+    :param query: query to paginate
+    :param model: model having created_on and id columns
+    :param cursor: cursor of the previous page, None for the first page
+    :param page_size: maximum number of rows in the page
+    :param record_type: namedtuple class the rows of a column query are returned as,
+                        see query_records
+    :return: tuple of rows and cursor of the next page (None on the last page)
+    """
+    page_size = max(1, min(page_size or CONFIGURATION.DEFAULT_PAGE_SIZE,
+                           CONFIGURATION.MAX_PAGE_SIZE))
+    if cursor:
+        created_on, row_id = PageCursor.decode(cursor)
+        query = query.filter(tuple_(model.created_on, model.id) > tuple_(created_on, row_id))
+    query = query.order_by(model.created_on, model.id).limit(page_size + 1)
+    rows = query_records(query, record_type) if record_type else query.all()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = PageCursor.encode(rows[-1].created_on, rows[-1].id)
+    return rows, next_cursor
+
+
+class VersionConflict(Exception):
+    """
+    Raised when a row was changed by someone else since the version the
+    caller read
+    """
+
+
+def expire_loaded(model, row_ids):
+    """
+    Expires the objects of row_ids loaded in the session after a core statement
+    changed their rows, so they are reloaded instead of flushed with a stale version
+    :param model: mapped class
+    :param row_ids: ids of the changed rows
+    :return:
+    """
+    for row_id in row_ids:
+        loaded = DB.session.identity_map.get(DB.session.identity_key(model, row_id))
+        if loaded is not None:
+            DB.session.expire(loaded)
+
+
+def update_versioned(model, record_type, row_id, expected_version, **values):
+    """
+    Updates one row of a versioned model with a single conditional
+    UPDATE ... WHERE id = ? AND version = ?, without reading it first, and
+    bumps its version. The row is only looked up again when nothing was updated,
+    to tell a missing row from a conflict
+
+    :param model: mapped class having id and version columns
+    :param record_type: namedtuple class of the returned row
+    :param row_id: id of the row
+    :param expected_version: version the caller read, None to update any version
+    :param values: new column values
+    :return: updated row as record_type, None if the row does not exist
+    :raises VersionConflict: if the row is not at expected_version anymore
+    """
+    table = model.__table__
+    condition = table.c.id == row_id
+    if expected_version is not None:
+        condition = and_(condition, table.c.version == expected_version)
+    values['version'] = table.c.version + 1
+    row = DB.session.execute(table.update().where(condition).values(**values).returning(
+        *[table.c[field] for field in record_type._fields])).first()
+    if row is None:
+        if expected_version is not None and DB.session.query(
+                DB.session.query(model.id).filter(model.id == row_id).exists()).scalar():
+            raise VersionConflict("{0} {1} is not at version {2} anymore".format(
+                model.__name__, row_id, expected_version))
+        return None
+    expire_loaded(model, [row_id])
+    return record_type._make(row)
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+"""
+events.py has the fan-out of the student and class change events behind the
+/events Server-Sent Events stream: an in-process broker delivering every
+event to the subscribed streams of this process, and a PostgreSQL
+LISTEN/NOTIFY listener feeding it the events committed by any process
+"""
+
+import collections
+import itertools
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+# SSE event type telling the client it missed events and has to reload
+RESYNC_EVENT = 'resync'
+
+
+class Subscription():
+    """
+    Queue of the events delivered to one stream, only those touching one of
+    class_ids when they are given
+    """
+
+    def __init__(self, class_ids, max_queued):
+        """
+        :param class_ids: only deliver events of these classes (None for the
+                          unassigned students), None for all events
+        :param max_queued: events queued before the subscription is overflowed
+        """
+        self.class_ids = None if class_ids is None else frozenset(class_ids)
+        self.events = queue.Queue(max_queued)
+        self.overflowed = False
+
+    def matches(self, class_ids):
+        """
+        :param class_ids: classes touched by an event, empty for events of every page
+        :return: True if the event is delivered to this subscription
+        """
+        return self.class_ids is None or not class_ids or not self.class_ids.isdisjoint(class_ids)
+
+    def offer(self, event):
+        """
+        Queues event without blocking the publisher, a subscription which
+        falls behind is overflowed and its stream asks the client to resync
+        :param event: (id, type, class_ids, data)
+        :return:
+        """
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """
+        :param timeout: seconds to wait
+        :return: next event, None on timeout
+        """
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBroker():
+    """
+    Thread safe in-process fan-out of events to subscriptions. Events get
+    ids '<broker instance>-<sequence>-<unix ms>' and the latest history_size
+    are kept, so a client reconnecting with Last-Event-ID gets what it
+    missed. When it reconnects to another process, which got the same
+    notifications at about the same time, the events since replay_overlap_ms
+    before its last one are replayed, some of them possibly twice
+    """
+
+    def __init__(self, history_size, max_queued, replay_overlap_ms=2000):
+        """
+        :param history_size: number of recent events kept for reconnecting clients
+        :param max_queued: events queued per subscription
+        :param replay_overlap_ms: replay window before the last event seen in another process
+        """
+        self.instance = '{0:x}{1:x}'.format(os.getpid(), int(time.time() * 1000))
+        self.max_queued = max_queued
+        self.replay_overlap_ms = replay_overlap_ms
+        self.published = 0
+        # events published before are unknown, e.g. before the listener connected
+        self.complete_since_ms = int(time.time() * 1000)
+        self._sequence = itertools.count(1)
+        # (sequence, unix ms, event)
+        self._history = collections.deque(maxlen=history_size)
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def publish(self, event_type, class_ids, data):
+        """
+        :param event_type: SSE event type
+        :param class_ids: classes touched by the event (None for unassigned students)
+        :param data: json serializable event data
+        :return: id of the event
+        """
+        with self._lock:
+            sequence = next(self._sequence)
+            published_ms = int(time.time() * 1000)
+            event_id = '{0}-{1}-{2}'.format(self.instance, sequence, published_ms)
+            event = (event_id, event_type, frozenset(class_ids), data)
+            self._history.append((sequence, published_ms, event))
+            self.published += 1
+            subscriptions = [subscription for subscription in self._subscriptions
+                             if subscription.matches(event[2])]
+        for subscription in subscriptions:
+            subscription.offer(event)
+        return event_id
+
+    def subscribe(self, class_ids=None, last_event_id=None):
+        """
+        :param class_ids: only deliver events of these classes, None for all events
+        :param last_event_id: Last-Event-ID sent by a reconnecting client
+        :return: Subscription, already overflowed if the events after
+                 last_event_id are no longer known
+        """
+        subscription = Subscription(class_ids, self.max_queued)
+        with self._lock:
+            if last_event_id:
+                missed = self._missed_events(last_event_id)
+                if missed is None:
+                    subscription.overflowed = True
+                for event in missed or ():
+                    if subscription.matches(event[2]):
+                        subscription.offer(event)
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def _missed_events(self, last_event_id):
+        """
+        must be called with the lock held
+        :param last_event_id: id of the last event the client got
+        :return: list of the events after it, None if they are no longer known
+        """
+        try:
+            instance, sequence, published_ms = last_event_id.split('-')
+            sequence, published_ms = int(sequence), int(published_ms)
+        except ValueError:
+            return None
+        if instance == self.instance:
+            if sequence + 1 < self._sequence_floor():
+                return None
+            return [event for event_sequence, _, event in self._history
+                    if event_sequence > sequence]
+        since_ms = published_ms - self.replay_overlap_ms
+        if since_ms < self._time_floor():
+            return None
+        return [event for _, event_ms, event in self._history if event_ms > since_ms]
+
+    def _sequence_floor(self):
+        """
+        must be called with the lock held
+        :return: sequence of the oldest event kept, 1 while none was dropped
+        """
+        return self._history[0][0] if len(self._history) == self._history.maxlen else 1
+
+    def _time_floor(self):
+        """
+        must be called with the lock held
+        :return: unix ms since which every event is kept
+        """
+        if len(self._history) == self._history.maxlen:
+            return max(self.complete_since_ms, self._history[0][1])
+        return self.complete_since_ms
+
+    def unsubscribe(self, subscription):
+        """
+        :param subscription: Subscription returned by subscribe
+        :return:
+        """
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    @property
+    def stats(self):
+        """
+        :return: number of subscriptions and of published events
+        """
+        with self._lock:
+            return {'subscriptions': len(self._subscriptions), 'published': self.published}
+
+
+def encode_notification(event_type, class_ids, data):
+    """
+    :param event_type: SSE event type
+    :param class_ids: classes touched by the event
+    :param data: json serializable event data
+    :return: NOTIFY payload
+    """
+    return json.dumps([event_type, list(class_ids), data], separators=(',', ':'))
+
+
+def format_event(event):
+    """
+    :param event: (id, type, class_ids, data)
+    :return: the event in the text/event-stream format
+    """
+    event_id, event_type, _, data = event
+    return 'id: {0}\nevent: {1}\ndata: {2}\n\n'.format(event_id, event_type, json.dumps(data))
+
+
+class PostgresListener():
+    """
+    Daemon thread LISTENing on a channel on its own connection and publishing
+    every notification to the broker, so all the streams of a process share
+    one database connection whatever their number. Started on first use
+    and reconnecting with a delay if the connection is lost
+    """
+
+    def __init__(self, broker, connect, channel, reconnect_seconds=5):
+        """
+        :param broker: EventBroker
+        :param connect: function returning a new psycopg2 connection
+        :param channel: NOTIFY channel
+        :param reconnect_seconds: delay before reconnecting after an error
+        """
+        self.broker = broker
+        self.connect = connect
+        self.channel = channel
+        self.reconnect_seconds = reconnect_seconds
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts the listening thread once per process
+        :return:
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='events-listener',
+                                                daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        """
+        thread body
+        """
+        while True:
+            listening = []
+            try:
+                self._listen(listening)
+            except Exception as exception:  # pylint: disable=broad-except
+                logging.warning("Event listener failed due to %s, reconnecting", exception)
+            if listening:
+                # events committed while disconnected are lost, streams have to resync
+                self.broker.publish(RESYNC_EVENT, (), {})
+            time.sleep(self.reconnect_seconds)
+
+    def _listen(self, listening):
+        """
+        Waits for notifications until the connection fails
+        :param listening: list appended to once LISTEN succeeded
+        """
+        connection = self.connect()
+        try:
+            # the pool may have pinged it, which opened a transaction
+            connection.rollback()
+            connection.autocommit = True
+            cursor = connection.cursor()
+            cursor.execute('LISTEN "{0}"'.format(self.channel))
+            cursor.close()
+            listening.append(True)
+            self.broker.complete_since_ms = int(time.time() * 1000)
+            while True:
+                if select.select([connection], [], [], 60) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notification = connection.notifies.pop(0)
+                    try:
+                        event_type, class_ids, data = json.loads(notification.payload)
+                    except ValueError:
+                        logging.warning("Ignoring malformed event %s", notification.payload)
+                        continue
+                    self.broker.publish(event_type, class_ids, data)
+        finally:
+            connection.close()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+exporter.py has generators which turn streamed rows into CSV / NDJSON
+chunks (optionally gzip compressed) for the export endpoints
+"""
+
+import csv
+import datetime
+import io
+import json
+import zlib
+
+CSV_FORMAT = 'csv'
+NDJSON_FORMAT = 'ndjson'
+MIMETYPES = {CSV_FORMAT: 'text/csv', NDJSON_FORMAT: 'application/x-ndjson'}
+
+
+def _to_json_value(value):
+    """
+    :param value: column value
+    :return: value which json can serialize
+    """
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(header, rows, flush_rows=1000):
+    """
+    :param header: list of column names
+    :param rows: iterable of row tuples in header order
+    :param flush_rows: number of rows written per yielded chunk
+    :return: generator of CSV text chunks, starting with the header row
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(['' if value is None else _to_json_value(value) for value in row])
+        if count % flush_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(header, rows, flush_rows=1000):
+    """
+    :param header: list of column names
+    :param rows: iterable of row tuples in header order
+    :param flush_rows: number of rows written per yielded chunk
+    :return: generator of NDJSON text chunks, one object per row
+    """
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({key: _to_json_value(value) for key, value in zip(header, row)}))
+        if len(lines) >= flush_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def iter_gzip(chunks, level=6):
+    """
+    :param chunks: iterable of text chunks
+    :param level: compression level
+    :return: generator of gzip compressed byte chunks
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
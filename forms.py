@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+"""
+forms.py has the parsing of the fields the form and JSON endpoints receive
+"""
+
+import datetime
+
+DATETIME_INPUT_FORMATS = ('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f')
+
+
+def parse_datetime(value):
+    """
+    :param value: date or datetime in ISO 8601 format, or None
+    :return: datetime, None for an empty value
+    :raises ValueError: if value is not in one of DATETIME_INPUT_FORMATS
+    """
+    if not value:
+        return None
+    for datetime_format in DATETIME_INPUT_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, datetime_format)
+        except ValueError:
+            pass
+    raise ValueError("Invalid date {0}".format(value))
+
+
+def parse_version(value):
+    """
+    :param value: version of a student or class the client read, or None
+    :return: int, None for an empty value
+    :raises ValueError: if value is not an integer
+    """
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError) as exception:
+        raise ValueError("Invalid version {0}".format(value)) from exception
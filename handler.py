@@ -3,29 +3,68 @@
 handler.py has different Class which deals with APIs of Student and StudentClass
 """
 
+import datetime
 import logging
-from flask import request, render_template
-import sqlalchemy
-import sqlalchemy_utils
-from models import DB as db, APP as app
+import time
+import uuid
+from flask import request, render_template, Response, stream_with_context, g, Markup, url_for
+from models import APP as app
 from models import StudentDAO
 from models import StudentClassDAO
+from forms import parse_datetime, parse_version
+from batch import BATCH_OPERATIONS, apply_batch_operation, batch_failure
+from middleware import (RENDER_CACHE, EVENT_STREAMS, METRICS_SNAPSHOTS, PROFILER, cached_page,
+                        transactional, admitted)
 import models
+import importer
+import exporter
+import events
+import manage
+import metrics
 import configuration as CONFIGURATION
 
-PRODUCTION_MODE_URL = None
 
-db.init_app(app)
+def render_class_options():
+    """
+    Renders the <option> list of every class once per data version
+    :return: Markup of the options
+    """
+    key = ('class_options', models.DATA_VERSION.value)
+    return RENDER_CACHE.get_or_load(key, lambda: Markup(render_template(
+        'class_options.html', class_options=StudentClassDAO.get_all_classes())))
+
+
+def get_page_size():
+    """
+    Reads the page_size query argument and clamps it to the configured limits
+    :return: page size
+    """
+    page_size = request.args.get('page_size', type=int) or CONFIGURATION.DEFAULT_PAGE_SIZE
+    return max(1, min(page_size, CONFIGURATION.MAX_PAGE_SIZE))
+
+
+def include_archived():
+    """
+    Reads the include_archived query argument, the lists only have the
+    active students otherwise
+    :return: True to also list the archived students
+    """
+    return request.args.get('include_archived') in ('1', 'true')
+
 
 @app.route('/')
+@cached_page
 def show_all():
     """
-    Fetches all the students and class from db using DAO
-    and render it on UI
+    Fetches one page of classes and one page of the unassigned students from
+    db using DAO, each with its own cursor, and render it on UI
     :return:
     """
-    all_classes = []
-    all_students = []
+    page_classes = []
+    class_options_html = ''
+    unassigned_students = []
+    next_unassigned_cursor = None
+    next_class_cursor = None
     studentdao_xsrf_token = None
     studentclassdao_xsrf_token = None
     try:
@@ -33,16 +72,181 @@ def show_all():
             message=StudentDAO.XSRF_TOKEN_MESSAGE)
         studentclassdao_xsrf_token = models.XSRFToken.create_xsrf_token(
             message=StudentClassDAO.XSRF_TOKEN_MESSAGE)
-        all_students = StudentDAO.get_all_students()
-        all_classes = StudentClassDAO.get_all_classes()
+        unassigned_students, next_unassigned_cursor = StudentDAO.get_unassigned_students_page(
+            cursor=request.args.get('unassigned_cursor'), page_size=get_page_size())
+        page_classes, next_class_cursor = StudentClassDAO.get_classes_page(
+            cursor=request.args.get('class_cursor'), page_size=get_page_size())
+        class_options_html = render_class_options()
         logging.info("Successfully fetched data")
     except Exception as exception:  # pylint: disable=broad-except
+        g.skip_render_cache = True
         logging.warning("Failed to load data due to %s", exception)
-    return render_template('HomePage.html', students=all_students,
-                           std_class=all_classes, studentdao_xsrf_token=studentdao_xsrf_token,
-                           studentclassdao_xsrf_token=studentclassdao_xsrf_token)
+    return render_template('HomePage.html', unassigned_students=unassigned_students,
+                           std_class=page_classes, class_options_html=class_options_html,
+                           next_unassigned_cursor=next_unassigned_cursor,
+                           next_class_cursor=next_class_cursor,
+                           studentdao_xsrf_token=studentdao_xsrf_token,
+                           studentclassdao_xsrf_token=studentclassdao_xsrf_token,
+                           events_busy_retry_ms=CONFIGURATION.EVENTS_BUSY_RETRY_MILLISECONDS)
+
+
+@app.route('/api/students', methods=['GET'])
+def list_students():
+    """
+    GET method to list students page by page, pass next_cursor of the
+    response as cursor to fetch the following page
+    :return: page of students along with next_cursor and status code
+    """
+    try:
+        students, next_cursor = StudentDAO.get_students_page(
+            cursor=request.args.get('cursor'), page_size=get_page_size(),
+            include_archived=include_archived())
+    except ValueError as exception:
+        logging.error("Failed to list students due to %s", exception)
+        return ({'message': 'Invalid cursor'}, 400)
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to list students due to %s", exception)
+        return ({'message': 'Failed to list students'}, 400)
+    return ({'students': [student.serialize for student in students],
+             'next_cursor': next_cursor}, 200)
+
+
+@app.route('/api/classes', methods=['GET'])
+def list_classes():
+    """
+    GET method to list classes page by page, pass next_cursor of the
+    response as cursor to fetch the following page
+    :return: page of classes along with next_cursor and status code
+    """
+    try:
+        classes, next_cursor = StudentClassDAO.get_classes_page(
+            cursor=request.args.get('cursor'), page_size=get_page_size())
+    except ValueError as exception:
+        logging.error("Failed to list classes due to %s", exception)
+        return ({'message': 'Invalid cursor'}, 400)
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to list classes due to %s", exception)
+        return ({'message': 'Failed to list classes'}, 400)
+    return ({'classes': [std_class.serialize for std_class in classes],
+             'next_cursor': next_cursor}, 200)
+
+@app.route('/api/classes/<class_id>', methods=['GET'])
+def get_class(class_id):
+    """
+    GET method to get a class with its leader
+    :param class_id:
+    :return: class with its leader (None if it has none) along with status code
+    """
+    try:
+        view = StudentClassDAO.get_course_view(str(uuid.UUID(class_id)), with_students=False)
+    except ValueError:
+        view = None
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to get class %s due to %s", class_id, exception)
+        return ({'message': 'Failed to get class'}, 400)
+    if view is None:
+        return ({'message': 'Class not found'}, 404)
+    response = view.course.serialize
+    response['leader'] = view.leader.serialize if view.leader else None
+    return (response, 200)
+
+@app.route('/api/classes/<class_id>/students', methods=['GET'])
+def list_roster(class_id):
+    """
+    GET method to list the students of a class
+    :param class_id:
+    :return: students of the class along with status code
+    """
+    try:
+        class_id = str(uuid.UUID(class_id))
+    except ValueError:
+        return ({'message': 'Class not found'}, 404)
+    try:
+        students = StudentDAO.get_student_records_by_class_id(class_id, include_archived())
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to list the students of class %s due to %s", class_id, exception)
+        return ({'message': 'Failed to list students'}, 400)
+    return ({'students': [student.serialize for student in students]}, 200)
+
+@app.route('/api/classes/stats', methods=['GET'])
+def list_class_statistics():
+    """
+    GET method returning the enrollment count and latest enrollment time of
+    every class, and the number of students without class
+    :return: class statistics along with status code
+    """
+    try:
+        classes, unassigned = models.ClassStatisticsDAO.get_class_statistics()
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to get class statistics due to %s", exception)
+        return ({'message': 'Failed to get class statistics'}, 400)
+    return ({'classes': [record.serialize for record in classes],
+             'unassigned_count': unassigned}, 200)
+
+@app.route('/events', methods=['GET'])
+def stream_events():
+    """
+    GET method streaming the student and class changes as Server-Sent
+    Events, only those of the course_id classes (and of the students without
+    class with unassigned=1) when given. The stream ends after
+    EVENTS_STREAM_SECONDS, the browser then reconnects with Last-Event-ID
+    and gets the events it missed, or a resync event when they are unknown.
+    A worker streaming EVENTS_MAX_STREAMS already answers 503 with a retry
+    delay, the page then reconnects with last_event_id in the query
+    :return: text/event-stream response
+    """
+    class_ids = None
+    if request.args.get('course_id') or request.args.get('unassigned'):
+        try:
+            class_ids = {str(uuid.UUID(course_id))
+                         for course_id in request.args.getlist('course_id')}
+        except ValueError:
+            return ({'message': 'Invalid course id'}, 400)
+        if request.args.get('unassigned') in ('1', 'true'):
+            class_ids.add(None)
+    # the stream holds its thread until it ends, beyond EVENTS_MAX_STREAMS the client retries
+    if EVENT_STREAMS.acquire(request.remote_addr) is not None:
+        logging.warning("Rejected event stream of %s: %s streams open", request.remote_addr,
+                        EVENT_STREAMS.stats['running'])
+        response = Response('retry: {0}\n\n'.format(CONFIGURATION.EVENTS_BUSY_RETRY_MILLISECONDS),
+                            status=503, mimetype='text/event-stream')
+        response.headers['Retry-After'] = str(CONFIGURATION.EVENTS_BUSY_RETRY_MILLISECONDS // 1000)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    try:
+        subscription = models.subscribe_events(
+            class_ids=class_ids,
+            last_event_id=request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to subscribe to events due to %s", exception)
+        EVENT_STREAMS.release()
+        return ({'message': 'Failed to subscribe to events'}, 400)
+
+    def generate():
+        try:
+            yield 'retry: {0}\n\n'.format(CONFIGURATION.EVENTS_RETRY_MILLISECONDS)
+            deadline = time.monotonic() + CONFIGURATION.EVENTS_STREAM_SECONDS
+            while not subscription.overflowed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                event = subscription.get(min(remaining, CONFIGURATION.EVENTS_HEARTBEAT_SECONDS))
+                yield events.format_event(event) if event else ': keepalive\n\n'
+            yield 'event: {0}\ndata: {{}}\n\n'.format(events.RESYNC_EVENT)
+        finally:
+            models.EVENT_BROKER.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    # also called when the client went away before the stream started
+    response.call_on_close(EVENT_STREAMS.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    # proxies must not buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/add_student', methods=['POST'])
+@admitted('write')
+@transactional
 def add_student():
     """
     POST method use to add student in the db using StudentDAO
@@ -66,6 +270,8 @@ def add_student():
     return ({'message': 'Bad request'}, 404)
 
 @app.route('/delete_student', methods=['POST'])
+@admitted('write')
+@transactional
 def delete_student():
     """
     POST method to delete a existing student from db
@@ -89,6 +295,8 @@ def delete_student():
     return ({'message': 'Bad request'}, 404)
 
 @app.route('/update_student', methods=['PUT'])
+@admitted('write')
+@transactional
 def update_student():
     """
     PUT method to update existing student from db
@@ -104,15 +312,21 @@ def update_student():
             student_id = request.form.get('student_id')
             course_id = request.form.get('course_id')
             student_name = request.form.get('student_name')
-            StudentDAO.update_student(student_id, student_name)
+            StudentDAO.update_student(student_id, student_name,
+                                      parse_version(request.form.get('version')))
             logging.info("Successfully updated the student details of course %s", course_id)
             return ({'message':'Student updated successfully'}, 200)
+        except models.VersionConflict as exception:
+            logging.warning("Failed to updated the student details due to %s", exception)
+            return ({'message':'Student was changed by someone else'}, 409)
         except Exception as exception:  # pylint: disable=broad-except
             logging.error("Failed to updated the student details due to %s", exception)
             return ({'message':'Failed to update student'}, 400)
     return ({'message': 'Bad request'}, 404)
 
 @app.route('/assign_students', methods=['POST'])
+@admitted('bulk')
+@transactional
 def assign_class_to_students():
     """
     POST method to assign student to the class
@@ -121,20 +335,93 @@ def assign_class_to_students():
     if request.method == 'POST':
         req_dict = request.form.to_dict()
         response = {}
-        for student_details in req_dict:
-            student_id = student_details
-            try:
-                course_id = req_dict[student_details]
-                StudentDAO.assign_class(class_id=course_id, student_id=student_id)
-                logging.info("Class assigned to %s successfully", student_id)
+        try:
+            assigned = StudentDAO.assign_classes(req_dict)
+        except Exception as excpetion:  # pylint: disable=broad-except
+            assigned = dict.fromkeys(req_dict, False)
+            logging.error("Failed to assign classes due to %s", excpetion)
+        for student_id, success in assigned.items():
+            if success:
                 response[student_id] = "Class assigned successfully"
-            except Exception as excpetion:  # pylint: disable=broad-except
+            else:
                 response[student_id] = "Failed to assign class"
-                logging.error("Failed to assign class to %s due to %s", student_id, excpetion)
+                logging.error("Failed to assign class to %s", student_id)
+        logging.info("Class assigned to %s students successfully",
+                     sum(1 for success in assigned.values() if success))
         return ({'message':response}, 200)
 
     return ({'message': 'Bad request'}, 404)
+
+@app.route('/delete_students', methods=['POST'])
+@admitted('bulk')
+@transactional
+def delete_students():
+    """
+    POST method to delete many students at once, selected by a JSON list of
+    student_ids and/or class_id, created_after and created_before filters
+    :return: response message with the deleted count along with status code
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return ({'message': 'Expected a JSON object'}, 400)
+    if not models.XSRFToken().generate_and_assert_token(
+            message=StudentDAO.XSRF_TOKEN_MESSAGE, token=payload.get('xsrf_token')):
+        return ({'message': 'Unauthorized Request'}, 401)
+    student_ids = payload.get('student_ids')
+    if student_ids is not None and not isinstance(student_ids, list):
+        return ({'message': 'student_ids must be a list'}, 400)
+    try:
+        deleted, cleared = StudentDAO.delete_students(
+            student_ids=student_ids, class_id=payload.get('class_id'),
+            created_after=parse_datetime(payload.get('created_after')),
+            created_before=parse_datetime(payload.get('created_before')))
+    except ValueError as exception:
+        return ({'message': str(exception)}, 400)
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to delete students due to %s", exception)
+        return ({'message': 'Failed to delete students'}, 400)
+    response = {'message': 'Students deleted successfully', 'deleted': len(deleted),
+                'leaders_cleared': cleared}
+    if student_ids is not None:
+        response['not_found'] = sorted({str(uuid.UUID(str(student_id)))
+                                        for student_id in student_ids} - set(deleted))
+    logging.info("Deleted %s students, cleared %s class leaders", len(deleted), cleared)
+    return (response, 200)
+
+@app.route('/import_students', methods=['POST'])
+@admitted('bulk')
+def import_students():
+    """
+    POST method to bulk import students from a CSV (text/csv) or NDJSON
+    (application/x-ndjson) body, the body is streamed and loaded in batches
+    :return: imported/failed counts with per-row errors along with status code
+    """
+    try:
+        xsrf_token = request.headers.get('X-XSRF-Token') or request.args.get('xsrf_token')
+        if not models.XSRFToken().generate_and_assert_token(
+                message=StudentDAO.XSRF_TOKEN_MESSAGE, token=xsrf_token):
+            return ({'message': 'Unauthorized Request'}, 401)
+
+        lines = importer.iter_lines(request.stream, CONFIGURATION.IMPORT_READ_CHUNK_SIZE)
+        if request.mimetype in importer.CSV_MIMETYPES:
+            rows = importer.iter_csv_rows(lines)
+        elif request.mimetype in importer.NDJSON_MIMETYPES:
+            rows = importer.iter_ndjson_rows(lines)
+        else:
+            return ({'message': 'Unsupported content type'}, 415)
+
+        imported, failed, errors = StudentDAO.import_students(rows)
+        logging.info("Imported %s students, %s rows failed", imported, failed)
+        return ({'message': {'imported': imported, 'failed': failed,
+                             'errors': [{'row': row_number, 'error': error}
+                                        for row_number, error in errors]}}, 200)
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to import students due to %s", exception)
+        return ({'message': 'Failed to import students'}, 400)
+
 @app.route('/add_class', methods=['POST'])
+@admitted('write')
+@transactional
 def add_class():
     """
     POST method to add a class in DB using StudentClassDAO
@@ -157,6 +444,8 @@ def add_class():
     return ({'message': 'Bad request'}, 404)
 
 @app.route('/update_class_details', methods=['PUT'])
+@admitted('write')
+@transactional
 def update_class_details():
     """
     PUT method to update the existing class functionality
@@ -173,62 +462,429 @@ def update_class_details():
             class_id = request.form.get('class_id')
             class_name = request.form.get('class_name')
             class_leader_id = request.form.get('class_leader_id')
-            StudentClassDAO.update_class_details(class_id=class_id, class_name=class_name,
-                                                 class_leader_id=class_leader_id)
+            StudentClassDAO.update_class_details(
+                class_id=class_id, class_name=class_name, class_leader_id=class_leader_id,
+                expected_version=parse_version(request.form.get('version')))
             logging.info("Successfully updated the class details")
             return ({'message':'Class details updated successfully '}, 200)
+        except models.VersionConflict as exception:
+            logging.warning("Failed to update class details due to %s", exception)
+            return ({'message':'Class was changed by someone else'}, 409)
         except Exception as exception:  # pylint: disable=broad-except
             logging.error("Failed to update class details due to %s", exception)
             return ({'message':'Failed to updated class details'}, 400)
 
     return ({'message': 'Bad request'}, 404)
+
+@app.route('/close_class', methods=['PUT'])
+@admitted('write')
+@transactional
+def close_class():
+    """
+    PUT method to close a class, its students are archived by the next
+    archive_students run
+
+    :return: response message along with status code
+    """
+    try:
+        xsrf_token = request.form.get('xsrf_token')
+        if not models.XSRFToken().generate_and_assert_token(
+                message=StudentClassDAO.XSRF_TOKEN_MESSAGE, token=xsrf_token):
+            return ({'message': 'Unauthorized Request'}, 401)
+
+        class_id = request.form.get('class_id')
+        if not StudentClassDAO.close_class(
+                class_id, expected_version=parse_version(request.form.get('version'))):
+            return ({'message': 'Class not found'}, 404)
+        logging.info("Closed class %s", class_id)
+        return ({'message': 'Class closed successfully'}, 200)
+    except models.VersionConflict as exception:
+        logging.warning("Failed to close class due to %s", exception)
+        return ({'message': 'Class was changed by someone else'}, 409)
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to close class due to %s", exception)
+        return ({'message': 'Failed to close class'}, 400)
+
+@app.route('/batch', methods=['POST'])
+@admitted('bulk')
+@transactional
+def apply_batch():
+    """
+    POST method applying a JSON list of add/update/delete/assign operations
+    on students and classes atomically: either all of them are committed in
+    one transaction or none when one fails
+    :return: response message with the result of every operation along with status code
+    """
+    payload = request.get_json(silent=True)
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return ({'message': 'Expected a JSON object with a list of operations'}, 400)
+    if len(operations) > CONFIGURATION.BATCH_MAX_OPERATIONS:
+        return ({'message': 'A batch can have at most {0} operations'.format(
+            CONFIGURATION.BATCH_MAX_OPERATIONS)}, 400)
+
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in BATCH_OPERATIONS:
+            return ({'message': 'Unknown operation', 'index': index}, 400)
+        if not models.XSRFToken().generate_and_assert_token(
+                message=BATCH_OPERATIONS[operation['op']][0], token=operation.get('xsrf_token')):
+            return ({'message': 'Unauthorized Request', 'index': index}, 401)
+
+    results = []
+    for index, operation in enumerate(operations):
+        try:
+            results.append(apply_batch_operation(operation))
+        except Exception as exception:  # pylint: disable=broad-except
+            return batch_failure(index, exception)
+    logging.info("Batch of %s operations applied", len(results))
+    return ({'message': 'Batch applied successfully', 'results': results}, 200)
+
 @app.route('/showCourse/<course_id>', methods=['GET'])
+@cached_page
 def display_course(course_id):
     """
     Get method to get data related to particular class
-    and render it on UI for course
+    and render it on UI for course, the class, its leader and its roster
+    are loaded as read-only rows with one query, and only the first page of
+    unassigned students with another. Only an invalid or unknown course_id is
+    answered with 404, a failure to load the class with 503, and a failure to
+    load the unassigned students renders the page without them
 
     :param course_id:
     :return:
     """
-    if request.method == 'GET':
-        try:
-            studentdao_xsrf_token = models.XSRFToken.create_xsrf_token(
-                message=StudentDAO.XSRF_TOKEN_MESSAGE)
-            studentclassdao_xsrf_token = models.XSRFToken.create_xsrf_token(
-                message=StudentClassDAO.XSRF_TOKEN_MESSAGE)
-            students = StudentDAO.get_students_class_id(class_id=course_id)
-            unassigned_students = StudentDAO.get_all_unassigned_students()
-            selected_class = StudentClassDAO.get_class_by_id(course_id)
-            leader = StudentDAO.get_student_by_id(selected_class.class_leader)
-            logging.info("Successfully fetched data from db")
-        except Exception as exception:  # pylint: disable=broad-except
-            logging.warning("Failed to fetch due to %s", exception)
-    return render_template('course.html', students=students,
-                           std_class=selected_class,
+    unassigned_students = []
+    next_unassigned_cursor = None
+    studentdao_xsrf_token = None
+    studentclassdao_xsrf_token = None
+    try:
+        view = StudentClassDAO.get_course_view(str(uuid.UUID(course_id)))
+    except ValueError:
+        view = None
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to get class %s due to %s", course_id, exception)
+        return ({'message': 'Failed to load class'}, 503)
+    if not view:
+        return ({'message': 'Class not found'}, 404)
+    try:
+        studentdao_xsrf_token = models.XSRFToken.create_xsrf_token(
+            message=StudentDAO.XSRF_TOKEN_MESSAGE)
+        studentclassdao_xsrf_token = models.XSRFToken.create_xsrf_token(
+            message=StudentClassDAO.XSRF_TOKEN_MESSAGE)
+        unassigned_students, next_unassigned_cursor = StudentDAO.get_unassigned_students_page(
+            page_size=get_page_size())
+        logging.info("Successfully fetched data from db")
+    except Exception as exception:  # pylint: disable=broad-except
+        g.skip_render_cache = True
+        logging.warning("Failed to fetch due to %s", exception)
+    return render_template('course.html', students=view.students,
+                           std_class=view.course,
                            un_student=unassigned_students,
+                           next_unassigned_cursor=next_unassigned_cursor,
                            studentdao_xsrf_token=studentdao_xsrf_token,
                            studentclassdao_xsrf_token=studentclassdao_xsrf_token,
-                           leader=leader)
+                           leader=view.leader,
+                           events_busy_retry_ms=CONFIGURATION.EVENTS_BUSY_RETRY_MILLISECONDS)
+
+@app.route('/api/students/unassigned', methods=['GET'])
+def list_unassigned_students():
+    """
+    GET method to list unassigned students page by page, q searches
+    for a case insensitive name prefix
+    :return: page of students along with next_cursor and status code
+    """
+    try:
+        students, next_cursor = StudentDAO.get_unassigned_students_page(
+            cursor=request.args.get('cursor'), page_size=get_page_size(),
+            name_prefix=request.args.get('q'), include_archived=include_archived())
+    except ValueError as exception:
+        logging.error("Failed to list unassigned students due to %s", exception)
+        return ({'message': 'Invalid cursor'}, 400)
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to list unassigned students due to %s", exception)
+        return ({'message': 'Failed to list unassigned students'}, 400)
+    return ({'students': [student.serialize for student in students],
+             'next_cursor': next_cursor}, 200)
+
+@app.route('/api/students/search', methods=['GET'])
+def search_students():
+    """
+    GET method to search students by name, q matches name prefixes and
+    similar names (typos), limit caps the number of ranked results
+    :return: ranked students along with status code
+    """
+    query = request.args.get('q', '')
+    if not query.strip():
+        return ({'message': 'q is required'}, 400)
+    try:
+        results = StudentDAO.search_students(query, limit=request.args.get('limit', type=int))
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to search students due to %s", exception)
+        return ({'message': 'Failed to search students'}, 400)
+    return ({'students': [result.serialize for result in results]}, 200)
+
+def _assign_students_payload(payload):
+    """
+    :param payload: JSON body with assignments, student_id -> class_id
+    :return: json serializable payload of the job
+    :raises ValueError: if the assignments are invalid
+    """
+    assignments = payload.get('assignments')
+    if not isinstance(assignments, dict):
+        raise ValueError("assignments must be an object of student_id -> class_id")
+    # the chunks of the job are assigned apart, a student given twice is
+    # refused here rather than in assign_classes
+    student_ids = set()
+    for student_id in assignments:
+        try:
+            normalized_id = str(uuid.UUID(student_id))
+        except ValueError:
+            continue
+        if normalized_id in student_ids:
+            raise ValueError("Student {0} is assigned more than once".format(student_id))
+        student_ids.add(normalized_id)
+    # a list, jsonb does not keep the order of object keys
+    return {'assignments': [[student_id, class_id]
+                            for student_id, class_id in assignments.items()]}
 
-if __name__ == '__main__':
 
-    PRODUCTION_MODE_URL = CONFIGURATION.ProductionDBServiceURL.get_production_mode_db_url()
-    models.PRODUCTION_URL_FOR_DB = PRODUCTION_MODE_URL
-
-    if not sqlalchemy_utils.functions.database_exists("{0}/{1}".format(
-            PRODUCTION_MODE_URL, CONFIGURATION.DB_NAME)):
-        logging.info("Database not Exists, Creating a"
-                     " database with name %s", CONFIGURATION.DB_NAME)
-        ENGINE = sqlalchemy.create_engine(
-            "{0}".format(PRODUCTION_MODE_URL))
-        CONN = ENGINE.connect()
-        CONN.execute("commit")
-        CONN.execute("create database {0}".format(CONFIGURATION.DB_NAME))
-        CONN.close()
+def _delete_students_payload(payload):
+    """
+    :param payload: JSON body with student_ids, class_id, created_after and created_before
+    :return: json serializable payload of the job
+    :raises ValueError: if an id or a date is invalid
+    """
+    student_ids = payload.get('student_ids')
+    if student_ids is not None:
+        if not isinstance(student_ids, list):
+            raise ValueError("student_ids must be a list")
+        try:
+            student_ids = [str(uuid.UUID(str(student_id))) for student_id in student_ids]
+        except ValueError as exception:
+            raise ValueError("Invalid student id") from exception
+    class_id = payload.get('class_id')
+    if class_id:
+        try:
+            class_id = str(uuid.UUID(str(class_id)))
+        except ValueError as exception:
+            raise ValueError("Invalid class id") from exception
+    job_payload = {'student_ids': student_ids, 'class_id': class_id}
+    for bound in ('created_after', 'created_before'):
+        value = parse_datetime(payload.get(bound))
+        job_payload[bound] = value and value.strftime(models.PageCursor.DATETIME_FORMAT)
+    return job_payload
+
+
+def _archive_students_payload(payload):
+    """
+    :param payload: JSON body with archived_before or older_than_days, and closed_classes
+    :return: json serializable payload of the job
+    :raises ValueError: if the cutoff is invalid
+    """
+    # the cutoff is fixed when the job is queued, a resumed job keeps it
+    archived_before = parse_datetime(payload.get('archived_before'))
+    if archived_before is None and not payload.get('closed_classes_only'):
+        try:
+            days = int(payload.get('older_than_days') or CONFIGURATION.ARCHIVE_AFTER_DAYS)
+        except (TypeError, ValueError) as exception:
+            raise ValueError("older_than_days must be a number of days") from exception
+        archived_before = datetime.datetime.now() - datetime.timedelta(days=days)
+    if archived_before is not None:
+        archived_before = archived_before.strftime(models.PageCursor.DATETIME_FORMAT)
+    return {'archived_before': archived_before,
+            'closed_classes': bool(payload.get('closed_classes', True))}
+
+
+JOB_PAYLOADS = {
+    'assign_students': _assign_students_payload,
+    'delete_students': _delete_students_payload,
+    'archive_students': _archive_students_payload,
+}
+
+
+def build_job_payload(kind, payload):
+    """
+    :param kind: job kind
+    :param payload: JSON body of the job request
+    :return: json serializable payload of the job
+    :raises ValueError: if the parameters of the kind are invalid
+    """
+    if kind not in JOB_PAYLOADS:
+        return {}
+    return JOB_PAYLOADS[kind](payload)
+
+@app.route('/jobs', methods=['POST'])
+@admitted('write')
+def submit_job():
+    """
+    POST method to queue a long bulk operation as a background job, answered
+    at once. The JSON body has the kind, the xsrf_token and the parameters of
+    the kind: assignments (student_id -> class_id) for assign_students, the
+    /delete_students selection for delete_students, archived_before or
+    older_than_days (ARCHIVE_AFTER_DAYS by default), closed_classes and
+    closed_classes_only for archive_students, none for rebuild_stats
+    :return: status of the queued job along with status code and its url
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return ({'message': 'Expected a JSON object'}, 400)
+    if not models.XSRFToken().generate_and_assert_token(
+            message=StudentDAO.XSRF_TOKEN_MESSAGE, token=payload.get('xsrf_token')):
+        return ({'message': 'Unauthorized Request'}, 401)
+    kind = payload.get('kind')
+    try:
+        job = models.JobDAO.create_job(kind, build_job_payload(kind, payload))
+    except ValueError as exception:
+        return ({'message': str(exception)}, 400)
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to queue %s job due to %s", kind, exception)
+        return ({'message': 'Failed to queue job'}, 400)
+    models.JOB_RUNNER.start()
+    models.JOB_RUNNER.wake()
+    logging.info("Queued %s job %s", kind, job.id)
+    return (job.serialize, 202, {'Location': url_for('get_job', job_id=job.id)})
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """
+    GET method to list the latest background jobs, optionally in one state
+    :return: jobs along with status code
+    """
+    try:
+        found = models.JobDAO.get_jobs(state=request.args.get('state'),
+                                       limit=min(request.args.get('limit', type=int) or
+                                                 CONFIGURATION.JOB_LIST_LIMIT,
+                                                 CONFIGURATION.JOB_LIST_LIMIT))
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to list jobs due to %s", exception)
+        return ({'message': 'Failed to list jobs'}, 400)
+    return ({'jobs': [job.serialize for job in found]}, 200)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    GET method to poll the state and progress of a background job
+    :param job_id:
+    :return: job status along with status code
+    """
+    try:
+        job = models.JobDAO.get_job(job_id)
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to get job %s due to %s", job_id, exception)
+        return ({'message': 'Failed to get job'}, 400)
+    if job is None:
+        return ({'message': 'Job not found'}, 404)
+    return (job.serialize, 200)
+
+@app.route('/metrics', methods=['GET'])
+def show_metrics():
+    """
+    GET method exposing the metrics in the Prometheus text format, summed
+    over the worker processes when METRICS_DIR is set, otherwise those of
+    the worker process answering
+    :return: metrics response
+    """
+    families = None
+    if METRICS_SNAPSHOTS is not None:
+        try:
+            families = METRICS_SNAPSHOTS.collect(metrics.REGISTRY)
+        except Exception as exception:  # pylint: disable=broad-except
+            logging.warning("Serving the metrics of this worker only due to %s", exception)
+    return Response(metrics.REGISTRY.render(families), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/queries', methods=['GET'])
+def show_query_reports():
+    """
+    GET method listing the SQL reports of the latest requests of this worker,
+    available when query profiling is enabled
+    :return: reports along with status code
+    """
+    if not PROFILER:
+        return ({'message': 'Query profiling is disabled'}, 404)
+    return ({'reports': PROFILER.get_reports()}, 200)
+
+def get_export_format():
+    """
+    :return: format of the format query argument (csv or ndjson, csv by
+             default), None when it is not supported
+    """
+    export_format = request.args.get('format', exporter.CSV_FORMAT)
+    return export_format if export_format in exporter.MIMETYPES else None
+
+def export_response(name, columns, export_format, rows):
+    """
+    Builds a streamed attachment response of rows, gzip compressed when gzip=1
+
+    :param name: base file name of the attachment
+    :param columns: column names of rows
+    :param export_format: csv or ndjson, see get_export_format
+    :param rows: iterable of row tuples
+    :return: streamed response
+    """
+    if export_format == exporter.NDJSON_FORMAT:
+        chunks = exporter.iter_ndjson(columns, rows, CONFIGURATION.EXPORT_FLUSH_ROWS)
     else:
-        logging.info("Database Exists.")
+        chunks = exporter.iter_csv(columns, rows, CONFIGURATION.EXPORT_FLUSH_ROWS)
+    mimetype = exporter.MIMETYPES[export_format]
+    filename = '{0}.{1}'.format(name, export_format)
+    if request.args.get('gzip') in ('1', 'true'):
+        chunks = exporter.iter_gzip(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename={0}'.format(filename)
+    return response
+
+@app.route('/export/students', methods=['GET'])
+def export_students():
+    """
+    GET method to stream every student as CSV or NDJSON
+    :return: streamed response
+    """
+    export_format = get_export_format()
+    if not export_format:
+        return ({'message': 'Unsupported export format'}, 400)
+    logging.info("Exporting students")
+    return export_response('students', StudentDAO.EXPORT_COLUMNS, export_format,
+                           StudentDAO.iter_students(include_archived=include_archived()))
+
+@app.route('/export/classes', methods=['GET'])
+def export_classes():
+    """
+    GET method to stream every class as CSV or NDJSON
+    :return: streamed response
+    """
+    export_format = get_export_format()
+    if not export_format:
+        return ({'message': 'Unsupported export format'}, 400)
+    logging.info("Exporting classes")
+    return export_response('classes', StudentClassDAO.EXPORT_COLUMNS, export_format,
+                           StudentClassDAO.iter_classes())
+
+@app.route('/export/roster/<course_id>', methods=['GET'])
+def export_roster(course_id):
+    """
+    GET method to stream the students of a class as CSV or NDJSON
+
+    :param course_id:
+    :return: streamed response
+    """
+    export_format = get_export_format()
+    if not export_format:
+        return ({'message': 'Unsupported export format'}, 400)
+    try:
+        if not StudentClassDAO.get_class_by_id(course_id):
+            return ({'message': 'Class not found'}, 404)
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.error("Failed to export roster of %s due to %s", course_id, exception)
+        return ({'message': 'Failed to export roster'}, 400)
+    logging.info("Exporting roster of %s", course_id)
+    return export_response('roster-{0}'.format(course_id), StudentDAO.EXPORT_COLUMNS,
+                           export_format,
+                           StudentDAO.iter_students(class_id=course_id,
+                                                    include_archived=include_archived()))
 
-    db.create_all()
-    app.run(host='0.0.0.0',debug=True)
-    # app.run(debug=True)
+if __name__ == '__main__':
+    # development server, use `python3 manage.py serve` in production
+    manage.bootstrap_database()
+    app.run(host='0.0.0.0', debug=CONFIGURATION.DEV_SERVER_DEBUG)
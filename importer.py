@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+importer.py has helpers which parse an uploaded CSV / NDJSON student list
+chunk by chunk from the request stream, without buffering the whole body
+"""
+
+import codecs
+import csv
+import json
+from collections import namedtuple
+
+# one parsed row of an upload, error is set when the row could not be parsed
+ImportRow = namedtuple('ImportRow', ['row_number', 'student_name', 'class_id', 'error'])
+
+CSV_MIMETYPES = ('text/csv',)
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonlines')
+
+
+def iter_lines(stream, chunk_size=64 * 1024):
+    """
+    Reads stream chunk by chunk and yields decoded lines (line endings kept)
+
+    :param stream: binary file like object e.g. request.stream
+    :param chunk_size: number of bytes read at a time
+    :return: generator of lines
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pending = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + decoder.decode(chunk)).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def iter_csv_rows(lines):
+    """
+    Parses CSV lines having a header row with student_name (or name) and class_id
+
+    :param lines: iterable of lines
+    :return: generator of ImportRow
+    """
+    reader = csv.DictReader(lines)
+    row_number = 0
+    while True:
+        row_number += 1
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as exception:
+            yield ImportRow(row_number, None, None, str(exception))
+            continue
+        yield ImportRow(row_number, record.get('student_name', record.get('name')),
+                        record.get('class_id'), None)
+
+
+def iter_ndjson_rows(lines):
+    """
+    Parses NDJSON lines where every line is an object with student_name (or name)
+    and class_id, blank lines are ignored
+
+    :param lines: iterable of lines
+    :return: generator of ImportRow
+    """
+    for row_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("Expected a JSON object")
+        except ValueError as exception:
+            yield ImportRow(row_number, None, None, str(exception))
+            continue
+        yield ImportRow(row_number, record.get('student_name', record.get('name')),
+                        record.get('class_id'), None)
@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+"""
+job_dao.py has the job table, the steps of every job kind and the DAO claiming and
+running the jobs for the worker pool of jobs.py
+"""
+
+import collections
+import datetime
+import logging
+import uuid
+from sqlalchemy import and_, func, text
+from sqlalchemy.orm import defer
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+import configuration as CONFIGURATION
+import jobs
+from database import APP, DB, Base, uuid7, unit_of_work, PageCursor
+from classes import ClassStatisticsDAO
+from student_dao import StudentDAO
+
+
+class Job(DB.Model, Base):
+    """
+        A background job, persisted so it survives restarts of the workers.
+        Attributes:
+            id (uuid): ID of job.
+            kind (string): one of JOB_KINDS.
+            state (string): queued, running, succeeded or failed.
+            payload (json): parameters of the job.
+            checkpoint (json): position reached by the job, it resumes from there.
+            total (int): number of items to process, estimated for some kinds.
+            processed (int): number of items processed so far.
+            result (json): counters of the job, updated at every checkpoint.
+            error (string): why the job failed.
+            attempts (int): number of times the job was claimed by a worker.
+            owner (string): token of the worker running the job.
+            created_on, started_on, finished_on (datetime): job lifecycle.
+            updated_on (datetime): last checkpoint or heartbeat of a running job.
+    """
+    __tablename__ = 'job'
+    id = DB.Column(UUID, primary_key=True, default=uuid7)
+    kind = DB.Column(DB.String(50), nullable=False)
+    state = DB.Column(DB.String(20), nullable=False)
+    payload = DB.Column(JSONB, nullable=False)
+    checkpoint = DB.Column(JSONB, nullable=True)
+    total = DB.Column(DB.Integer, nullable=True)
+    processed = DB.Column(DB.Integer, nullable=False, default=0)
+    result = DB.Column(JSONB, nullable=True)
+    error = DB.Column(DB.Text, nullable=True)
+    attempts = DB.Column(DB.Integer, nullable=False, default=0)
+    owner = DB.Column(DB.String(50), nullable=True)
+    created_on = DB.Column(DB.DateTime, nullable=False)
+    started_on = DB.Column(DB.DateTime, nullable=True)
+    finished_on = DB.Column(DB.DateTime, nullable=True)
+    updated_on = DB.Column(DB.DateTime, nullable=True)
+    __table_args__ = (
+        # workers look for the oldest queued (or stale running) job
+        DB.Index('ix_job_state_created_on', 'state', 'created_on'),
+    )
+
+    @property
+    def serialize(self):
+        """
+        :return: json serializable dict of the job status, without its payload
+        """
+        return {
+            'id': str(self.id),
+            'kind': self.kind,
+            'state': self.state,
+            'total': self.total,
+            'processed': self.processed,
+            'progress': round(min(self.processed / self.total, 1.0), 4)
+                        if self.total else None,
+            'result': self.result,
+            'error': self.error,
+            'attempts': self.attempts,
+            'created_on': self.created_on.isoformat() if self.created_on else None,
+            'started_on': self.started_on.isoformat() if self.started_on else None,
+            'finished_on': self.finished_on.isoformat() if self.finished_on else None,
+            'updated_on': self.updated_on.isoformat() if self.updated_on else None,
+        }
+
+
+def _merge_job_result(result, delta):
+    """
+    :param result: counters of a job, updated in place
+    :param delta: counters of one chunk, numbers are added and lists
+                  appended up to JOB_MAX_REPORTED_IDS
+    :return: result
+    """
+    for key, value in delta.items():
+        if isinstance(value, list):
+            reported = result.setdefault(key, [])
+            reported.extend(value[:max(0, CONFIGURATION.JOB_MAX_REPORTED_IDS - len(reported))])
+        else:
+            result[key] = result.get(key, 0) + value
+    return result
+
+
+def _parse_job_datetime(value):
+    """
+    :param value: datetime of a job payload, in the PageCursor.DATETIME_FORMAT
+    :return: datetime, None for None
+    """
+    return datetime.datetime.strptime(value, PageCursor.DATETIME_FORMAT) if value else None
+
+
+def _count_assign_students(payload):
+    """
+    :param payload: {'assignments': list of [student_id, class_id]}
+    :return: number of students to assign
+    """
+    return len(payload['assignments'])
+
+
+def _step_assign_students(payload, checkpoint, chunk_size):
+    """
+    Assigns the next chunk of the [student_id, class_id] pairs of payload
+    :param payload: {'assignments': list of [student_id, class_id]}
+    :param checkpoint: number of pairs already assigned
+    :param chunk_size:
+    :return: tuple of checkpoint, processed count, result counters and done
+    """
+    offset = checkpoint or 0
+    chunk = payload['assignments'][offset:offset + chunk_size]
+    assigned = StudentDAO.assign_classes(collections.OrderedDict(chunk))
+    failed = [student_id for student_id, success in assigned.items() if not success]
+    return (offset + len(chunk), len(chunk),
+            {'assigned': len(assigned) - len(failed), 'failed': len(failed),
+             'failed_ids': failed}, offset + len(chunk) >= len(payload['assignments']))
+
+
+def _count_delete_students(payload):
+    """
+    :param payload: delete_students arguments, datetimes in the PageCursor.DATETIME_FORMAT
+    :return: number of students to delete, as selected when the job is queued
+    """
+    if payload.get('student_ids') is not None:
+        return len(payload['student_ids'])
+    return StudentDAO.count_selected_students(
+        payload.get('class_id'), _parse_job_datetime(payload.get('created_after')),
+        _parse_job_datetime(payload.get('created_before')))
+
+
+def _step_delete_students(payload, checkpoint, chunk_size):
+    """
+    Deletes the next chunk of the students selected by payload, a chunk of
+    the given ids or the first matching ids when only filters are given
+    :param payload: delete_students arguments, datetimes in the PageCursor.DATETIME_FORMAT
+    :param checkpoint: number of the given student ids already processed
+    :param chunk_size:
+    :return: tuple of checkpoint, processed count, result counters and done
+    """
+    filters = {'class_id': payload.get('class_id'),
+               'created_after': _parse_job_datetime(payload.get('created_after')),
+               'created_before': _parse_job_datetime(payload.get('created_before'))}
+    if payload.get('student_ids') is not None:
+        offset = checkpoint or 0
+        chunk = payload['student_ids'][offset:offset + chunk_size]
+        done = offset + len(chunk) >= len(payload['student_ids'])
+        offset += len(chunk)
+    else:
+        chunk = StudentDAO.get_selected_student_ids(limit=chunk_size, **filters)
+        done = len(chunk) < chunk_size
+        offset = None
+    if not chunk:
+        return offset, 0, {}, True
+    deleted, cleared = StudentDAO.delete_students(student_ids=chunk, **filters)
+    missing = sorted({str(uuid.UUID(str(student_id))) for student_id in chunk} - set(deleted))
+    return offset, len(chunk), {'deleted': len(deleted), 'leaders_cleared': cleared,
+                                'not_deleted_ids': missing}, done
+
+
+def _count_archive_students(payload):
+    """
+    :param payload: archive_students arguments, archived_before in the
+                    PageCursor.DATETIME_FORMAT
+    :return: number of students to archive, as selected when the job is queued
+    """
+    return StudentDAO.count_archivable_students(
+        _parse_job_datetime(payload.get('archived_before')), payload.get('closed_classes', True))
+
+
+def _step_archive_students(payload, checkpoint, chunk_size):  # pylint: disable=unused-argument
+    """
+    Archives the next batch of the students selected by payload
+    :param payload: archive_students arguments, archived_before in the
+                    PageCursor.DATETIME_FORMAT
+    :return: tuple of checkpoint, processed count, result counters and done
+    """
+    archived = StudentDAO.archive_students(_parse_job_datetime(payload.get('archived_before')),
+                                           payload.get('closed_classes', True), chunk_size)
+    return None, len(archived), {'archived': len(archived)}, len(archived) < chunk_size
+
+
+def _step_rebuild_stats(payload, checkpoint, chunk_size):  # pylint: disable=unused-argument
+    """
+    Recomputes the class statistics in one step
+    :return: tuple of checkpoint, processed count, result counters and done
+    """
+    return None, 1, {'classes': ClassStatisticsDAO.rebuild()}, True
+
+
+# kind -> (function estimating the items of a payload, function processing one chunk)
+JOB_KINDS = {
+    'assign_students': (_count_assign_students, _step_assign_students),
+    'delete_students': (_count_delete_students, _step_delete_students),
+    'archive_students': (_count_archive_students, _step_archive_students),
+    'rebuild_stats': (lambda payload: 1, _step_rebuild_stats),
+}
+
+
+class JobDAO(Job):
+    """
+        This is a Job Data access object. Job rows are not shown by the cached
+        pages, their changes are committed without bumping DATA_VERSION
+    """
+
+    @staticmethod
+    def create_job(kind, payload):
+        """
+        Queues a job, the workers pick it up from the job table
+        :param kind: one of JOB_KINDS
+        :param payload: json serializable parameters of the job
+        :return: the created Job
+        :raises ValueError: for an unknown kind
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError("Unknown job kind {0}".format(kind))
+        job = Job(kind=kind, state=jobs.QUEUED, payload=payload, processed=0, attempts=0,
+                  total=JOB_KINDS[kind][0](payload), result={},
+                  created_on=datetime.datetime.now())
+        try:
+            DB.session.add(job)
+            DB.session.commit()
+        except Exception:
+            DB.session.rollback()
+            raise
+        return job
+
+    @staticmethod
+    def get_job(job_id):
+        """
+        To get the status of a job, from the primary so progress is never behind
+        :param job_id:
+        :return: Job without its payload loaded, None if it does not exist
+        """
+        try:
+            job_id = str(uuid.UUID(str(job_id)))
+        except ValueError:
+            return None
+        return DB.session.query(Job).options(defer(Job.payload)).get(job_id)
+
+    @staticmethod
+    def get_jobs(state=None, limit=None):
+        """
+        To get the latest jobs
+        :param state: only the jobs in this state
+        :param limit: maximum number of jobs
+        :return: list of Job without their payload loaded, newest first
+        """
+        query = DB.session.query(Job).options(defer(Job.payload))
+        if state:
+            query = query.filter(Job.state == state)
+        return query.order_by(Job.created_on.desc(), Job.id.desc()).limit(
+            limit or CONFIGURATION.JOB_LIST_LIMIT).all()
+
+    @staticmethod
+    def claim_job(owner):
+        """
+        Claims the oldest queued job, or a running one whose worker stopped
+        checkpointing and heartbeating for JOB_STALE_SECONDS (e.g. its process
+        was restarted), SKIP LOCKED lets the workers of every process claim
+        concurrently
+        :param owner: token of the claiming worker
+        :return: id of the claimed job, None if there is none
+        """
+        try:
+            job_id = DB.session.execute(text(
+                "UPDATE job SET state = :running, owner = :owner, attempts = attempts + 1, "
+                "started_on = coalesce(started_on, now()), updated_on = now() "
+                "WHERE id = (SELECT id FROM job WHERE state = :queued OR (state = :running "
+                "AND updated_on < now() - :stale * interval '1 second') "
+                "ORDER BY created_on, id LIMIT 1 FOR UPDATE SKIP LOCKED) RETURNING id"),
+                                        {'running': jobs.RUNNING, 'queued': jobs.QUEUED,
+                                         'owner': owner,
+                                         'stale': CONFIGURATION.JOB_STALE_SECONDS}).scalar()
+            DB.session.commit()
+        except Exception:
+            DB.session.rollback()
+            raise
+        return job_id and str(job_id)
+
+    @staticmethod
+    def heartbeat_job(job_id, owner):
+        """
+        Records that owner still runs the job, in a transaction of its own so
+        a long step of the job does not hold it back
+        :param job_id:
+        :param owner: token of the worker
+        :return: True if owner still runs the job
+        """
+        table = Job.__table__
+        try:
+            updated = DB.session.execute(table.update().where(and_(
+                table.c.id == job_id, table.c.owner == owner,
+                table.c.state == jobs.RUNNING)).values(updated_on=func.now())).rowcount
+            DB.session.commit()
+        except Exception:
+            DB.session.rollback()
+            raise
+        return bool(updated)
+
+    @staticmethod
+    def _update_owned_job(job_id, owner, **values):
+        """
+        Updates a job in the current transaction if owner still runs it
+        :param job_id:
+        :param owner: token of the worker
+        :param values: columns to set
+        :return:
+        :raises jobs.JobLost: if another worker claimed the job meanwhile
+        """
+        table = Job.__table__
+        updated = DB.session.execute(table.update().where(and_(
+            table.c.id == job_id, table.c.owner == owner,
+            table.c.state == jobs.RUNNING)).values(**values)).rowcount
+        if not updated:
+            raise jobs.JobLost("Job {0} is run by another worker".format(job_id))
+
+    @staticmethod
+    def run_job(job_id, owner):
+        """
+        Runs a claimed job from its checkpoint, one JOB_CHUNK_SIZE chunk per
+        transaction: the changes of a chunk and the checkpoint after it are
+        committed together, so a job resumed after a restart redoes nothing
+        :param job_id:
+        :param owner: token of the worker which claimed it
+        :return: final state of the job, None if another worker took it over
+        """
+        job = DB.session.query(Job).get(job_id)
+        kind, payload, attempts = job.kind, job.payload, job.attempts
+        checkpoint, processed, result = job.checkpoint, job.processed, dict(job.result or {})
+        DB.session.commit()
+        try:
+            if attempts > CONFIGURATION.JOB_MAX_ATTEMPTS:
+                raise RuntimeError("Gave up after {0} attempts".format(attempts - 1))
+            step = JOB_KINDS[kind][1]
+            done = False
+            while not done:
+                with unit_of_work():
+                    checkpoint, count, delta, done = step(payload, checkpoint,
+                                                          CONFIGURATION.JOB_CHUNK_SIZE)
+                    processed += count
+                    _merge_job_result(result, delta)
+                    values = {'checkpoint': checkpoint, 'processed': processed,
+                              'result': result, 'updated_on': datetime.datetime.now()}
+                    if done:
+                        values.update(state=jobs.SUCCEEDED, finished_on=values['updated_on'])
+                    JobDAO._update_owned_job(job_id, owner, **values)
+            logging.info("Job %s (%s) succeeded: %s", job_id, kind, result)
+            return jobs.SUCCEEDED
+        except jobs.JobLost as exception:
+            logging.warning("%s", exception)
+            return None
+        except Exception as exception:  # pylint: disable=broad-except
+            logging.error("Job %s (%s) failed due to %s", job_id, kind, exception)
+            return JobDAO._fail_job(job_id, owner, exception)
+
+    @staticmethod
+    def _fail_job(job_id, owner, exception):
+        """
+        Rolls back the chunk which failed and marks the job failed
+        :param job_id:
+        :param owner: token of the worker which claimed it
+        :param exception: exception the job failed with
+        :return: jobs.FAILED, None if another worker took the job over
+        """
+        DB.session.rollback()
+        try:
+            now = datetime.datetime.now()
+            JobDAO._update_owned_job(job_id, owner, state=jobs.FAILED, error=str(exception),
+                                     finished_on=now, updated_on=now)
+            DB.session.commit()
+        except jobs.JobLost:
+            DB.session.rollback()
+            return None
+        return jobs.FAILED
+
+
+JOB_RUNNER = jobs.JobRunner(APP, JobDAO.claim_job, JobDAO.run_job, CONFIGURATION.JOB_WORKERS,
+                            CONFIGURATION.JOB_POLL_SECONDS, JobDAO.heartbeat_job,
+                            CONFIGURATION.JOB_HEARTBEAT_SECONDS, ClassStatisticsDAO.compact)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+jobs.py has the worker pool of the background jobs: a bounded number of
+daemon threads per process claiming the queued jobs from the job table and
+running them, so long bulk operations do not hold an HTTP worker
+"""
+
+import collections
+import logging
+import threading
+import uuid
+
+# job states
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class JobLost(Exception):
+    """
+    Raised when a running job was claimed by another worker, e.g. after its
+    worker stalled for longer than the stale delay
+    """
+
+
+# the settings and hooks of the pool, and the state of its threads
+class JobRunner():  # pylint: disable=too-many-instance-attributes
+    """
+    Pool of worker threads, started on first use. Every worker claims one
+    job at a time (claim returns None when there is nothing to run) and
+    runs it in an app context. Idle workers run the idle housekeeping and
+    poll every poll_seconds, the jobs submitted by this process wake them up
+    at once. While a job runs, a heartbeat thread tells the other workers
+    every heartbeat_seconds that it is still alive, however long its steps take
+    """
+
+    def __init__(self, app, claim, run, workers, poll_seconds,  # pylint: disable=too-many-arguments
+                 heartbeat=None, heartbeat_seconds=None, idle=None):
+        """
+        :param app: flask app
+        :param claim: function taking a worker token and returning the id of
+                      the job it claimed for it, None if there is none
+        :param run: function taking a job id and the worker token, running the
+                    job and returning its final state (None if it was taken over)
+        :param workers: number of worker threads
+        :param poll_seconds: delay between the claims of an idle worker
+        :param heartbeat: function taking a job id and the worker token, called
+                          every heartbeat_seconds while the job runs, None for none
+        :param heartbeat_seconds: delay between the heartbeats of a running job
+        :param idle: function called without arguments by a worker which found no
+                     job to claim, before it waits, None for none
+        """
+        self.app = app
+        self.claim = claim
+        self.run = run
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.heartbeat = heartbeat
+        self.heartbeat_seconds = heartbeat_seconds
+        self.idle = idle
+        self.finished = collections.Counter()
+        self._busy = 0
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts the worker threads once per process
+        :return:
+        """
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            for index in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._work, name='job-worker-{0}'.format(index),
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def wake(self):
+        """
+        Makes the idle workers look for jobs now, e.g. after a job was queued
+        :return:
+        """
+        self._wakeup.set()
+
+    def _work(self):
+        """
+        thread body
+        """
+        while True:
+            try:
+                ran = self._run_next()
+            except Exception as exception:  # pylint: disable=broad-except
+                logging.error("Job worker failed due to %s", exception)
+                ran = False
+            if not ran:
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+
+    def _run_next(self):
+        """
+        :return: True if a job was run
+        """
+        token = uuid.uuid4().hex
+        with self.app.app_context():
+            job_id = self.claim(token)
+            if job_id is None and self.idle is not None:
+                try:
+                    self.idle()
+                except Exception as exception:  # pylint: disable=broad-except
+                    logging.warning("Idle task of the job worker failed due to %s", exception)
+        if job_id is None:
+            return False
+        with self._lock:
+            self._busy += 1
+        stop = threading.Event()
+        beating = None
+        if self.heartbeat is not None:
+            beating = threading.Thread(target=self._beat, args=(job_id, token, stop),
+                                       name='job-heartbeat-{0}'.format(job_id), daemon=True)
+            beating.start()
+        try:
+            with self.app.app_context():
+                state = self.run(job_id, token)
+            if state is not None:
+                with self._lock:
+                    self.finished[state] += 1
+        finally:
+            stop.set()
+            if beating is not None:
+                beating.join()
+            with self._lock:
+                self._busy -= 1
+        return True
+
+    def _beat(self, job_id, token, stop):
+        """
+        heartbeat thread body, until stop is set
+        :param job_id: id of the running job
+        :param token: token of the worker running it
+        :param stop: threading.Event set once the job ended
+        """
+        while not stop.wait(self.heartbeat_seconds):
+            try:
+                with self.app.app_context():
+                    self.heartbeat(job_id, token)
+            except Exception as exception:  # pylint: disable=broad-except
+                logging.warning("Failed to record the heartbeat of job %s due to %s",
+                                job_id, exception)
+
+    @property
+    def stats(self):
+        """
+        :return: number of worker threads and of the ones running a job
+        """
+        with self._lock:
+            return {'workers': len(self._threads), 'busy': self._busy}
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+manage.py has the maintenance commands of the application, e.g.
+
+    python3 manage.py bootstrap-db     create the database and tables once
+    python3 manage.py serve            bootstrap and start the production server
+    python3 manage.py migrate-ids      rewrite existing random ids to time ordered ones
+    python3 manage.py rebuild-stats    recompute the per class statistics
+    python3 manage.py archive-students move old students to the partitioned archive
+    python3 manage.py run-jobs         run background job workers in the foreground
+
+Add --local before the command to use the local db url
+"""
+
+import datetime
+import logging
+import os
+import tempfile
+import time
+import click
+import sqlalchemy
+import sqlalchemy_utils
+import configuration as CONFIGURATION
+import metrics
+
+
+def bootstrap_database():
+    """
+    Creates the database if it does not exist yet and all the tables,
+    run once before the workers are started
+    :return:
+    """
+    import models  # pylint: disable=import-outside-toplevel
+
+    production_mode_url = CONFIGURATION.ProductionDBServiceURL.get_production_mode_db_url()
+
+    if not sqlalchemy_utils.functions.database_exists("{0}/{1}".format(
+            production_mode_url, CONFIGURATION.DB_NAME)):
+        logging.info("Database not Exists, Creating a"
+                     " database with name %s", CONFIGURATION.DB_NAME)
+        engine = sqlalchemy.create_engine(
+            "{0}".format(production_mode_url))
+        conn = engine.connect()
+        conn.execute("commit")
+        conn.execute("create database {0}".format(CONFIGURATION.DB_NAME))
+        conn.close()
+        engine.dispose()
+    else:
+        logging.info("Database Exists.")
+
+    # only the primary, the replicas get the tables through replication
+    models.DB.create_all(bind=None)
+    # tables created by an older version miss the columns and indexes added since
+    with models.DB.engine.connect() as connection:
+        models.upgrade_schema(connection)
+        models.create_search_indexes(connection)
+    if models.ClassStatistics.query.first() is None and models.Student.query.first() is not None:
+        logging.info("Building the class statistics")
+        models.ClassStatisticsDAO.rebuild()
+
+
+@click.group()
+@click.option('--local', '-l', is_flag=True, help='Use the local db url')
+def cli(local):
+    """
+    Maintenance commands of StudentManagement
+    """
+    logging.basicConfig(level=logging.INFO)
+    if local:
+        os.environ.setdefault(CONFIGURATION.DB_URL_ENV_VAR, CONFIGURATION.LOCAL_DB_URL)
+
+
+@cli.command('bootstrap-db')
+def bootstrap_db_command():
+    """
+    Create the database and the tables
+    """
+    bootstrap_database()
+
+
+@cli.command('migrate-ids')
+@click.confirmation_option(prompt='Existing student and class ids (and links using them) '
+                                  'will change, continue?')
+def migrate_ids_command():
+    """
+    Rewrite the random uuid4 ids of existing students and classes to time
+    ordered ids, run with the server stopped. New rows get time ordered ids
+    anyway, the old ones keep working if this is never run
+    """
+    import models  # pylint: disable=import-outside-toplevel
+
+    students, classes = models.migrate_ids_to_uuid7()
+    logging.info("Migrated the ids of %s students and %s classes", students, classes)
+
+
+@cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """
+    Recompute the class statistics from the student table, correcting any
+    drift of the incrementally maintained counters
+    """
+    import models  # pylint: disable=import-outside-toplevel
+
+    written = models.ClassStatisticsDAO.rebuild()
+    logging.info("Rebuilt the statistics of %s classes", written)
+
+
+@cli.command('archive-students')
+@click.option('--older-than-days', default=CONFIGURATION.ARCHIVE_AFTER_DAYS, show_default=True,
+              help='archive the students created before, 0 for no age cutoff')
+@click.option('--closed-classes/--no-closed-classes', default=True, show_default=True,
+              help='archive the students of the closed classes')
+@click.option('--batch-size', default=CONFIGURATION.ARCHIVE_BATCH_SIZE, show_default=True)
+def archive_students_command(older_than_days, closed_classes, batch_size):
+    """
+    Move old students and the students of closed classes to the partitioned
+    student_archive table, batch by batch. Can run while serving, the
+    batches are short transactions skipping the students locked by requests
+    """
+    import models  # pylint: disable=import-outside-toplevel
+
+    archived_before = None
+    if older_than_days:
+        archived_before = datetime.datetime.now() - datetime.timedelta(days=older_than_days)
+    archived = 0
+    while True:
+        batch = models.StudentDAO.archive_students(archived_before, closed_classes, batch_size)
+        archived += len(batch)
+        logging.info("Archived %s students", archived)
+        if len(batch) < batch_size:
+            break
+
+
+@cli.command('run-jobs')
+@click.option('--workers', default=CONFIGURATION.JOB_WORKERS, show_default=True)
+def run_jobs_command(workers):
+    """
+    Run background job workers without serving requests, e.g. as a
+    dedicated process next to the web server. Every server process runs
+    CONFIGURATION.JOB_WORKERS workers too, they share the job table
+    """
+    import models  # pylint: disable=import-outside-toplevel
+
+    models.JOB_RUNNER.workers = workers
+    models.JOB_RUNNER.start()
+    logging.info("Running %s job workers", workers)
+    while True:
+        time.sleep(60)
+
+
+@cli.command('serve')
+@click.option('--processes', default=CONFIGURATION.SERVER_PROCESSES, show_default=True)
+@click.option('--threads', default=CONFIGURATION.SERVER_THREADS, show_default=True)
+def serve_command(processes, threads):
+    """
+    Bootstrap the database once, then replace this process by a pre-forked
+    uwsgi server. lazy-apps makes every worker import the app after the fork,
+    so each one creates its own SQLAlchemy engine and connection pool
+    """
+    import models  # pylint: disable=import-outside-toplevel
+
+    bootstrap_database()
+    # the workers must not share the connections of this process
+    models.DB.engine.dispose()
+    for bind_key in models.REPLICA_BIND_KEYS:
+        models.DB.get_engine(models.APP, bind=bind_key).dispose()
+    os.environ.setdefault(CONFIGURATION.CACHE_INVALIDATION_DIR_ENV_VAR, os.path.join(
+        tempfile.gettempdir(), 'studentmanagement-cache'))
+    os.environ.setdefault(CONFIGURATION.METRICS_DIR_ENV_VAR, os.path.join(
+        tempfile.gettempdir(), 'studentmanagement-metrics'))
+    # the counters start over with the new workers
+    metrics.SnapshotDirectory(os.environ[CONFIGURATION.METRICS_DIR_ENV_VAR],
+                              CONFIGURATION.METRICS_SNAPSHOT_SECONDS).clear()
+    arguments = [
+        'uwsgi',
+        '--http', CONFIGURATION.SERVER_HTTP_ADDRESS,
+        '--module', 'wsgi:application',
+        '--master',
+        '--lazy-apps',
+        '--need-app',
+        '--die-on-term',
+        '--single-interpreter',
+        '--enable-threads',
+        '--processes', str(processes),
+        '--threads', str(threads),
+        '--listen', str(CONFIGURATION.SERVER_LISTEN_BACKLOG),
+        '--harakiri', str(CONFIGURATION.SERVER_HARAKIRI_SECONDS),
+    ]
+    logging.info("Starting %s", ' '.join(arguments))
+    os.execvp(arguments[0], arguments)
+
+
+if __name__ == '__main__':
+    cli()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,471 @@
+#!/usr/bin/env python
+"""
+metrics.py has lightweight in-process counters and histograms for request
+latency, status codes, SQL statements per request, template render time and
+connection pool checkout wait, rendered in the Prometheus text format.
+Every worker process keeps its own metrics, SnapshotDirectory sums those of
+all the worker processes of a server
+"""
+
+import bisect
+import collections
+import json
+import logging
+import os
+import threading
+import time
+import jinja2
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+def _format_labels(labelnames, labels, extra=''):
+    """
+    :param labelnames: names of the labels
+    :param labels: values of the labels
+    :param extra: already formatted extra label e.g. le="0.5"
+    :return: {name="value",...} or empty string
+    """
+    pairs = ['{0}="{1}"'.format(name, str(value).replace('\\', '\\\\').replace(
+        '"', '\\"').replace('\n', '\\n')) for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return '{{{0}}}'.format(','.join(pairs)) if pairs else ''
+
+
+def _format_number(value):
+    """
+    :param value: int or float
+    :return: prometheus representation of value
+    """
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_family(family):
+    """
+    :param family: [name, documentation, type, labelnames, samples] as returned
+                   by the collect methods, samples are [labels, value] and the
+                   value of a histogram is [bounds, bucket counts, sum, count]
+    :return: list of exposition lines
+    """
+    name, documentation, metric_type, labelnames, samples = family
+    lines = ['# HELP {0} {1}'.format(name, documentation),
+             '# TYPE {0} {1}'.format(name, metric_type)]
+    for labels, value in sorted(samples, key=lambda sample: [str(label) for label in sample[0]]):
+        if metric_type != 'histogram':
+            lines.append('{0}{1} {2}'.format(
+                name, _format_labels(labelnames, labels), _format_number(value)))
+            continue
+        lines.extend(_render_histogram(name, labelnames, labels, value))
+    return lines
+
+
+def _render_histogram(name, labelnames, labels, value):
+    """
+    :param name: name of the histogram family
+    :param labelnames:
+    :param labels: label values of the sample
+    :param value: [bounds, bucket counts, sum, count]
+    :return: list of the cumulative bucket, sum and count lines of the sample
+    """
+    bounds, bucket_counts, total, count = value
+    lines = []
+    cumulative = 0
+    for bound, bucket_count in zip(list(bounds) + [float('inf')], bucket_counts):
+        cumulative += bucket_count
+        lines.append('{0}_bucket{1} {2}'.format(name, _format_labels(
+            labelnames, labels, 'le="{0}"'.format(_format_number(bound))), cumulative))
+    lines.append('{0}_sum{1} {2}'.format(
+        name, _format_labels(labelnames, labels), repr(float(total))))
+    lines.append('{0}_count{1} {2}'.format(name, _format_labels(labelnames, labels), count))
+    return lines
+
+
+def merge_families(snapshots):
+    """
+    Sums the metrics of several processes, label set by label set
+
+    :param snapshots: list of (families, running), families as returned by
+                      Registry.collect and running False for a process which
+                      exited: its counters and histograms still count, its
+                      gauges no longer do
+    :return: list of the merged families
+    """
+    merged = collections.OrderedDict()
+    for families, running in snapshots:
+        for name, documentation, metric_type, labelnames, samples in families:
+            family = merged.setdefault(name, [name, documentation, metric_type, labelnames,
+                                              collections.OrderedDict()])
+            if metric_type == 'gauge' and not running:
+                continue
+            for labels, value in samples:
+                labels = tuple(labels)
+                current = family[4].get(labels)
+                if current is None:
+                    family[4][labels] = value
+                elif metric_type == 'histogram':
+                    family[4][labels] = [current[0], [left + right for left, right in zip(
+                        current[1], value[1])], current[2] + value[2], current[3] + value[3]]
+                else:
+                    family[4][labels] = current + value
+    return [family[:4] + [list(family[4].items())] for family in merged.values()]
+
+
+class Counter():
+    """
+    Monotonic counter with labels
+    """
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        :param name: metric name
+        :param documentation: help text
+        :param labelnames: names of the labels
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        """
+        :param labels: tuple of label values
+        :param amount: increment
+        :return:
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        """
+        :return: family of the counter, see render_family
+        """
+        with self._lock:
+            samples = [[list(labels), value] for labels, value in self._values.items()]
+        return [self.name, self.documentation, 'counter', list(self.labelnames), samples]
+
+    def render(self):
+        """
+        :return: list of exposition lines
+        """
+        return render_family(self.collect())
+
+
+class Histogram():
+    """
+    Cumulative histogram with fixed buckets and labels
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        :param name: metric name
+        :param documentation: help text
+        :param labelnames: names of the labels
+        :param buckets: sorted upper bounds of the buckets
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        """
+        :param value: observed value
+        :param labels: tuple of label values
+        :return:
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def collect(self):
+        """
+        :return: family of the histogram, see render_family
+        """
+        with self._lock:
+            samples = [[list(labels), [list(self.buckets), list(state[0]), state[1], state[2]]]
+                       for labels, state in self._values.items()]
+        return [self.name, self.documentation, 'histogram', list(self.labelnames), samples]
+
+    def render(self):
+        """
+        :return: list of exposition lines
+        """
+        return render_family(self.collect())
+
+
+class Registry():
+    """
+    Holds the metrics and callbacks rendered by the /metrics endpoint
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        """
+        :param metric: Counter or Histogram
+        :return: metric
+        """
+        self._metrics.append(metric)
+        return metric
+
+    def register_callback(self, name, documentation, metric_type, labelname, callback):
+        """
+        Registers a metric whose values are computed at scrape time
+
+        :param name: metric name
+        :param documentation: help text
+        :param metric_type: counter or gauge
+        :param labelname: name of the label
+        :param callback: function returning a dict of label value -> number
+        :return:
+        """
+        self._collectors.append((name, documentation, metric_type, labelname, callback))
+
+    def collect(self):
+        """
+        :return: list of the families of all the metrics, see render_family
+        """
+        families = [metric.collect() for metric in self._metrics]
+        for name, documentation, metric_type, labelname, callback in self._collectors:
+            families.append([name, documentation, metric_type, [labelname],
+                             [[[label], value] for label, value in callback().items()]])
+        return families
+
+    def render(self, families=None):
+        """
+        :param families: families to render, the collected ones of this process by default
+        :return: all the metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for family in self.collect() if families is None else families:
+            lines.extend(render_family(family))
+        return '\n'.join(lines) + '\n'
+
+
+def _process_running(pid):
+    """
+    :param pid: process id
+    :return: True if the process exists
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SnapshotDirectory():
+    """
+    Shares the metrics of the worker processes of a server through a
+    directory: every process writes the families of its registry to
+    <pid>.json every interval_seconds, and right before it answers /metrics
+    with the sum of the snapshots of all of them. The counters and
+    histograms of exited processes keep counting until the directory is
+    emptied, which the server does when it starts
+    """
+
+    def __init__(self, directory, interval_seconds):
+        """
+        :param directory: directory shared by the worker processes
+        :param interval_seconds: delay between the snapshots of a process
+        """
+        self.directory = directory
+        self.interval_seconds = interval_seconds
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self, registry):
+        """
+        Starts writing the snapshots of registry, once per process
+        :param registry: Registry of this process
+        :return:
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        os.makedirs(self.directory, exist_ok=True)
+        threading.Thread(target=self._run, args=(registry,), name='metrics-snapshots',
+                         daemon=True).start()
+
+    def _run(self, registry):
+        """
+        thread body
+        """
+        while True:
+            time.sleep(self.interval_seconds)
+            try:
+                self.write(registry)
+            except Exception as exception:  # pylint: disable=broad-except
+                logging.warning("Failed to write the metrics snapshot due to %s", exception)
+
+    def write(self, registry):
+        """
+        :param registry: Registry of this process
+        :return:
+        """
+        path = os.path.join(self.directory, '{0}.json'.format(os.getpid()))
+        temporary_path = '{0}.tmp'.format(path)
+        with open(temporary_path, 'w', encoding='utf-8') as snapshot:
+            json.dump(registry.collect(), snapshot)
+        # readers see the previous snapshot or this one, never a partial one
+        os.replace(temporary_path, path)
+
+    def collect(self, registry):
+        """
+        :param registry: Registry of this process
+        :return: families summed over the snapshots of every process
+        """
+        self.write(registry)
+        snapshots = []
+        for file_name in sorted(os.listdir(self.directory)):
+            pid, extension = os.path.splitext(file_name)
+            if extension != '.json' or not pid.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.directory, file_name), encoding='utf-8') as snapshot:
+                    snapshots.append((json.load(snapshot), _process_running(int(pid))))
+            except (OSError, ValueError) as exception:
+                logging.warning("Skipping the metrics snapshot %s due to %s", file_name, exception)
+        return merge_families(snapshots)
+
+    def clear(self):
+        """
+        Removes the snapshots, e.g. of the processes of a previous server
+        :return:
+        """
+        if not os.path.isdir(self.directory):
+            return
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(('.json', '.tmp')):
+                os.remove(os.path.join(self.directory, file_name))
+
+
+REGISTRY = Registry()
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'studentmanagement_request_duration_seconds', 'Request latency by endpoint',
+    ('endpoint', 'method')))
+REQUEST_COUNT = REGISTRY.register(Counter(
+    'studentmanagement_requests_total', 'Requests by endpoint and status code',
+    ('endpoint', 'method', 'status')))
+REQUEST_SQL_STATEMENTS = REGISTRY.register(Histogram(
+    'studentmanagement_request_sql_statements', 'SQL statements executed per request',
+    ('endpoint',), STATEMENT_COUNT_BUCKETS))
+REQUEST_SQL_SECONDS = REGISTRY.register(Histogram(
+    'studentmanagement_request_sql_duration_seconds', 'Total SQL time per request',
+    ('endpoint',)))
+TEMPLATE_RENDER_SECONDS = REGISTRY.register(Histogram(
+    'studentmanagement_template_render_duration_seconds', 'Jinja template render time',
+    ('template',)))
+POOL_CHECKOUT_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'studentmanagement_db_pool_checkout_wait_seconds',
+    'Time spent waiting for a pooled connection'))
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool recording how long every checkout waited for a connection
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+
+class TimedTemplate(jinja2.Template):  # pylint: disable=abstract-method
+    """
+    Jinja template recording its render time
+    """
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            TEMPLATE_RENDER_SECONDS.observe(time.perf_counter() - start, (self.name,))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument,too-many-arguments
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument,too-many-arguments
+    elapsed = time.perf_counter() - conn.info['metrics_query_start'].pop()
+    if has_request_context() and 'metrics_start' in g:
+        g.metrics_sql_statements += 1
+        g.metrics_sql_seconds += elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    if context.connection is not None and context.connection.info.get('metrics_query_start'):
+        context.connection.info['metrics_query_start'].pop()
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_sql_statements = 0
+    g.metrics_sql_seconds = 0.0
+
+
+def _after_request(response):
+    _record(response.status_code)
+    return response
+
+
+def _teardown_request(exception):
+    if exception is not None and 'metrics_start' in g:
+        _record(500)
+
+
+def _record(status_code):
+    """
+    Records the metrics of the current request once
+    :param status_code:
+    :return:
+    """
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    endpoint = request.endpoint or 'unknown'
+    REQUEST_LATENCY.observe(time.perf_counter() - start, (endpoint, request.method))
+    REQUEST_COUNT.inc((endpoint, request.method, str(status_code)))
+    REQUEST_SQL_STATEMENTS.observe(g.metrics_sql_statements, (endpoint,))
+    REQUEST_SQL_SECONDS.observe(g.metrics_sql_seconds, (endpoint,))
+
+
+def init_app(app):
+    """
+    Instruments every request of app and the render time of its templates
+    :param app: flask app
+    :return:
+    """
+    app.jinja_env.template_class = TimedTemplate
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
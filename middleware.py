@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+"""
+middleware.py has the setup of the Flask app the handlers run in: response
+compression, static fingerprints, the query profiler, the metrics callbacks,
+the request hooks routing reads to the primary, and the decorators of the
+views (render cache, unit of work, admission control)
+"""
+
+import functools
+import hashlib
+import logging
+from flask import request, g
+from models import DB as db, APP as app
+from models import StudentDAO
+from models import StudentClassDAO
+import models
+import database
+import admission
+import assets
+import compression
+import cache
+import metrics
+import profiler
+import configuration as CONFIGURATION
+
+db.init_app(app)
+metrics.init_app(app)
+
+COMPRESSOR = compression.ResponseCompressor(CONFIGURATION.COMPRESSION_MIMETYPES,
+                                            CONFIGURATION.COMPRESSION_MIN_BYTES,
+                                            CONFIGURATION.COMPRESSION_GZIP_LEVEL,
+                                            CONFIGURATION.COMPRESSION_BROTLI_QUALITY,
+                                            CONFIGURATION.COMPRESSION_STREAMING)
+COMPRESSOR.init_app(app)
+assets.StaticFingerprints(CONFIGURATION.STATIC_MAX_AGE_SECONDS).init_app(app)
+
+PROFILER = None
+if CONFIGURATION.QUERY_PROFILING_ENABLED:
+    PROFILER = profiler.QueryProfiler(CONFIGURATION.SLOW_QUERY_THRESHOLD_MS,
+                                      CONFIGURATION.REPEATED_QUERY_THRESHOLD,
+                                      CONFIGURATION.QUERY_PROFILE_HISTORY)
+    PROFILER.register_dao_classes(StudentDAO, StudentClassDAO)
+    PROFILER.init_app(app)
+
+RENDER_CACHE = cache.LRUCache('render', CONFIGURATION.RENDER_CACHE_MAX_ENTRIES,
+                              CONFIGURATION.RENDER_CACHE_TTL_SECONDS)
+metrics.REGISTRY.register_callback(
+    'studentmanagement_cache_hits_total', 'Cache hits', 'counter', 'cache', lambda: {
+        'studentclass': models.CLASS_CACHE.hits, 'render': RENDER_CACHE.hits})
+metrics.REGISTRY.register_callback(
+    'studentmanagement_cache_misses_total', 'Cache misses', 'counter', 'cache', lambda: {
+        'studentclass': models.CLASS_CACHE.misses, 'render': RENDER_CACHE.misses})
+
+# the streams hold their threads until they end, their limit is kept when admission
+# control is turned off
+EVENT_STREAMS = admission.AdmissionController('events', CONFIGURATION.EVENTS_MAX_STREAMS, 0, 0)
+metrics.REGISTRY.register_callback(
+    'studentmanagement_event_streams', 'Open /events streams', 'gauge', 'broker',
+    lambda: {CONFIGURATION.EVENTS_BROKER: models.EVENT_BROKER.stats['subscriptions']})
+metrics.REGISTRY.register_callback(
+    'studentmanagement_events_total', 'Events delivered to the /events streams', 'counter',
+    'broker', lambda: {CONFIGURATION.EVENTS_BROKER: models.EVENT_BROKER.stats['published']})
+
+metrics.REGISTRY.register_callback(
+    'studentmanagement_replica_reads_total', 'DAO reads sent to a replica', 'counter',
+    'replica', lambda: dict(database.REPLICA_ROUTER.reads))
+metrics.REGISTRY.register_callback(
+    'studentmanagement_replica_failovers_total', 'Replica reads retried on the primary',
+    'counter', 'replica', lambda: dict(database.REPLICA_ROUTER.failovers))
+
+metrics.REGISTRY.register_callback(
+    'studentmanagement_job_workers', 'Background job worker threads', 'gauge', 'state',
+    lambda: {'busy': models.JOB_RUNNER.stats['busy'],
+             'idle': models.JOB_RUNNER.stats['workers'] - models.JOB_RUNNER.stats['busy']})
+metrics.REGISTRY.register_callback(
+    'studentmanagement_jobs_finished_total', 'Background jobs run to completion', 'counter',
+    'state', lambda: dict(models.JOB_RUNNER.finished))
+
+ADMISSION = {
+    endpoint_class: admission.AdmissionController(
+        endpoint_class, concurrency, queue_size, max_wait_seconds,
+        admission.TokenBuckets(*CONFIGURATION.ADMISSION_RATE_LIMITS[endpoint_class],
+                               CONFIGURATION.ADMISSION_MAX_CLIENTS)
+        if endpoint_class in CONFIGURATION.ADMISSION_RATE_LIMITS else None)
+    for endpoint_class, (concurrency, queue_size, max_wait_seconds)
+    in CONFIGURATION.ADMISSION_LIMITS.items()} if CONFIGURATION.ADMISSION_CONTROL_ENABLED else {}
+metrics.REGISTRY.register_callback(
+    'studentmanagement_admission_running', 'Admitted requests running', 'gauge',
+    'endpoint_class', lambda: {name: controller.stats['running']
+                               for name, controller in ADMISSION.items()})
+metrics.REGISTRY.register_callback(
+    'studentmanagement_admission_queued', 'Requests waiting for admission', 'gauge',
+    'endpoint_class', lambda: {name: controller.stats['queued']
+                               for name, controller in ADMISSION.items()})
+metrics.REGISTRY.register_callback(
+    'studentmanagement_admission_shed_total', 'Requests shed with 503 (queue full or deadline)',
+    'counter', 'endpoint_class', lambda: {
+        name: controller.rejected[admission.QUEUE_FULL] + controller.rejected[admission.DEADLINE]
+        for name, controller in ADMISSION.items()})
+metrics.REGISTRY.register_callback(
+    'studentmanagement_admission_rate_limited_total', 'Requests rejected with 429', 'counter',
+    'endpoint_class', lambda: {name: controller.rejected[admission.RATE_LIMITED]
+                               for name, controller in ADMISSION.items()})
+
+
+METRICS_SNAPSHOTS = metrics.SnapshotDirectory(
+    CONFIGURATION.METRICS_DIR,
+    CONFIGURATION.METRICS_SNAPSHOT_SECONDS) if CONFIGURATION.METRICS_DIR else None
+
+
+@app.before_first_request
+def start_metrics_snapshots():
+    """
+    Starts sharing the metrics of this process with the other workers
+    :return:
+    """
+    if METRICS_SNAPSHOTS is not None:
+        METRICS_SNAPSHOTS.start(metrics.REGISTRY)
+
+
+@app.before_first_request
+def start_job_workers():
+    """
+    Starts the background job workers of this process, resuming the jobs
+    left unfinished by a previous one
+    :return:
+    """
+    models.JOB_RUNNER.start()
+
+
+@app.before_request
+def read_your_writes():
+    """
+    Clients which wrote recently read from the primary, the replicas may
+    not have their changes yet
+    :return:
+    """
+    if request.cookies.get(CONFIGURATION.REPLICA_READ_PRIMARY_COOKIE):
+        database.read_from_primary()
+
+
+@app.after_request
+def remember_writes(response):
+    """
+    Marks the client of a request which wrote for REPLICA_READ_YOUR_WRITES_SECONDS
+    :param response:
+    :return: response
+    """
+    if database.REPLICA_ROUTER.bind_keys and database.session_wrote():
+        response.set_cookie(CONFIGURATION.REPLICA_READ_PRIMARY_COOKIE, '1',
+                            max_age=CONFIGURATION.REPLICA_READ_YOUR_WRITES_SECONDS,
+                            httponly=True, samesite='Lax')
+    return response
+
+
+def cached_page(view):
+    """
+    Decorator caching the HTML rendered by view per url and data version,
+    from the primary, and its compressed encodings. Responses carry a strong
+    ETag so unchanged pages are answered with 304.
+    Views set g.skip_render_cache when they rendered a degraded page
+
+    :param view: view function returning rendered HTML
+    :return: wrapped view function
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = ('page', models.DATA_VERSION.value, request.full_path)
+        page = RENDER_CACHE.get(key)
+        if page is cache.MISSING:
+            # a replica may lag behind the version the page is cached under
+            with database.use_primary():
+                body = view(*args, **kwargs)
+            if not isinstance(body, str):
+                return body
+            page = (body, hashlib.sha1(body.encode('utf-8')).hexdigest())
+            if not g.get('skip_render_cache'):
+                RENDER_CACHE.set(key, page)
+        body, etag = page
+        response = app.response_class(body, mimetype='text/html')
+        response.set_etag(etag)
+        encoding = COMPRESSOR.negotiate(response)
+        if encoding is not None:
+            encoded_key = key + (encoding,)
+            encoded = RENDER_CACHE.get(encoded_key)
+            if encoded is cache.MISSING:
+                encoded = COMPRESSOR.compress(response.get_data(), encoding)
+                if not g.get('skip_render_cache'):
+                    RENDER_CACHE.set(encoded_key, encoded)
+            COMPRESSOR.set_encoded(response, encoding, encoded)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request.environ)
+    return wrapper
+
+
+def transactional(view):
+    """
+    Decorator running view in a request-scoped models.unit_of_work: the DAO
+    methods it calls only stage their changes, they are committed once
+    after view returned, or rolled back if it answered with an error status
+
+    :param view: view function
+    :return: wrapped view function
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with models.unit_of_work() as work:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code >= 400:
+                work.rollback_only = True
+        return response
+    return wrapper
+
+
+def admitted(endpoint_class):
+    """
+    Decorator running view under the admission control of endpoint_class
+    (ADMISSION_LIMITS): over the rate of its client it is answered with 429,
+    when no slot frees before its deadline with 503, both with Retry-After.
+    Views of a class without limits, or with ADMISSION_CONTROL_ENABLED off,
+    run unrestricted
+
+    :param endpoint_class: key of ADMISSION_LIMITS
+    :return: decorator
+    """
+    def decorator(view):
+        controller = ADMISSION.get(endpoint_class)
+        if controller is None:
+            return view
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            rejection = controller.acquire(request.remote_addr)
+            if rejection is not None:
+                logging.warning("Rejected %s request %s of %s: %s", endpoint_class,
+                                request.endpoint, request.remote_addr, rejection.reason)
+                if rejection.reason == admission.RATE_LIMITED:
+                    response = app.make_response(({'message': 'Too many requests'}, 429))
+                else:
+                    response = app.make_response(({'message': 'Server busy'}, 503))
+                response.headers['Retry-After'] = str(rejection.retry_after)
+                return response
+            try:
+                return view(*args, **kwargs)
+            finally:
+                controller.release()
+        return wrapper
+    return decorator
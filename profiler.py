@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""
+profiler.py has the opt-in SQL profiling mode: it records every statement of a
+request with its duration and the DAO method which issued it, logs slow
+statements and statement shapes repeated within one request (N+1 patterns),
+and exposes the result as an X-Query-Report header and on /debug/queries
+"""
+
+import collections
+import logging
+import re
+import sys
+import threading
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+REPORT_HEADER = 'X-Query-Report'
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|\?')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class QueryProfiler():
+    """
+    Collects the SQL statements of every request once installed on an app
+    """
+
+    def __init__(self, slow_query_threshold_ms, repeated_query_threshold, history_size):
+        """
+        :param slow_query_threshold_ms: statements slower than this are flagged
+        :param repeated_query_threshold: shapes run more often than this in one request are flagged
+        :param history_size: number of request reports kept for /debug/queries
+        """
+        self.slow_query_threshold_ms = slow_query_threshold_ms
+        self.repeated_query_threshold = repeated_query_threshold
+        self.history = collections.deque(maxlen=history_size)
+        self._dao_methods = {}
+        self._lock = threading.Lock()
+
+    def register_dao_classes(self, *dao_classes):
+        """
+        Remembers the methods of dao_classes so statements can be attributed to them
+        :param dao_classes: DAO classes
+        :return:
+        """
+        for dao_class in dao_classes:
+            for name, attribute in vars(dao_class).items():
+                function = getattr(attribute, '__func__', attribute)
+                # decorated methods, e.g. models.replica_read
+                function = getattr(function, '__wrapped__', function)
+                code = getattr(function, '__code__', None)
+                if code is not None:
+                    self._dao_methods[code] = '{0}.{1}'.format(dao_class.__name__, name)
+
+    def _dao_callers(self):
+        """
+        :return: DAO methods on the current call stack, innermost first
+        """
+        callers = []
+        frame = sys._getframe(2)  # pylint: disable=protected-access
+        while frame is not None:
+            name = self._dao_methods.get(frame.f_code)
+            if name:
+                callers.append(name)
+            frame = frame.f_back
+        return ' < '.join(callers) or 'unknown'
+
+    @staticmethod
+    def statement_shape(statement):
+        """
+        :param statement: SQL statement with bind placeholders
+        :return: statement with placeholders and placeholder lists collapsed
+        """
+        shape = _PLACEHOLDER.sub('?', _WHITESPACE.sub(' ', statement).strip())
+        return _PLACEHOLDER_LIST.sub('(?)', shape)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument,too-many-arguments
+        conn.info.setdefault('profiler_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument,too-many-arguments
+        elapsed_ms = (time.perf_counter() - conn.info['profiler_query_start'].pop()) * 1000
+        if not has_request_context() or 'query_profile' not in g:
+            return
+        dao = self._dao_callers()
+        g.query_profile.append((self.statement_shape(statement), elapsed_ms, dao))
+        if elapsed_ms >= self.slow_query_threshold_ms:
+            logging.warning("Slow query (%.1f ms) from %s during %s: %s",
+                            elapsed_ms, dao, request.path, statement)
+
+    def _handle_error(self, context):
+        if context.connection is not None and context.connection.info.get('profiler_query_start'):
+            context.connection.info['profiler_query_start'].pop()
+
+    @staticmethod
+    def _before_request():
+        g.query_profile = []
+
+    def _after_request(self, response):
+        statements = g.pop('query_profile', None)
+        if statements is None:
+            return response
+        report = self.build_report(statements)
+        for shape in report['repeated']:
+            logging.warning("Possible N+1 during %s: %s statements from %s: %s",
+                            request.path, shape['count'], shape['dao'], shape['statement'])
+        response.headers[REPORT_HEADER] = 'statements={0}; total_ms={1:.1f}; slow={2}; ' \
+                                          'repeated={3}'.format(report['statements'],
+                                                                report['total_ms'],
+                                                                len(report['slow']),
+                                                                len(report['repeated']))
+        report.update({'method': request.method, 'path': request.full_path,
+                       'status': response.status_code, 'time': time.time()})
+        with self._lock:
+            self.history.append(report)
+        return response
+
+    def build_report(self, statements):
+        """
+        :param statements: list of (shape, elapsed_ms, dao) of one request
+        :return: dict with totals, slow statements and repeated statement shapes
+        """
+        shapes = collections.OrderedDict()
+        for shape, elapsed_ms, dao in statements:
+            entry = shapes.setdefault(shape, {'statement': shape, 'count': 0,
+                                              'total_ms': 0.0, 'dao': dao})
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+        return {
+            'statements': len(statements),
+            'total_ms': sum(elapsed_ms for _, elapsed_ms, _ in statements),
+            'slow': [{'statement': shape, 'ms': elapsed_ms, 'dao': dao}
+                     for shape, elapsed_ms, dao in statements
+                     if elapsed_ms >= self.slow_query_threshold_ms],
+            'repeated': [entry for entry in shapes.values()
+                         if entry['count'] > self.repeated_query_threshold],
+            'shapes': list(shapes.values()),
+        }
+
+    def get_reports(self):
+        """
+        :return: reports of the latest requests, newest first
+        """
+        with self._lock:
+            return list(reversed(self.history))
+
+    def init_app(self, app):
+        """
+        Installs the profiler on app and on every SQLAlchemy engine
+        :param app: flask app
+        :return:
+        """
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(Engine, 'handle_error', self._handle_error)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+schema.py has the schema maintenance of the database: upgrades of tables created by
+an older version, archive partitions, search indexes and the id migration
+"""
+
+import logging
+from sqlalchemy import MetaData, Table, event, text
+from sqlalchemy.exc import SQLAlchemyError
+from database import DB, CLASS_CACHE
+from students import Student, StudentArchive
+from classes import StudentClass, ClassStatisticsDAO
+
+
+def table_exists(connection, table):
+    """
+    :param connection: sqlalchemy connection
+    :param table: sqlalchemy Table, its name (and schema) is quoted like in
+                  DDL so mixed case and schema qualified names resolve
+    :return: True if the table exists in the PostgreSQL database
+    """
+    return connection.execute(text("SELECT to_regclass(:name)"), {
+        'name': connection.dialect.identifier_preparer.format_table(table)}).scalar() is not None
+
+
+def migrate_ids_to_uuid7():
+    """
+    Rewrites the random ids of existing students (archived ones included)
+    and classes to time ordered ones built from their created_on, together
+    with every reference to them, in one transaction. The foreign keys
+    pointing at the two tables are dropped for the rewrite and added back,
+    which validates them again
+    :return: tuple of migrated students count and migrated classes count
+    """
+    session = DB.session
+    preparer = session.connection().dialect.identifier_preparer
+    # databases not restarted since the archive was added do not have it yet
+    archived = table_exists(session.connection(), StudentArchive.__table__)
+    # regclass::text is already quoted and schema qualified where needed
+    constraints = session.execute(text(
+        "SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) "
+        "FROM pg_constraint WHERE contype = 'f' "
+        "AND confrelid IN (to_regclass(:student), to_regclass(:studentclass))"), {
+            'student': preparer.format_table(Student.__table__),
+            'studentclass': preparer.format_table(StudentClass.__table__)}).fetchall()
+    try:
+        for table, name, _ in constraints:
+            session.execute(text('ALTER TABLE {0} DROP CONSTRAINT {1}'.format(
+                table, preparer.quote(name))))
+        counts = []
+        for table in ('student', 'studentclass') + (('student_archive',) if archived else ()):
+            # ids already in the v7 layout (version nibble 7) are kept
+            counts.append(session.execute(text(
+                "CREATE TEMPORARY TABLE {0}_id_map ON COMMIT DROP AS "
+                "SELECT id AS old_id, CAST(overlay(overlay(overlay(md5(random()::text || id::text) "
+                "PLACING lpad(to_hex(floor(extract(epoch FROM coalesce(created_on, now())) "
+                "* 1000)::bigint), 12, '0') FROM 1 FOR 12) PLACING '7' FROM 13 FOR 1) "
+                "PLACING substr('89ab', floor(random() * 4)::int + 1, 1) FROM 17 FOR 1) "
+                "AS uuid) AS new_id FROM {0} "
+                "WHERE substr(id::text, 15, 1) <> '7'".format(table))).rowcount)
+        remapped = [('student', 'id', 'student_id_map'),
+                    ('student', 'class_id', 'studentclass_id_map'),
+                    ('studentclass', 'id', 'studentclass_id_map'),
+                    ('studentclass', 'class_leader', 'student_id_map')]
+        if archived:
+            # archived students keep the ids of their classes, closed or deleted since
+            remapped += [('student_archive', 'id', 'student_archive_id_map'),
+                         ('student_archive', 'class_id', 'studentclass_id_map')]
+        for table, column, id_map in remapped:
+            session.execute(text(
+                "UPDATE {0} SET {1} = {2}.new_id FROM {2} "
+                "WHERE {0}.{1} = {2}.old_id".format(table, column, id_map)))
+        for table, name, definition in constraints:
+            session.execute(text('ALTER TABLE {0} ADD CONSTRAINT {1} {2}'.format(
+                table, preparer.quote(name), definition)))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    session.execute(text("ANALYZE student"))
+    session.execute(text("ANALYZE studentclass"))
+    session.commit()
+    # the counters are keyed by the old class ids
+    ClassStatisticsDAO.rebuild()
+    CLASS_CACHE.invalidate()
+    return counts[0] + sum(counts[2:]), counts[1]
+
+
+def create_archive_partitions(years):
+    """
+    Creates the missing yearly partitions of student_archive, in the current transaction
+    :param years: years of the created_on of the students about to be archived
+    :return:
+    """
+    connection = DB.session.connection()
+    if connection.dialect.name != 'postgresql':
+        return
+    preparer = connection.dialect.identifier_preparer
+    archive = StudentArchive.__table__
+    for year in sorted(years):
+        partition = Table('{0}_{1:d}'.format(archive.name, year), MetaData(),
+                          schema=archive.schema)
+        if table_exists(connection, partition):
+            continue
+        logging.info("Creating archive partition %s", partition.name)
+        # DDL takes no bind parameters, the identifiers are quoted instead
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS {0} PARTITION OF {1} "
+            "FOR VALUES FROM ('{2:04d}-01-01') TO ('{3:04d}-01-01')".format(
+                preparer.format_table(partition), preparer.format_table(archive),
+                year, year + 1)))
+
+
+# columns added after the first release:
+# (table, column, ALTER statement, backfill statement or None)
+SCHEMA_UPGRADE_COLUMNS = (
+    ('student', 'enrolled_on',
+     "ALTER TABLE student ADD COLUMN IF NOT EXISTS enrolled_on TIMESTAMP WITHOUT TIME ZONE",
+     "UPDATE student SET enrolled_on = coalesce(updated_on, created_on) "
+     "WHERE class_id IS NOT NULL"),
+    ('student', 'version',
+     "ALTER TABLE student ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1", None),
+    ('studentclass', 'version',
+     "ALTER TABLE studentclass ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1",
+     None),
+    ('studentclass', 'closed_on',
+     "ALTER TABLE studentclass ADD COLUMN IF NOT EXISTS closed_on TIMESTAMP WITHOUT TIME ZONE",
+     None),
+)
+
+
+def upgrade_schema(connection):
+    """
+    Adds the SCHEMA_UPGRADE_COLUMNS missing from tables created by an older
+    version and backfills them. Columns already present are not touched, so
+    no ALTER TABLE lock is taken on an up to date database
+    :param connection: sqlalchemy connection
+    :return:
+    """
+    if connection.dialect.name != 'postgresql':
+        return
+    preparer = connection.dialect.identifier_preparer
+    for table, column, alter_statement, backfill_statement in SCHEMA_UPGRADE_COLUMNS:
+        exists = connection.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_attribute WHERE attrelid = to_regclass(:table) "
+            "AND attname = :column AND NOT attisdropped)"),
+                                    {'table': preparer.quote(table), 'column': column}).scalar()
+        if not exists:
+            logging.info("Adding column %s.%s", table, column)
+            with connection.begin():
+                connection.execute(text(alter_statement))
+                if backfill_statement:
+                    connection.execute(text(backfill_statement))
+
+
+STUDENT_SEARCH_INDEX_DDL = (
+    # C collation: the btree serves both the LIKE 'prefix%' range and the ORDER BY
+    "CREATE INDEX IF NOT EXISTS ix_student_name_lower_c "
+    "ON {0} ((lower(name) COLLATE \"C\"), id)",
+    "CREATE INDEX IF NOT EXISTS ix_student_name_trgm "
+    "ON {0} USING gist (lower(name) gist_trgm_ops)",
+)
+# whether ix_student_name_trgm exists, checked once per process
+_TRIGRAM_SEARCH = []
+
+
+def create_search_indexes(connection):
+    """
+    Creates the indexes of the student name search if they are missing: a
+    prefix index on lower(name) and, if the pg_trgm extension can be
+    created, a trigram GiST index serving similarity ranked lookups
+    :param connection: sqlalchemy connection
+    :return: True if the trigram index is available
+    """
+    if connection.dialect.name != 'postgresql':
+        return False
+    student = connection.dialect.identifier_preparer.format_table(Student.__table__)
+    connection.execute(text(STUDENT_SEARCH_INDEX_DDL[0].format(student)))
+    try:
+        with connection.begin_nested():
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            connection.execute(text(STUDENT_SEARCH_INDEX_DDL[1].format(student)))
+    except SQLAlchemyError as exception:
+        logging.warning("Trigram name search unavailable, searching name prefixes only: %s",
+                        exception)
+        return False
+    return True
+
+
+event.listen(Student.__table__, 'after_create',
+             lambda target, connection, **kwargs: create_search_indexes(connection))
+
+
+def trigram_search_available():
+    """
+    :return: True if the database can serve the student name search
+    """
+    if not _TRIGRAM_SEARCH:
+        available = DB.engine.dialect.name == 'postgresql' and DB.session.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_indexes "
+            "WHERE indexname = 'ix_student_name_trgm')")).scalar()
+        _TRIGRAM_SEARCH.append(bool(available))
+    return _TRIGRAM_SEARCH[0]
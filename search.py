@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""
+search.py has the in-process student name index used by the student search
+on databases other than PostgreSQL (e.g. a stand-in database in
+development): prefix lookups on a sorted list of names and typo tolerant
+matches through an inverted trigram index, ranked like pg_trgm does
+"""
+
+import bisect
+import collections
+import re
+import threading
+
+_WORD = re.compile(r'\w+')
+
+
+def trigrams(text):
+    """
+    Trigrams of every word of text, words padded like pg_trgm does
+    :param text: string
+    :return: set of trigrams
+    """
+    result = set()
+    for word in _WORD.findall(text.lower()):
+        padded = '  {0} '.format(word)
+        result.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return result
+
+
+class NameIndex():
+    """
+    Index of (id, name, class_id) rows, updated in place as students are
+    added, changed and deleted. Names are indexed once however many
+    students share them. Not thread safe, VersionedNameIndex serializes
+    its use
+    """
+
+    def __init__(self, rows):
+        """
+        :param rows: iterable of (id, name, class_id)
+        """
+        # id -> row, lower case name -> ids in insertion order
+        self.rows = {}
+        self.name_ids = collections.defaultdict(list)
+        for row_id, name, class_id in rows:
+            row = (str(row_id), name or '', class_id and str(class_id))
+            self.rows[row[0]] = row
+            self.name_ids[row[1].lower()].append(row[0])
+        self.names = sorted(self.name_ids)
+        self.postings = collections.defaultdict(set)
+        for name in self.names:
+            for trigram in trigrams(name):
+                self.postings[trigram].add(name)
+
+    def add(self, row_id, name, class_id):
+        """
+        Indexes a new student, or the new name and class of an indexed one
+        :param row_id:
+        :param name:
+        :param class_id:
+        :return:
+        """
+        self.remove(row_id)
+        row = (str(row_id), name or '', class_id and str(class_id))
+        self.rows[row[0]] = row
+        key = row[1].lower()
+        if key not in self.name_ids:
+            bisect.insort(self.names, key)
+            for trigram in trigrams(key):
+                self.postings[trigram].add(key)
+        self.name_ids[key].append(row[0])
+
+    def remove(self, row_id):
+        """
+        :param row_id: id of a student, ignored when it is not indexed
+        :return:
+        """
+        row = self.rows.pop(str(row_id), None)
+        if row is None:
+            return
+        key = row[1].lower()
+        self.name_ids[key].remove(row[0])
+        if self.name_ids[key]:
+            return
+        del self.name_ids[key]
+        del self.names[bisect.bisect_left(self.names, key)]
+        for trigram in trigrams(key):
+            self.postings[trigram].discard(key)
+            if not self.postings[trigram]:
+                del self.postings[trigram]
+
+    def _expand(self, scored_names, limit):
+        """
+        :param scored_names: iterable of (lower case name, score)
+        :param limit: maximum number of rows
+        :return: list of (row id, score)
+        """
+        row_ids = []
+        for name, score in scored_names:
+            for row_id in self.name_ids[name]:
+                if len(row_ids) >= limit:
+                    return row_ids
+                row_ids.append((row_id, score))
+        return row_ids
+
+    def prefix(self, query, limit):
+        """
+        :param query: lower case name prefix
+        :param limit: maximum number of rows
+        :return: list of (row id, 1.0) whose name starts with query, by name
+        """
+        start = bisect.bisect_left(self.names, query)
+        end = start
+        while end < len(self.names) and self.names[end].startswith(query):
+            end += 1
+        return self._expand(((name, 1.0) for name in self.names[start:end]), limit)
+
+    def similar(self, query, limit, min_similarity):
+        """
+        :param query: lower case name or part of a name, may contain typos
+        :param limit: maximum number of rows
+        :param min_similarity: minimum share of the trigrams of query found in the name
+        :return: list of (row id, similarity), most similar first
+        """
+        query_trigrams = trigrams(query)
+        if not query_trigrams:
+            return []
+        hits = collections.Counter()
+        for trigram in query_trigrams:
+            hits.update(self.postings.get(trigram, ()))
+        ranked = [(name, count / len(query_trigrams)) for name, count in hits.items()
+                  if count / len(query_trigrams) >= min_similarity]
+        ranked.sort(key=lambda item: (-item[1], len(item[0]), item[0]))
+        return self._expand(ranked, limit)
+
+    def search(self, query, limit, min_similarity):
+        """
+        :param query: search string
+        :param limit: maximum number of results
+        :param min_similarity: minimum similarity of the typo tolerant matches
+        :return: list of (id, name, class_id, score), prefix matches first with score 1
+        """
+        query = query.lower()
+        results = collections.OrderedDict(self.prefix(query, limit))
+        if len(results) < limit:
+            for row_id, similarity in self.similar(query, limit + len(results),
+                                                   min_similarity):
+                if len(results) >= limit:
+                    break
+                results.setdefault(row_id, similarity)
+        return [self.rows[row_id] + (round(score, 3),) for row_id, score in results.items()]
+
+
+class VersionedNameIndex():
+    """
+    Holds a NameIndex of the current data version. The writes committed by
+    this process are applied to it as they commit, each one accounting for
+    one bump of the version; when the version moved by more than the
+    applied writes (another process, a write without change events) the
+    index is rebuilt from loader
+    """
+
+    def __init__(self, version_counter, loader):
+        """
+        :param version_counter: cache.VersionCounter bumped by every write
+        :param loader: function returning the (id, name, class_id) rows to index
+        """
+        self.version_counter = version_counter
+        self.loader = loader
+        self.rebuilds = 0
+        self._version = None
+        self._applied = 0
+        self._index = None
+        self._lock = threading.RLock()
+
+    def get(self):
+        """
+        :return: NameIndex of the current data version, to be used while
+                 holding the lock, as search does
+        """
+        version = self.version_counter.value
+        with self._lock:
+            if self._index is None or version - self._version != self._applied:
+                self._index = NameIndex(self.loader())
+                self.rebuilds += 1
+            self._version = version
+            self._applied = 0
+            return self._index
+
+    def apply(self, changes):
+        """
+        Applies the student changes of a committed write, before it bumps
+        the version. Nothing is done while no index was built
+        :param changes: list of (id, (id, name, class_id) or None when deleted),
+                        in the order of the write
+        :return:
+        """
+        with self._lock:
+            if self._index is None:
+                return
+            for row_id, row in changes:
+                if row is None:
+                    self._index.remove(row_id)
+                else:
+                    self._index.add(*row)
+            self._applied += 1
+
+    def search(self, query, limit, min_similarity):
+        """
+        :param query: search string
+        :param limit: maximum number of results
+        :param min_similarity: minimum similarity of the typo tolerant matches
+        :return: list of (id, name, class_id, score), see NameIndex.search
+        """
+        with self._lock:
+            return self.get().search(query, limit, min_similarity)
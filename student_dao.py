@@ -0,0 +1,701 @@
+#!/usr/bin/env python
+"""
+student_dao.py has the Data access object of the students
+"""
+
+import collections
+import csv
+import datetime
+import io
+import logging
+import uuid
+from sqlalchemy import and_, any_, cast, func, or_, select, text
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+import configuration as CONFIGURATION
+import search
+from database import (WROTE_KEY, DB, DATA_VERSION, uuid7, save_changes, discard_changes,
+                      replica_read, query_records, stream_records, get_keyset_page, expire_loaded,
+                      update_versioned, use_primary)
+from change_events import emit_student_event, register_commit_hook
+from students import Student, StudentRecord, StudentArchive, StudentSearchResult
+from classes import StudentClass, StudentClassDAO, ClassStatisticsDAO
+from schema import create_archive_partitions, trigram_search_available
+
+
+# in-process student name search of the databases other than PostgreSQL, kept up
+# to date with the student events of the writes of this process
+def _name_index_rows():
+    """
+    :return: generator of the (id, name, class_id) rows of NAME_INDEX, read
+             from the primary as the index is kept per DATA_VERSION
+    """
+    with use_primary():
+        yield from DB.session.query(Student.id, Student.name, Student.class_id).yield_per(
+            CONFIGURATION.EXPORT_FETCH_SIZE)
+
+
+def _update_name_index(staged):
+    """
+    Applies the student changes of a committed transaction to NAME_INDEX
+    :param staged: list of the (event_type, class_ids, data) it staged
+    :return:
+    """
+    NAME_INDEX.apply([
+        (data['id'], None if event_type == 'student_deleted' else
+         (data['id'], data['name'], data['class_id']))
+        for event_type, _, data in staged if event_type in STUDENT_EVENT_TYPES])
+
+
+STUDENT_EVENT_TYPES = ('student_added', 'student_updated', 'student_deleted')
+NAME_INDEX = search.VersionedNameIndex(DATA_VERSION, _name_index_rows)
+register_commit_hook(_update_name_index)
+
+
+# the one entry point of the student queries and writes of the handlers, the jobs
+# and the scripts, as StudentClassDAO is for the classes
+class StudentDAO(Student):  # pylint: disable=too-many-public-methods
+    """
+        This is a Student data access object of class Student
+        for db connection with PostgreSQL. Performs CRUD Operations
+    """
+    XSRF_TOKEN_MESSAGE = "StudentDAO_XSRF_TOKEN_MESSAGE"
+    EXPORT_COLUMNS = ('id', 'name', 'class_id', 'created_on', 'updated_on', 'version')
+
+    @staticmethod
+    def add_student(class_id=None, student_name=None):
+        """
+        Method to add student with student_name
+
+        :param class_id:
+        :param student_name:
+        :return: student object
+        """
+        student = None
+        if student_name and class_id:
+            student = Student(name=student_name, class_id=class_id)
+            DB.session.add(student)
+            ClassStatisticsDAO.record_changes(added=[(class_id, student.enrolled_on)])
+        elif student_name:
+            student = Student(name=student_name)
+            DB.session.add(student)
+            ClassStatisticsDAO.record_changes(added=[(None, None)])
+        if student:
+            # the id is generated by the flush
+            DB.session.flush()
+            emit_student_event('student_added', student)
+            save_changes()
+        return student
+
+
+    @staticmethod
+    @replica_read
+    def get_all_students():
+        """
+        get all student method to get all the students rows from Student table
+        :return: all student rows from student table
+        """
+        students = Student.query.all()
+        return students
+
+    @staticmethod
+    @replica_read
+    def get_all_student_records(include_archived=False):
+        """
+        read-only variant of get_all_students for list views
+        :param include_archived: also return the archived students
+        :return: list of StudentRecord of all the students
+        """
+        return query_records(StudentRecord.query(include_archived), StudentRecord)
+
+    @staticmethod
+    @replica_read
+    def get_students_page(cursor=None, page_size=None, include_archived=False):
+        """
+        get one page of students ordered by creation time using keyset pagination
+
+        :param cursor: next_cursor of the previous page, None for the first page
+        :param page_size: number of students in the page, capped at MAX_PAGE_SIZE
+        :param include_archived: also page through the archived students
+        :return: tuple of students and next_cursor (None on the last page)
+        """
+        return get_keyset_page(StudentRecord.query(include_archived), Student, cursor=cursor,
+                               page_size=page_size, record_type=StudentRecord)
+
+    @staticmethod
+    @replica_read
+    def iter_students(class_id=None, include_archived=False):
+        """
+        stream students through a server-side cursor, EXPORT_FETCH_SIZE rows
+        per round trip, so memory stays constant whatever the table size
+
+        :param class_id: only stream students of this class when given
+        :param include_archived: also stream the archived students
+        :return: iterable of StudentRecord, tuples in EXPORT_COLUMNS order
+        """
+        query = StudentRecord.query(include_archived)
+        if class_id:
+            query = query.filter(Student.class_id == class_id)
+        return stream_records(query, StudentRecord, CONFIGURATION.EXPORT_FETCH_SIZE)
+
+    @staticmethod
+    def get_student_by_id(student_id):
+        """
+        :param student_id:
+        :return: the student object with given student_id
+        """
+        student = None
+        if student_id:
+            student = Student.query.filter_by(id=student_id).first()
+            if student:
+                return student
+        return student
+
+    @staticmethod
+    @replica_read
+    def get_students_class_id(class_id):
+        """
+        :param class_id:
+        :return: all the students have the with class_id as class_id
+        """
+        students = []
+        if class_id:
+            students = Student.query.filter_by(class_id=class_id).all()
+            if students:
+                return students
+        return students
+
+    @staticmethod
+    @replica_read
+    def get_student_records_by_class_id(class_id, include_archived=False):
+        """
+        read-only variant of get_students_class_id for list views
+        :param class_id:
+        :param include_archived: also return the archived students of the class
+        :return: list of StudentRecord of the students of the class, by creation time
+        """
+        if not class_id:
+            return []
+        return query_records(StudentRecord.query(include_archived).filter(
+            Student.class_id == class_id).order_by(Student.created_on, Student.id), StudentRecord)
+
+    @staticmethod
+    def get_student_by_multiple_filter(**kwargs):
+        """
+        get student by multiple filter
+
+        :param kwargs:
+        :return:
+        """
+        students = None
+        if kwargs:
+            students = Student.query.filter_by(**kwargs).first()
+            if students:
+                return students
+        return students
+
+    @staticmethod
+    @replica_read
+    def get_all_unassigned_students():
+        """
+        get_all_unassigned_students
+
+        :return:
+        """
+        student_with_none = []
+        student_with_none = Student.query.filter_by(class_id=None).all()
+        return student_with_none
+
+    @staticmethod
+    @replica_read
+    def get_unassigned_student_records(include_archived=False):
+        """
+        read-only variant of get_all_unassigned_students for list views
+        :param include_archived: also return the archived students without class
+        :return: list of StudentRecord of the students without class
+        """
+        return query_records(StudentRecord.query(include_archived).filter(
+            Student.class_id.is_(None)), StudentRecord)
+
+    @staticmethod
+    @replica_read
+    def get_unassigned_students_page(cursor=None, page_size=None, name_prefix=None,
+                                     include_archived=False):
+        """
+        get one page of unassigned students using keyset pagination,
+        optionally only those whose name starts with name_prefix
+
+        :param cursor: next_cursor of the previous page, None for the first page
+        :param page_size: number of students in the page, capped at MAX_PAGE_SIZE
+        :param name_prefix: case insensitive name prefix to search for
+        :param include_archived: also page through the archived students without class
+        :return: tuple of students and next_cursor (None on the last page)
+        """
+        query = StudentRecord.query(include_archived).filter(Student.class_id.is_(None))
+        if name_prefix:
+            escaped_prefix = name_prefix.replace('\\', '\\\\').replace(
+                '%', '\\%').replace('_', '\\_')
+            query = query.filter(Student.name.ilike(escaped_prefix + '%', escape='\\'))
+        return get_keyset_page(query, Student, cursor=cursor, page_size=page_size,
+                               record_type=StudentRecord)
+
+    @staticmethod
+    @replica_read
+    def search_students(query, limit=None):
+        """
+        search students by name: names starting with query first, then
+        names similar to query (typos, other words of the name) ranked by
+        trigram similarity. Served by the lower(name) indexes in PostgreSQL,
+        only the prefix matches when pg_trgm is missing, and by NAME_INDEX
+        on other databases
+
+        :param query: search string
+        :param limit: maximum number of results, capped at SEARCH_MAX_LIMIT
+        :return: list of StudentSearchResult, best first
+        """
+        query = (query or '').strip().lower()
+        limit = max(1, min(limit or CONFIGURATION.SEARCH_DEFAULT_LIMIT,
+                           CONFIGURATION.SEARCH_MAX_LIMIT))
+        if not query:
+            return []
+        if DB.engine.dialect.name != 'postgresql':
+            return [StudentSearchResult(*row) for row in NAME_INDEX.search(
+                query, limit, CONFIGURATION.SEARCH_MIN_SIMILARITY)]
+
+        escaped_query = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        results = collections.OrderedDict()
+        for row in DB.session.execute(text(
+                'SELECT id, name, class_id FROM student '
+                'WHERE lower(name) COLLATE "C" LIKE :pattern '
+                'ORDER BY lower(name) COLLATE "C", id LIMIT :limit'),
+                                      {'pattern': escaped_query + '%', 'limit': limit}).fetchall():
+            results[row.id] = StudentSearchResult(row.id, row.name, row.class_id, 1.0)
+        if len(results) < limit and trigram_search_available():
+            # nearest neighbours by word similarity, walked on the GiST index
+            for row in DB.session.execute(text(
+                    "SELECT id, name, class_id, word_similarity(:query, lower(name)) AS score "
+                    "FROM student ORDER BY :query <<-> lower(name) LIMIT :limit"),
+                                          {'query': query,
+                                           'limit': limit + len(results)}).fetchall():
+                if len(results) >= limit or row.score < CONFIGURATION.SEARCH_MIN_SIMILARITY:
+                    break
+                results.setdefault(row.id, StudentSearchResult(
+                    row.id, row.name, row.class_id, round(row.score, 3)))
+        return list(results.values())
+
+    @staticmethod
+    def assign_class(class_id=None, student_id=None):
+        """
+        assign class to students
+        :param class_id:
+        :param student_id:
+        :return:
+        """
+        if class_id and student_id:
+            student = StudentDAO.get_student_by_id(student_id)
+            previous_class_id = student.class_id
+            student.class_id = class_id
+            if str(previous_class_id) != str(class_id):
+                student.enrolled_on = datetime.datetime.now()
+                DB.session.add(student)
+                ClassStatisticsDAO.record_changes(added=[(class_id, student.enrolled_on)],
+                                                  removed=[previous_class_id])
+                # the event carries the version bumped by the flush
+                DB.session.flush()
+                emit_student_event('student_updated', student, previous_class_id)
+            save_changes()
+
+    @staticmethod
+    def _assign_chunk(pairs):
+        """
+        Moves the students of pairs to their class with one set-based
+        UPDATE ... FROM (VALUES ...), skipping the classes which do not exist
+        :param pairs: list of (student_id, class_id), normalized and unique
+        :return: set of the ids of the students whose class exists
+        """
+        params = {}
+        values = []
+        for index, (student_id, class_id) in enumerate(pairs):
+            params['s{0}'.format(index)] = student_id
+            params['c{0}'.format(index)] = class_id
+            values.append('(CAST(:s{0} AS uuid), CAST(:c{0} AS uuid))'.format(index))
+        # previous is read from the same snapshot, before the update
+        rows = DB.session.execute(text(
+            "UPDATE student SET class_id = v.class_id, "
+            "enrolled_on = CASE WHEN student.class_id IS DISTINCT FROM v.class_id "
+            "THEN now() ELSE student.enrolled_on END, "
+            "version = CASE WHEN student.class_id IS DISTINCT FROM v.class_id "
+            "THEN student.version + 1 ELSE student.version END "
+            "FROM (VALUES {0}) AS v (id, class_id) "
+            "JOIN studentclass ON studentclass.id = v.class_id "
+            "JOIN student AS previous ON previous.id = v.id "
+            "WHERE student.id = v.id "
+            "RETURNING student.id, previous.class_id, student.class_id, "
+            "student.enrolled_on, student.name, student.created_on, "
+            "student.updated_on, student.version".format(', '.join(values))),
+                                  params).fetchall()
+        moved = [row for row in rows if row[1] != row[2]]
+        expire_loaded(Student, [row[0] for row in moved])
+        ClassStatisticsDAO.record_changes(
+            added=[(row[2], row[3]) for row in moved],
+            removed=[row[1] for row in moved])
+        for row in moved:
+            emit_student_event('student_updated', StudentRecord(
+                row[0], row[4], row[2], row[5], row[6], row[7]), row[1])
+        return {str(row[0]) for row in rows}
+
+    @staticmethod
+    def assign_classes(assignments):
+        """
+        assign classes to many students in one transaction, using one
+        set-based UPDATE ... FROM (VALUES ...) per BULK_ASSIGN_CHUNK_SIZE students.
+        Students with an empty class are left untouched like in assign_class
+
+        :param assignments: dict of student_id -> class_id
+        :return: dict of student_id -> True if assigned, False if the student
+                 or the class does not exist, or the student is given more
+                 than once under different spellings of its id
+        """
+        result = {}
+        pending = {}
+        duplicates = set()
+        for student_id, class_id in assignments.items():
+            if not class_id:
+                result[student_id] = True
+                continue
+            try:
+                normalized_id = str(uuid.UUID(student_id))
+                class_id = str(uuid.UUID(class_id))
+            except (TypeError, ValueError):
+                result[student_id] = False
+                continue
+            if normalized_id in pending:
+                duplicates.add(normalized_id)
+                result[student_id] = False
+            else:
+                pending[normalized_id] = (student_id, class_id)
+        for student_id in duplicates:
+            logging.warning("Student %s is assigned more than once", student_id)
+            result[pending.pop(student_id)[0]] = False
+
+        assigned = set()
+        pending_ids = list(pending)
+        try:
+            for start in range(0, len(pending_ids), CONFIGURATION.BULK_ASSIGN_CHUNK_SIZE):
+                assigned.update(StudentDAO._assign_chunk(
+                    [(student_id, pending[student_id][1]) for student_id in
+                     pending_ids[start:start + CONFIGURATION.BULK_ASSIGN_CHUNK_SIZE]]))
+            save_changes()
+        except Exception:
+            discard_changes()
+            raise
+
+        for student_id, (original_id, _) in pending.items():
+            result[original_id] = student_id in assigned
+        return result
+
+    @staticmethod
+    def import_students(rows):
+        """
+        import students in batches of IMPORT_BATCH_SIZE rows, every batch
+        validates its class ids against studentclass with one query, is loaded
+        with COPY on PostgreSQL (multi-row INSERT otherwise) and committed
+
+        :param rows: iterable of importer.ImportRow
+        :return: tuple of imported count, failed count and the first
+                 IMPORT_MAX_REPORTED_ERRORS (row_number, error) pairs
+        """
+        report = {'imported': 0, 'failed': 0, 'errors': []}
+        known_class_ids = set()
+
+        def reject(row_number, error):
+            report['failed'] += 1
+            if len(report['errors']) < CONFIGURATION.IMPORT_MAX_REPORTED_ERRORS:
+                report['errors'].append((row_number, error))
+
+        def load(batch):
+            unknown_class_ids = {class_id for _, _, class_id in batch
+                                 if class_id and class_id not in known_class_ids}
+            known_class_ids.update(StudentClassDAO.get_existing_class_ids(unknown_class_ids))
+            students = []
+            for row_number, student_name, class_id in batch:
+                if class_id and class_id not in known_class_ids:
+                    reject(row_number, "Class {0} does not exist".format(class_id))
+                    continue
+                students.append((uuid7(), student_name, class_id, datetime.datetime.now()))
+            StudentDAO.copy_students(students)
+            ClassStatisticsDAO.record_changes(added=[(class_id, created_on) for _, _, class_id,
+                                                     created_on in students])
+            for student_id, student_name, class_id, created_on in students:
+                emit_student_event('student_added', StudentRecord(
+                    student_id, student_name, class_id, created_on, None, 1))
+            DB.session.info[WROTE_KEY] = True
+            DB.session.commit()
+            DATA_VERSION.bump()
+            report['imported'] += len(students)
+
+        batch = []
+        for row in rows:
+            if row.error:
+                reject(row.row_number, row.error)
+                continue
+            student_name = (row.student_name or '').strip()
+            if not student_name or len(student_name) > 100:
+                reject(row.row_number, "Student name must have 1 to 100 characters")
+                continue
+            class_id = row.class_id or None
+            if class_id:
+                try:
+                    class_id = str(uuid.UUID(class_id))
+                except (TypeError, ValueError, AttributeError):
+                    reject(row.row_number, "Invalid class id {0}".format(class_id))
+                    continue
+            batch.append((row.row_number, student_name, class_id))
+            if len(batch) >= CONFIGURATION.IMPORT_BATCH_SIZE:
+                load(batch)
+                batch = []
+        if batch:
+            load(batch)
+        return report['imported'], report['failed'], report['errors']
+
+    @staticmethod
+    def copy_students(students):
+        """
+        insert already validated students in the current transaction, through
+        COPY on PostgreSQL and a multi-row INSERT on other databases
+
+        :param students: list of (id, name, class_id, created_on) tuples, students
+                         with a class are enrolled at created_on
+        :return:
+        """
+        if not students:
+            return
+        connection = DB.session.connection()
+        if connection.dialect.name == 'postgresql':
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(
+                (student_id, name, class_id, created_on, created_on if class_id else None)
+                for student_id, name, class_id, created_on in students)
+            buffer.seek(0)
+            cursor = connection.connection.cursor()
+            try:
+                cursor.copy_expert("COPY student (id, name, class_id, created_on, enrolled_on) "
+                                   "FROM STDIN WITH (FORMAT csv)", buffer)
+            finally:
+                cursor.close()
+        else:
+            connection.execute(Student.__table__.insert(), [
+                {'id': student_id, 'name': name, 'class_id': class_id, 'created_on': created_on,
+                 'enrolled_on': created_on if class_id else None}
+                for student_id, name, class_id, created_on in students])
+
+    @staticmethod
+    def update_student(student_id, student_name=None, expected_version=None):
+        """
+        update student with student name, in one conditional UPDATE
+
+        :param student_id:
+        :param student_name:
+        :param expected_version: version the student was read at, None to
+                                 overwrite any version
+        :return: updated StudentRecord, None if not found
+        :raises VersionConflict: if the student changed since expected_version
+        """
+        student = update_versioned(Student, StudentRecord, student_id, expected_version,
+                                   name=student_name, updated_on=datetime.datetime.now())
+        if student:
+            emit_student_event('student_updated', student)
+            save_changes()
+        return student
+
+    @staticmethod
+    def delete_student(**kwargs):
+        """
+        delete existing student by searching student with
+        multiple filter e.g. student_id, class_id. Clearing the class
+        leader and deleting the student are saved together
+        :param kwargs:
+        :return: deleted student object, None if not found
+        """
+        student = StudentDAO.get_student_by_multiple_filter(**kwargs)
+        if student:
+            # the leader references have to be gone before the row is deleted
+            cleared = StudentClassDAO.clear_class_leaders(
+                StudentClass.class_leader == student.id)
+            DB.session.delete(student)
+            ClassStatisticsDAO.record_changes(removed=[student.class_id])
+            emit_student_event('student_deleted', student)
+            save_changes(invalidate_classes=cleared > 0)
+        return student
+
+    @staticmethod
+    def _selection_conditions(student_ids, class_id, created_after, created_before):
+        """
+        :param student_ids: list of student ids, None for any
+        :param class_id: only students of this class
+        :param created_after: only students created at or after this datetime
+        :param created_before: only students created before this datetime
+        :return: list of the conditions selecting the students
+        :raises ValueError: without any filter or with malformed ids
+        """
+        conditions = []
+        if student_ids is not None:
+            try:
+                student_ids = [str(uuid.UUID(str(student_id))) for student_id in student_ids]
+            except ValueError as exception:
+                raise ValueError("Invalid student id") from exception
+            conditions.append(Student.id == any_(cast(student_ids, ARRAY(UUID))))
+        if class_id:
+            conditions.append(Student.class_id == class_id)
+        if created_after:
+            conditions.append(Student.created_on >= created_after)
+        if created_before:
+            conditions.append(Student.created_on < created_before)
+        if not conditions:
+            raise ValueError("At least one of student_ids, class_id or a created_on bound "
+                             "is required")
+        return conditions
+
+    @staticmethod
+    def get_selected_student_ids(class_id=None, created_after=None, created_before=None,
+                                 limit=None):
+        """
+        To get the ids of the students delete_students would delete with these filters
+        :param class_id: only students of this class
+        :param created_after: only students created at or after this datetime
+        :param created_before: only students created before this datetime
+        :param limit: maximum number of ids, None for all
+        :return: list of student ids, in id order
+        :raises ValueError: without any filter
+        """
+        conditions = StudentDAO._selection_conditions(None, class_id, created_after,
+                                                      created_before)
+        query = DB.session.query(Student.id).filter(and_(*conditions)).order_by(Student.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return [str(row[0]) for row in query]
+
+    @staticmethod
+    def count_selected_students(class_id=None, created_after=None, created_before=None):
+        """
+        :param class_id: only students of this class
+        :param created_after: only students created at or after this datetime
+        :param created_before: only students created before this datetime
+        :return: number of students delete_students would delete with these filters
+        :raises ValueError: without any filter
+        """
+        conditions = StudentDAO._selection_conditions(None, class_id, created_after,
+                                                      created_before)
+        return DB.session.query(func.count(Student.id)).filter(and_(*conditions)).scalar()
+
+    @staticmethod
+    def delete_students(student_ids=None, class_id=None, created_after=None,
+                        created_before=None):
+        """
+        delete many students at once, e.g. a graduating cohort, selected by
+        ids and/or filters (all given filters must match). One UPDATE clears
+        class_leader on every class led by one of them and one DELETE removes
+        them, in the same transaction
+
+        :param student_ids: list of student ids
+        :param class_id: only students of this class
+        :param created_after: only students created at or after this datetime
+        :param created_before: only students created before this datetime
+        :return: tuple of the deleted student ids and the number of classes
+                 which lost their leader
+        :raises ValueError: without any filter or with malformed ids
+        """
+        conditions = StudentDAO._selection_conditions(student_ids, class_id, created_after,
+                                                      created_before)
+        selected = select([Student.id]).where(and_(*conditions))
+        try:
+            cleared = StudentClassDAO.clear_class_leaders(StudentClass.class_leader.in_(selected))
+            rows = DB.session.execute(Student.__table__.delete().where(
+                and_(*conditions)).returning(*[getattr(Student, field)
+                                               for field in StudentRecord._fields])).fetchall()
+            deleted = [str(row[0]) for row in rows]
+            ClassStatisticsDAO.record_changes(removed=[row[2] for row in rows])
+            for row in rows:
+                emit_student_event('student_deleted', StudentRecord._make(row))
+            save_changes(invalidate_classes=cleared > 0)
+        except Exception:
+            discard_changes()
+            raise
+        return deleted, cleared
+
+    @staticmethod
+    def _archive_condition(archived_before, closed_classes):
+        """
+        :param archived_before: students created before this datetime, None for no cutoff
+        :param closed_classes: students of the closed classes
+        :return: sqlalchemy condition on Student
+        :raises ValueError: without cutoff and closed_classes
+        """
+        conditions = []
+        if archived_before is not None:
+            conditions.append(Student.created_on < archived_before)
+        if closed_classes:
+            conditions.append(Student.class_id.in_(
+                select([StudentClass.id]).where(StudentClass.closed_on.isnot(None))))
+        if not conditions:
+            raise ValueError("A cutoff or closed_classes is required")
+        # the partition key of the archive
+        return and_(Student.created_on.isnot(None), or_(*conditions))
+
+    @staticmethod
+    def count_archivable_students(archived_before=None, closed_classes=True):
+        """
+        :param archived_before: students created before this datetime, None for no cutoff
+        :param closed_classes: students of the closed classes
+        :return: number of students archive_students would archive
+        :raises ValueError: without cutoff and closed_classes
+        """
+        return DB.session.query(func.count(Student.id)).filter(
+            StudentDAO._archive_condition(archived_before, closed_classes)).scalar()
+
+    @staticmethod
+    def archive_students(archived_before=None, closed_classes=True, limit=None):
+        """
+        move one batch of students, oldest first, from the student table to
+        student_archive: students created before archived_before and/or
+        students of closed classes. The batch is locked with SKIP LOCKED, so
+        concurrent archivers take different students, and moved by one
+        DELETE ... RETURNING feeding an INSERT ... SELECT, in one transaction
+        with the clearing of their class leaderships
+
+        :param archived_before: students created before this datetime, None for no cutoff
+        :param closed_classes: students of the closed classes
+        :param limit: students per batch, ARCHIVE_BATCH_SIZE by default
+        :return: list of the archived student ids, fewer than limit on the last batch
+        :raises ValueError: without cutoff and closed_classes
+        """
+        condition = StudentDAO._archive_condition(archived_before, closed_classes)
+        try:
+            batch = DB.session.execute(select([Student.id, Student.created_on]).where(
+                condition).order_by(Student.created_on, Student.id).limit(
+                    limit or CONFIGURATION.ARCHIVE_BATCH_SIZE).with_for_update(
+                        skip_locked=True)).fetchall()
+            if not batch:
+                return []
+            student_ids = [row[0] for row in batch]
+            create_archive_partitions({row[1].year for row in batch})
+            cleared = StudentClassDAO.clear_class_leaders(
+                StudentClass.class_leader.in_(student_ids))
+            columns = [column.name for column in StudentArchive.__table__.columns
+                       if column.name != 'archived_on']
+            moved = Student.__table__.delete().where(Student.id.in_(student_ids)).returning(
+                *[Student.__table__.c[column] for column in columns]).cte('moved')
+            rows = DB.session.execute(StudentArchive.__table__.insert().from_select(
+                columns + ['archived_on'],
+                select([moved.c[column] for column in columns] + [func.now()])).returning(
+                    *[StudentArchive.__table__.c[field]
+                      for field in StudentRecord._fields])).fetchall()
+            expire_loaded(Student, student_ids)
+            ClassStatisticsDAO.record_changes(removed=[row[2] for row in rows])
+            # archived students leave the pages like deleted ones
+            for row in rows:
+                emit_student_event('student_deleted', StudentRecord._make(row))
+            save_changes(invalidate_classes=cleared > 0)
+        except Exception:
+            discard_changes()
+            raise
+        return [str(row[0]) for row in rows]
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""
+students.py has the Student and StudentArchive tables and the read-only rows
+the student DAO methods return
+"""
+
+import datetime
+from collections import namedtuple
+from sqlalchemy.dialects.postgresql import UUID
+from database import DB, Base, uuid7
+
+
+class Student(DB.Model, Base):
+    """
+        This is a class for db connection with PostgreSQL.
+        Attributes:
+            id (int): ID of student.
+            name (string): name of student.
+            class_id (int): class id of student.
+            created_on (datetime): created on time and date.
+            updated_on (datetime): updated on time and date.
+            enrolled_on (datetime): time the student joined its current class.
+            version (int): incremented by every update, checked by the updates.
+    """
+
+    # id = DB.Column(DB.Integer, primary_key=True, autoincrement=True)
+    __tablename__ = 'student'
+    id = DB.Column(UUID, primary_key=True, default=uuid7)
+    name = DB.Column(DB.String(100))
+    class_id = DB.Column(UUID, DB.ForeignKey('studentclass.id'), nullable=True, index=True)
+    created_on = DB.Column(DB.DateTime)
+    updated_on = DB.Column(DB.DateTime, index=False, nullable=True)
+    enrolled_on = DB.Column(DB.DateTime, nullable=True)
+    version = DB.Column(DB.Integer, nullable=False, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
+    __table_args__ = (
+        DB.Index('ix_student_created_on_id', 'created_on', 'id'),
+        # keyset pagination of unassigned students only walks unassigned rows
+        DB.Index('ix_student_unassigned_created_on_id', created_on, id,
+                 postgresql_where=class_id.is_(None)),
+    )
+
+    # read-only, loaded explicitly by the queries which join them
+    student_class = DB.relationship('StudentClass', foreign_keys=[class_id], viewonly=True,
+                                    lazy='raise')
+
+    def __init__(self, name, class_id=None, updated_on=None):
+        """
+        __init__ method to initialize the Student Class
+        :param name:
+        :param class_id:
+        :param updated_on:
+        """
+        self.name = name
+        self.class_id = class_id
+        self.updated_on = updated_on
+        self.created_on = datetime.datetime.now()
+        self.enrolled_on = self.created_on if class_id else None
+
+    @property
+    def get_class_id(self):
+        """
+        :return: class id of object
+        """
+        return self.class_id
+
+    @property
+    def get_name(self):
+        """
+        :return: returns the name of the class
+        """
+        return self.name
+
+    @property
+    def get_created_on(self):
+        """
+        :return: returns the time of creation
+        """
+        return self.created_on
+
+    @property
+    def serialize(self):
+        """
+        :return: json serializable dict of the student
+        """
+        return {
+            'id': self.id,
+            'name': self.name,
+            'class_id': self.class_id,
+            'created_on': self.created_on.isoformat() if self.created_on else None,
+            'updated_on': self.updated_on.isoformat() if self.updated_on else None,
+            'version': self.version,
+        }
+
+
+class StudentRecord(namedtuple('StudentRecord', ['id', 'name', 'class_id', 'created_on',
+                                               'updated_on', 'version'])):
+    """
+    Read-only row of the student list views and exports, a plain tuple
+    instead of a session tracked Student
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def query(include_archived=False):
+        """
+        :param include_archived: also query the archived students, only the
+                                 active ones of the student table otherwise
+        :return: query of the StudentRecord columns, to be run with query_records.
+                 Its filters and ordering are written on the Student columns
+        """
+        query = DB.session.query(*[getattr(Student, field) for field in StudentRecord._fields])
+        if include_archived:
+            query = query.union_all(DB.session.query(
+                *[getattr(StudentArchive, field) for field in StudentRecord._fields]))
+        return query
+
+    @property
+    def serialize(self):
+        """
+        :return: json serializable dict of the student
+        """
+        return Student.serialize.fget(self)
+
+
+class StudentArchive(DB.Model, Base):
+    """
+        Students moved out of the student table by StudentDAO.archive_students,
+        read-only. Range partitioned on created_on with one partition per year,
+        created by create_archive_partitions when a batch needs it.
+        Attributes:
+            columns of Student, the primary key includes the partition key.
+            archived_on (datetime): time the student was archived.
+    """
+    __tablename__ = 'student_archive'
+    id = DB.Column(UUID, primary_key=True)
+    created_on = DB.Column(DB.DateTime, primary_key=True)
+    name = DB.Column(DB.String(100))
+    class_id = DB.Column(UUID, nullable=True, index=True)
+    updated_on = DB.Column(DB.DateTime, nullable=True)
+    enrolled_on = DB.Column(DB.DateTime, nullable=True)
+    version = DB.Column(DB.Integer, nullable=False, server_default='1')
+    archived_on = DB.Column(DB.DateTime, nullable=False)
+    __table_args__ = (
+        DB.Index('ix_student_archive_created_on_id', 'created_on', 'id'),
+        {'postgresql_partition_by': 'RANGE (created_on)'},
+    )
+
+
+class StudentSearchResult(namedtuple('StudentSearchResult',
+                                     ['id', 'name', 'class_id', 'score'])):
+    """
+    One ranked match of the student name search, score 1 for prefix matches
+    and the trigram similarity otherwise
+    """
+    __slots__ = ()
+
+    @property
+    def serialize(self):
+        """
+        :return: json serializable dict of the match
+        """
+        return {'id': str(self.id), 'name': self.name,
+                'class_id': self.class_id and str(self.class_id), 'score': self.score}
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+conftest.py has the fixtures of the test suite. The tests run against the
+PostgreSQL database named by STUDENT_MANAGEMENT_TEST_DB_URL, whose public
+schema is dropped and created again before every test, and are skipped when
+it is not set
+
+    STUDENT_MANAGEMENT_TEST_DB_URL=postgresql://postgres@localhost/studentmanagement_test \
+        python3 -m pytest -q tests
+"""
+
+import os
+import sys
+import pytest
+
+TEST_DB_URL_ENV_VAR = "STUDENT_MANAGEMENT_TEST_DB_URL"
+TEST_DB_URL = os.environ.get(TEST_DB_URL_ENV_VAR)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if TEST_DB_URL:
+    # read by configuration, before models is imported
+    os.environ["STUDENT_MANAGEMENT_DB_URL"] = TEST_DB_URL
+    os.environ["STUDENT_MANAGEMENT_EVENTS_BROKER"] = "local"
+    os.environ.pop("STUDENT_MANAGEMENT_REPLICA_DB_URLS", None)
+    os.environ.pop("STUDENT_MANAGEMENT_CACHE_DIR", None)
+
+
+@pytest.fixture(scope='session')
+def app():
+    """
+    :return: flask app of handler.py, its job workers are not started, the
+             tests run the jobs themselves
+    """
+    if not TEST_DB_URL:
+        pytest.skip("{0} is not set".format(TEST_DB_URL_ENV_VAR))
+    import handler  # pylint: disable=import-outside-toplevel
+    import models  # pylint: disable=import-outside-toplevel
+
+    models.JOB_RUNNER.workers = 0
+    return handler.app
+
+
+@pytest.fixture
+def models_module(app):  # pylint: disable=redefined-outer-name
+    """
+    :param app: flask app
+    :return: models, in an app context on an empty schema
+    """
+    import models  # pylint: disable=import-outside-toplevel
+
+    with app.app_context():
+        models.DB.session.execute("DROP SCHEMA public CASCADE")
+        models.DB.session.execute("CREATE SCHEMA public")
+        models.DB.session.commit()
+        models.DB.create_all(bind=None)
+        with models.DB.engine.connect() as connection:
+            models.upgrade_schema(connection)
+            models.create_search_indexes(connection)
+        models.CLASS_CACHE.invalidate()
+        models.DATA_VERSION.bump()
+        yield models
+        models.DB.session.remove()
+
+
+@pytest.fixture
+def client(app, models_module):  # pylint: disable=redefined-outer-name,unused-argument
+    """
+    :return: flask test client on an empty schema
+    """
+    return app.test_client()
+
+
+@pytest.fixture
+def tokens(models_module):  # pylint: disable=redefined-outer-name
+    """
+    :return: tuple of the xsrf tokens of the student and of the class forms
+    """
+    return (str(models_module.XSRFToken.create_xsrf_token(
+        models_module.StudentDAO.XSRF_TOKEN_MESSAGE)),
+            str(models_module.XSRFToken.create_xsrf_token(
+                models_module.StudentClassDAO.XSRF_TOKEN_MESSAGE)))
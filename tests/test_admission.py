@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+test_admission.py tests the admission control of the write endpoints: 429
+for a client over its rate, 503 when no slot frees before the deadline
+"""
+
+import threading
+import time
+import admission
+import configuration
+
+
+def test_controller_queue_and_deadline():
+    controller = admission.AdmissionController('write', 1, 1, 0.1)
+    assert controller.acquire('a') is None
+    waiting = []
+    thread = threading.Thread(target=lambda: waiting.append(controller.acquire('b')))
+    thread.start()
+    for _ in range(100):
+        if controller.stats['queued']:
+            break
+        time.sleep(0.01)
+    # the queue is full, the waiting request is shed at its deadline
+    assert controller.acquire('c') == admission.Rejection(admission.QUEUE_FULL, 1)
+    thread.join(5)
+    assert waiting == [admission.Rejection(admission.DEADLINE, 1)]
+
+    controller.release()
+    assert controller.acquire('d') is None
+    assert controller.stats == {'running': 1, 'queued': 0}
+    assert controller.rejected == {admission.QUEUE_FULL: 1, admission.DEADLINE: 1}
+
+
+def test_token_buckets_per_client():
+    buckets = admission.TokenBuckets(10, 2, 2)
+    assert buckets.take('a') == 0 and buckets.take('a') == 0
+    assert 0 < buckets.take('a') <= 0.1
+    assert buckets.take('b') == 0
+    time.sleep(0.11)
+    assert buckets.take('a') == 0
+
+
+def test_client_over_its_rate_gets_429(client):
+    # a client address of its own, the buckets outlive the test
+    environ = {'REMOTE_ADDR': '10.99.0.1'}
+    burst = configuration.ADMISSION_RATE_LIMITS['bulk'][1]
+    for _ in range(burst):
+        assert client.post('/delete_students', json={}, environ_base=environ).status_code == 401
+    response = client.post('/delete_students', json={}, environ_base=environ)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert client.post('/delete_students', json={},
+                       environ_base={'REMOTE_ADDR': '10.99.0.2'}).status_code == 401
+
+
+def test_busy_endpoint_class_gets_503(client, monkeypatch):
+    import middleware  # pylint: disable=import-outside-toplevel
+    controller = middleware.ADMISSION['bulk']
+    monkeypatch.setattr(controller, 'max_wait_seconds', 0.1)
+    assert controller.acquire('test') is None
+    try:
+        response = client.post('/delete_students', json={},
+                               environ_base={'REMOTE_ADDR': '10.99.0.3'})
+    finally:
+        controller.release()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert client.post('/delete_students', json={},
+                       environ_base={'REMOTE_ADDR': '10.99.0.3'}).status_code == 401
+
+
+def test_event_streams_are_limited_without_admission_control(client, monkeypatch):
+    import handler  # pylint: disable=import-outside-toplevel
+    import middleware  # pylint: disable=import-outside-toplevel
+    monkeypatch.setattr(middleware, 'ADMISSION', {})
+    streams = middleware.EVENT_STREAMS
+    held = 0
+    try:
+        while streams.acquire('test') is None:
+            held += 1
+        assert held == configuration.EVENTS_MAX_STREAMS
+        response = client.get('/events')
+        assert response.status_code == 503
+        assert response.data.decode('utf-8') == 'retry: {0}\n\n'.format(
+            configuration.EVENTS_BUSY_RETRY_MILLISECONDS)
+    finally:
+        for _ in range(held):
+            streams.release()
+
+    def unavailable(**kwargs):
+        raise RuntimeError("broker down")
+    monkeypatch.setattr(handler.models, 'subscribe_events', unavailable)
+    assert client.get('/events').status_code == 400
+    assert streams.stats['running'] == 0
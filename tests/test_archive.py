@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+test_archive.py tests the move of students to student_archive and their
+reads through StudentRecord afterwards
+"""
+
+import datetime
+import uuid
+import configuration
+
+
+def add_old_students(models, class_id, names, years_ago, random_ids=False):
+    """
+    :param models: models module
+    :param class_id: class of the students
+    :param names: names of the students
+    :param years_ago: age of the students
+    :param random_ids: give the students uuid4 ids, as created before user-012
+    :return: list of the student ids in creation order
+    """
+    created_on = datetime.datetime.now() - datetime.timedelta(days=365 * years_ago)
+    student_ids = []
+    for offset, name in enumerate(names):
+        student_id = str(uuid.uuid4()) if random_ids else models.uuid7()
+        models.DB.session.execute(models.Student.__table__.insert().values(
+            id=student_id, name=name, class_id=class_id,
+            created_on=created_on + datetime.timedelta(seconds=offset),
+            enrolled_on=created_on))
+        student_ids.append(student_id)
+    models.DB.session.commit()
+    models.ClassStatisticsDAO.rebuild()
+    return student_ids
+
+
+def test_archive_moves_old_students(models_module):
+    models = models_module
+    course = models.StudentClassDAO.add_class('History')
+    class_id = str(course.id)
+    old_ids = add_old_students(models, class_id, ['Ada', 'Brian'], years_ago=6)
+    recent = models.StudentDAO.add_student(class_id=class_id, student_name='Cleo')
+
+    cutoff = datetime.datetime.now() - datetime.timedelta(
+        days=configuration.ARCHIVE_AFTER_DAYS)
+    assert models.StudentDAO.count_archivable_students(archived_before=cutoff) == 2
+    assert models.StudentDAO.archive_students(archived_before=cutoff) == old_ids
+    assert models.StudentDAO.archive_students(archived_before=cutoff) == []
+
+    active = models.StudentDAO.get_student_records_by_class_id(class_id)
+    assert [record.id for record in active] == [str(recent.id)]
+    everyone = models.StudentDAO.get_student_records_by_class_id(class_id, include_archived=True)
+    assert [record.id for record in everyone] == old_ids + [str(recent.id)]
+    assert all(isinstance(record, models.StudentRecord) for record in everyone)
+    assert [record.name for record in everyone] == ['Ada', 'Brian', 'Cleo']
+    assert models.DB.session.query(models.StudentArchive).count() == 2
+    statistics = {str(row.class_id): row
+                  for row in models.ClassStatisticsDAO.get_class_statistics()[0]}
+    assert statistics[class_id].student_count == 1
+
+
+def test_archive_of_closed_class_clears_leader(client, models_module, tokens):
+    models = models_module
+    class_id = str(models.StudentClassDAO.add_class('Latin').id)
+    leader_id = str(models.StudentDAO.add_student(class_id=class_id, student_name='Dora').id)
+    models.StudentClassDAO.update_class_details(class_id=class_id, class_leader_id=leader_id)
+
+    response = client.put('/close_class', data={'class_id': class_id, 'xsrf_token': tokens[1]})
+    assert response.status_code == 200
+    assert models.StudentDAO.archive_students(closed_classes=True) == [leader_id]
+
+    assert models.StudentClassDAO.get_class_by_id(class_id).class_leader is None
+    page = client.get('/api/classes/{0}/students?include_archived=1'.format(class_id)).json
+    assert [student['id'] for student in page['students']] == [leader_id]
+    assert client.get('/api/classes/{0}/students'.format(class_id)).json['students'] == []
+
+
+def test_migrate_ids_remaps_archived_students(models_module):
+    models = models_module
+    class_id = str(uuid.uuid4())
+    models.DB.session.execute(models.StudentClass.__table__.insert().values(
+        id=class_id, name='Greek', created_on=datetime.datetime.now()))
+    old_ids = add_old_students(models, class_id, ['Eve', 'Finn'], years_ago=6, random_ids=True)
+    active_id = add_old_students(models, class_id, ['Gus'], years_ago=1, random_ids=True)[0]
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=365 * 5)
+    assert models.StudentDAO.archive_students(archived_before=cutoff) == old_ids
+
+    assert models.migrate_ids_to_uuid7() == (3, 1)
+
+    new_class_id = str(models.StudentClass.query.one().id)
+    assert new_class_id != class_id and new_class_id[14] == '7'
+    everyone = models.StudentDAO.get_student_records_by_class_id(new_class_id,
+                                                                 include_archived=True)
+    assert [record.name for record in everyone] == ['Eve', 'Finn', 'Gus']
+    assert all(record.id[14] == '7' for record in everyone)
+    assert not {record.id for record in everyone} & set(old_ids + [active_id])
+    assert models.StudentDAO.get_student_records_by_class_id(class_id,
+                                                             include_archived=True) == []
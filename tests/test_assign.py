@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+"""
+test_assign.py tests the bulk class assignment of StudentDAO.assign_classes
+"""
+
+
+def test_assign_classes_reports_duplicates(models_module):
+    models = models_module
+    class_id = str(models.StudentClassDAO.add_class('Drama').id)
+    twice = str(models.StudentDAO.add_student(student_name='Ana').id)
+    once = str(models.StudentDAO.add_student(student_name='Ben').id)
+
+    result = models.StudentDAO.assign_classes({twice: class_id, twice.upper(): class_id,
+                                               once: class_id, 'not-an-id': class_id})
+    assert result == {twice: False, twice.upper(): False, once: True, 'not-an-id': False}
+    assert models.StudentDAO.get_student_by_id(twice).class_id is None
+    assert str(models.StudentDAO.get_student_by_id(once).class_id) == class_id
+
+
+def test_assign_job_refuses_duplicates(client, models_module, tokens):
+    models = models_module
+    class_id = str(models.StudentClassDAO.add_class('Drama').id)
+    student_id = str(models.StudentDAO.add_student(student_name='Ana').id)
+
+    response = client.post('/jobs', json={
+        'kind': 'assign_students', 'xsrf_token': tokens[0],
+        'assignments': {student_id: class_id, '{' + student_id + '}': class_id}})
+    assert response.status_code == 400
+    assert 'more than once' in response.json['message']
+    assert models.Job.query.count() == 0
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+test_batch.py tests the unit of work of the DAO methods and the /batch
+endpoint built on it: the operations of a batch are committed together, or
+none of them when one fails
+"""
+
+import itertools
+from sqlalchemy import event
+
+# every batch from an address of its own, /batch is rate limited per client
+ADDRESSES = ('10.98.{0}.{1}'.format(index // 250, index % 250 + 1)
+             for index in itertools.count())
+
+
+def database_rows(models):
+    """
+    :param models: models module
+    :return: (sorted names of the students, sorted names of the classes) in the database
+    """
+    models.DB.session.rollback()
+    return (sorted(row.name for row in models.DB.session.query(models.Student.name)),
+            sorted(row.name for row in models.DB.session.query(models.StudentClass.name)))
+
+
+def post_batch(client, operations):
+    """
+    :param client: flask test client
+    :param operations: list of the operations
+    :return: response
+    """
+    return client.post('/batch', json={'operations': operations},
+                       environ_base={'REMOTE_ADDR': next(ADDRESSES)})
+
+
+def test_nested_unit_of_work_commits_once(models_module):
+    models = models_module
+    commits = []
+    session = models.DB.session()
+
+    def after_commit(committed):
+        commits.append(committed)
+    event.listen(session, 'after_commit', after_commit)
+    version = models.DATA_VERSION.value
+    try:
+        with models.unit_of_work() as work:
+            models.StudentClassDAO.add_class('Art')
+            with models.unit_of_work() as inner:
+                assert inner is work
+                models.StudentDAO.add_student(student_name='Ana')
+            assert not commits
+            models.StudentDAO.add_student(student_name='Ben')
+            assert not commits
+    finally:
+        event.remove(session, 'after_commit', after_commit)
+    assert len(commits) == 1
+    assert models.DATA_VERSION.value == version + 1
+    assert database_rows(models) == (['Ana', 'Ben'], ['Art'])
+
+
+def test_unit_of_work_rolls_back_on_error(models_module):
+    models = models_module
+    try:
+        with models.unit_of_work():
+            models.StudentDAO.add_student(student_name='Ana')
+            with models.unit_of_work():
+                models.StudentClassDAO.add_class('Art')
+                raise RuntimeError("failed")
+    except RuntimeError:
+        pass
+    assert database_rows(models) == ([], [])
+
+
+def test_batch_is_committed_together(client, models_module, tokens):
+    models = models_module
+    version = models.DATA_VERSION.value
+    response = post_batch(client, [
+        {'op': 'add_class', 'class_name': 'Art', 'xsrf_token': tokens[1]},
+        {'op': 'add_student', 'student_name': 'Ana', 'xsrf_token': tokens[0]}])
+    assert response.status_code == 200
+    assert [result['op'] for result in response.json['results']] == ['add_class', 'add_student']
+    assert models.DATA_VERSION.value == version + 1
+    assert database_rows(models) == (['Ana'], ['Art'])
+
+
+def test_failing_operation_rolls_back_the_batch(client, models_module, tokens, monkeypatch):
+    models = models_module
+    models.StudentDAO.add_student(student_name='Ana')
+    version = models.DATA_VERSION.value
+    response = post_batch(client, [
+        {'op': 'add_class', 'class_name': 'Art', 'xsrf_token': tokens[1]},
+        {'op': 'add_student', 'student_name': 'Ben', 'xsrf_token': tokens[0]},
+        {'op': 'update_student', 'student_id': str(models.uuid7()), 'student_name': 'Cy',
+         'xsrf_token': tokens[0]}])
+    assert (response.status_code, response.json['index']) == (400, 2)
+    assert database_rows(models) == (['Ana'], [])
+
+    def failing(*args, **kwargs):
+        raise RuntimeError("database failure")
+    monkeypatch.setattr(models.StudentDAO, 'delete_students', failing)
+    response = post_batch(client, [
+        {'op': 'add_student', 'student_name': 'Ben', 'xsrf_token': tokens[0]},
+        {'op': 'delete_students', 'student_ids': [], 'xsrf_token': tokens[0]}])
+    assert (response.status_code, response.json['index']) == (400, 1)
+    assert database_rows(models) == (['Ana'], [])
+    assert models.DATA_VERSION.value == version
+
+
+def test_version_conflict_leaves_the_batch_unapplied(client, models_module, tokens):
+    models = models_module
+    student = models.StudentDAO.add_student(student_name='Ana')
+    student_id, student_version = str(student.id), student.version
+    response = post_batch(client, [
+        {'op': 'add_class', 'class_name': 'Art', 'xsrf_token': tokens[1]},
+        {'op': 'update_student', 'student_id': student_id, 'student_name': 'Anna',
+         'version': student_version, 'xsrf_token': tokens[0]},
+        {'op': 'update_student', 'student_id': student_id, 'student_name': 'Ann',
+         'version': student_version, 'xsrf_token': tokens[0]}])
+    assert (response.status_code, response.json['index']) == (409, 2)
+    assert database_rows(models) == (['Ana'], [])
+
+
+def test_invalid_batch_is_not_applied(client, models_module, tokens):
+    models = models_module
+    response = post_batch(client, [
+        {'op': 'add_class', 'class_name': 'Art', 'xsrf_token': tokens[1]},
+        {'op': 'add_student', 'student_name': 'Ben', 'xsrf_token': tokens[1]}])
+    assert (response.status_code, response.json['index']) == (401, 1)
+    response = post_batch(client, [
+        {'op': 'add_class', 'class_name': 'Art', 'xsrf_token': tokens[1]},
+        {'op': 'drop_everything'}])
+    assert (response.status_code, response.json['index']) == (400, 1)
+    assert database_rows(models) == ([], [])
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+test_compression.py tests the content encoding of the responses: it is
+negotiated from Accept-Encoding, applied once, also to the pages served
+from the render cache, and keeps the ETags of the encodings apart
+"""
+
+import gzip
+import zlib
+import compression
+
+GZIP_HEADERS = {'Accept-Encoding': 'gzip'}
+
+
+def add_students(models, count):
+    """
+    :param models: models module
+    :param count: number of students to add, without class
+    :return:
+    """
+    for index in range(count):
+        models.StudentDAO.add_student(student_name='Student {0}'.format(index))
+
+
+def test_encoding_is_negotiated(client, models_module):
+    models = models_module
+    assert client.get('/api/students', headers=GZIP_HEADERS).headers.get(
+        'Content-Encoding') is None
+    add_students(models, 30)
+    identity = client.get('/api/students')
+    assert 'Content-Encoding' not in identity.headers
+    assert identity.headers['Vary'] == 'Accept-Encoding'
+
+    response = client.get('/api/students', headers=GZIP_HEADERS)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(response.data) == identity.data
+    for accept_encoding in ('gzip;q=0', 'identity', 'deflate'):
+        response = client.get('/api/students', headers={'Accept-Encoding': accept_encoding})
+        assert 'Content-Encoding' not in response.headers
+        assert response.data == identity.data
+
+
+def test_cached_page_is_encoded_once(client, models_module):
+    import handler  # pylint: disable=import-outside-toplevel
+    models = models_module
+    add_students(models, 5)
+    identity = client.get('/')
+    assert identity.headers.get('Content-Encoding') is None
+
+    bodies = []
+    for _ in range(2):
+        hits = handler.RENDER_CACHE.hits
+        response = client.get('/', headers=GZIP_HEADERS)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['ETag'] == identity.headers['ETag'][:-1] + '-gzip"'
+        assert gzip.decompress(response.data) == identity.data
+        bodies.append(response.data)
+    # the second response is the cached page and its cached encoding
+    assert handler.RENDER_CACHE.hits == hits + 2
+    assert bodies[0] == bodies[1]
+
+    response = client.get('/', headers=dict(GZIP_HEADERS, **{
+        'If-None-Match': identity.headers['ETag']}))
+    assert response.status_code == 200
+    response = client.get('/', headers=dict(GZIP_HEADERS, **{
+        'If-None-Match': response.headers['ETag']}))
+    assert (response.status_code, response.data) == (304, b'')
+
+
+def test_streamed_export_is_encoded_chunk_by_chunk(client, models_module):
+    models = models_module
+    add_students(models, 3)
+    identity = client.get('/export/students').data
+    response = client.get('/export/students', headers=GZIP_HEADERS)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert gzip.decompress(response.data) == identity
+
+    # a gzip export is already encoded, it is not encoded a second time
+    response = client.get('/export/students?gzip=1', headers=GZIP_HEADERS)
+    assert 'Content-Encoding' not in response.headers
+    assert gzip.decompress(response.data) == identity
+
+
+def test_streamed_chunks_are_flushed():
+    compressor = compression.ResponseCompressor(('text/csv',), 1024, 6, 5)
+    decoder = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    chunks = compressor.iter_compress(iter(['a,b\n', 'c,d\n']), compression.GZIP)
+    # every chunk can be decoded as soon as it is received
+    assert decoder.decompress(next(chunks)) == b'a,b\n'
+    assert decoder.decompress(next(chunks)) == b'c,d\n'
+    assert decoder.decompress(b''.join(chunks)) == b''
+    assert decoder.eof
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+test_course.py tests the course view: the class, its leader and its students
+loaded with one statement through the relationships of Student and
+StudentClass
+"""
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError, OperationalError
+from sqlalchemy.orm import joinedload
+
+
+def count_statements(models, function):
+    """
+    :param models: models module
+    :param function: called without arguments
+    :return: (result of function, number of statements it sent)
+    """
+    statements = []
+
+    def before_cursor_execute(*args):
+        statements.append(args[2])
+    event.listen(models.DB.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        return function(), len(statements)
+    finally:
+        event.remove(models.DB.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def test_course_view_is_one_statement(models_module):
+    models = models_module
+    class_id = str(models.StudentClassDAO.add_class('Art').id)
+    student_ids = [str(models.StudentDAO.add_student(class_id=class_id, student_name=name).id)
+                   for name in ('Ana', 'Ben', 'Cy')]
+    models.StudentClassDAO.update_class_details(class_id=class_id, class_leader_id=student_ids[1])
+    models.DB.session.commit()
+
+    view, statements = count_statements(
+        models, lambda: models.StudentClassDAO.get_course_view(class_id))
+    assert statements == 1
+    assert view.course.id == class_id
+    assert view.leader.id == student_ids[1]
+    assert [student.id for student in view.students] == student_ids
+
+    view = models.StudentClassDAO.get_course_view(class_id, with_students=False)
+    assert (view.leader.id, view.students) == (student_ids[1], [])
+    assert models.StudentClassDAO.get_course_view(str(models.uuid7())) is None
+
+
+def test_relationships_only_load_when_asked(models_module):
+    models = models_module
+    class_id = str(models.StudentClassDAO.add_class('Art').id)
+    student_id = str(models.StudentDAO.add_student(class_id=class_id, student_name='Ana').id)
+    models.DB.session.commit()
+    models.DB.session.expunge_all()
+
+    course = models.StudentClass.query.get(class_id)
+    with pytest.raises(InvalidRequestError):
+        course.students  # pylint: disable=pointless-statement
+    course = models.StudentClass.query.options(
+        joinedload(models.StudentClass.students),
+        joinedload(models.StudentClass.leader)).filter_by(id=class_id).one()
+    assert [student.id for student in course.students] == [student_id]
+    assert course.leader is None
+    models.DB.session.expunge_all()
+    student = models.Student.query.options(joinedload(models.Student.student_class)).get(
+        student_id)
+    assert student.student_class.id == class_id
+
+
+def test_course_page_answers(client, models_module, monkeypatch):
+    models = models_module
+    class_id = str(models.StudentClassDAO.add_class('Art').id)
+    models.DB.session.commit()
+    assert client.get('/showCourse/not-a-uuid').status_code == 404
+    assert client.get('/showCourse/{0}'.format(models.uuid7())).status_code == 404
+
+    def unavailable(*args, **kwargs):
+        raise OperationalError('SELECT', {}, Exception('server closed the connection'))
+    monkeypatch.setattr(models.StudentDAO, 'get_unassigned_students_page', unavailable)
+    response = client.get('/showCourse/{0}?degraded'.format(class_id))
+    assert response.status_code == 200 and b'Art' in response.data
+    monkeypatch.setattr(models.StudentClassDAO, 'get_course_view', unavailable)
+    assert client.get('/showCourse/{0}?failed'.format(class_id)).status_code == 503
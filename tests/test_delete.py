@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+test_delete.py tests the bulk delete of students, by ids and/or filters,
+and the clearing of the class leaders among them
+"""
+
+import datetime
+import itertools
+import pytest
+
+# every request from an address of its own, /delete_students is rate limited per client
+ADDRESSES = ('10.97.{0}.{1}'.format(index // 250, index % 250 + 1)
+             for index in itertools.count())
+
+
+def add_cohort(models):
+    """
+    Adds the classes Art, led by Ana, and Math, led by Cy, with Ana, Ben in
+    Art created a year ago, Cy in Math created today and Dee without class
+    :param models: models module
+    :return: dict of the ids of the classes and the students by name
+    """
+    ids = {name: str(models.StudentClassDAO.add_class(name).id) for name in ('Art', 'Math')}
+    for name, class_name in (('Ana', 'Art'), ('Ben', 'Art'), ('Cy', 'Math'), ('Dee', None)):
+        ids[name] = str(models.StudentDAO.add_student(class_id=ids.get(class_name),
+                                                      student_name=name).id)
+    models.DB.session.execute(models.Student.__table__.update().where(
+        models.Student.class_id == ids['Art']).values(
+            created_on=datetime.datetime.now() - datetime.timedelta(days=365)))
+    models.StudentClassDAO.update_class_details(class_id=ids['Art'], class_leader_id=ids['Ana'])
+    models.StudentClassDAO.update_class_details(class_id=ids['Math'], class_leader_id=ids['Cy'])
+    models.DB.session.commit()
+    return ids
+
+
+def remaining(models):
+    """
+    :param models: models module
+    :return: (sorted names of the students, dict of class name -> leader id)
+    """
+    models.DB.session.rollback()
+    return (sorted(row.name for row in models.DB.session.query(models.Student.name)),
+            {row.name: row.class_leader and str(row.class_leader) for row in
+             models.DB.session.query(models.StudentClass.name,
+                                     models.StudentClass.class_leader)})
+
+
+def delete(client, tokens, **payload):
+    """
+    :param client: flask test client
+    :param tokens: xsrf tokens fixture
+    :param payload: selection of the students
+    :return: response
+    """
+    payload['xsrf_token'] = tokens[0]
+    return client.post('/delete_students', json=payload,
+                       environ_base={'REMOTE_ADDR': next(ADDRESSES)})
+
+
+def test_delete_by_ids_clears_their_leadership(models_module):
+    models = models_module
+    ids = add_cohort(models)
+    deleted, cleared = models.StudentDAO.delete_students(student_ids=[ids['Ana'], ids['Dee']])
+    assert (sorted(deleted), cleared) == (sorted([ids['Ana'], ids['Dee']]), 1)
+    assert remaining(models) == (['Ben', 'Cy'], {'Art': None, 'Math': ids['Cy']})
+    assert models.StudentClassDAO.get_class_by_id(ids['Art']).class_leader is None
+
+
+def test_delete_by_filters_only(models_module):
+    models = models_module
+    ids = add_cohort(models)
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=30)
+    assert models.StudentDAO.count_selected_students(created_before=cutoff) == 2
+    deleted, cleared = models.StudentDAO.delete_students(created_before=cutoff)
+    assert (sorted(deleted), cleared) == (sorted([ids['Ana'], ids['Ben']]), 1)
+    assert remaining(models) == (['Cy', 'Dee'], {'Art': None, 'Math': ids['Cy']})
+
+    # all the given filters must match
+    assert models.StudentDAO.delete_students(class_id=ids['Math'],
+                                             created_before=cutoff) == ([], 0)
+    assert models.StudentDAO.delete_students(class_id=ids['Math'],
+                                             created_after=cutoff) == ([ids['Cy']], 1)
+    assert remaining(models) == (['Dee'], {'Art': None, 'Math': None})
+
+
+def test_empty_selection(models_module):
+    models = models_module
+    ids = add_cohort(models)
+    assert models.StudentDAO.delete_students(student_ids=[]) == ([], 0)
+    with pytest.raises(ValueError):
+        models.StudentDAO.delete_students()
+    with pytest.raises(ValueError):
+        models.StudentDAO.delete_students(student_ids=['not an id'])
+    assert remaining(models) == (['Ana', 'Ben', 'Cy', 'Dee'],
+                                 {'Art': ids['Ana'], 'Math': ids['Cy']})
+
+
+def test_delete_students_route(client, models_module, tokens):
+    models = models_module
+    ids = add_cohort(models)
+    unknown = str(models.uuid7())
+    response = delete(client, tokens, student_ids=[ids['Cy'], unknown])
+    assert response.status_code == 200
+    assert (response.json['deleted'], response.json['leaders_cleared'],
+            response.json['not_found']) == (1, 1, [unknown])
+
+    response = delete(client, tokens, class_id=ids['Art'])
+    assert response.status_code == 200
+    assert (response.json['deleted'], response.json['leaders_cleared']) == (2, 1)
+    assert 'not_found' not in response.json
+    assert remaining(models) == (['Dee'], {'Art': None, 'Math': None})
+
+    assert delete(client, tokens, student_ids=[]).json['deleted'] == 0
+    assert delete(client, tokens).status_code == 400
+    assert delete(client, tokens, student_ids='all').status_code == 400
+    assert remaining(models)[0] == ['Dee']
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+test_events.py tests the change events sent with NOTIFY when a
+transaction commits
+"""
+# pylint: disable=redefined-outer-name
+
+import datetime
+import json
+import select
+import pytest
+import configuration
+
+
+@pytest.fixture
+def listener(models_module, monkeypatch):  # pylint: disable=unused-argument
+    """
+    :return: function returning the payloads notified since the last call
+    """
+    monkeypatch.setattr(configuration, 'EVENTS_BROKER', 'postgres')
+    import change_events  # pylint: disable=import-outside-toplevel
+    connection = change_events._connect_event_listener()  # pylint: disable=protected-access
+    connection.rollback()
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute('LISTEN "{0}"'.format(configuration.EVENTS_CHANNEL))
+
+    def notified():
+        select.select([connection], [], [], 1)
+        connection.poll()
+        payloads = [json.loads(notify.payload) for notify in connection.notifies]
+        del connection.notifies[:]
+        return payloads
+    yield notified
+    connection.close()
+
+
+def add_students_and_classes(models, count):
+    """
+    :param models: models module
+    :param count: number of students without class and of classes to add
+    :return: dict of student id -> class id, a class of its own for every student
+    """
+    now = datetime.datetime.now()
+    class_ids = [models.uuid7() for _ in range(count)]
+    student_ids = [models.uuid7() for _ in range(count)]
+    models.DB.session.execute(models.StudentClass.__table__.insert(), [
+        {'id': class_id, 'name': 'Class', 'created_on': now} for class_id in class_ids])
+    models.DB.session.execute(models.Student.__table__.insert(), [
+        {'id': student_id, 'name': 'Student', 'created_on': now} for student_id in student_ids])
+    models.DB.session.commit()
+    models.ClassStatisticsDAO.rebuild()
+    return dict(zip(student_ids, class_ids))
+
+
+def test_reload_event_sends_the_class_ids_once(models_module, listener):
+    models = models_module
+    assignments = add_students_and_classes(models, 120)
+    listener()
+
+    assert all(models.StudentDAO.assign_classes(assignments).values())
+    (event_type, class_ids, data), = listener()
+    assert (event_type, data) == ('reload', {})
+    assert sorted(class_ids, key=str) == sorted(list(assignments.values()) + [None], key=str)
+
+
+def test_reload_of_too_many_classes_reaches_every_stream(models_module, listener):
+    models = models_module
+    assignments = add_students_and_classes(models, 250)
+    listener()
+
+    assert all(models.StudentDAO.assign_classes(assignments).values())
+    assert listener() == [['reload', [], {}]]
+    assert models.StudentDAO.get_student_records_by_class_id(list(assignments.values())[-1])
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""
+test_export.py tests the streamed CSV and NDJSON exports
+"""
+
+import gzip
+import json
+
+
+def test_export_formats(client, models_module):
+    models = models_module
+    class_id = str(models.StudentClassDAO.add_class('Music').id)
+    for name in ('Ana', 'Ben'):
+        models.StudentDAO.add_student(class_id=class_id, student_name=name)
+
+    response = client.get('/export/students')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    lines = response.data.decode('utf-8').splitlines()
+    assert lines[0] == ','.join(models.StudentDAO.EXPORT_COLUMNS)
+    assert [line.split(',')[1] for line in lines[1:]] == ['Ana', 'Ben']
+
+    response = client.get('/export/roster/{0}?format=ndjson&gzip=1'.format(class_id))
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'].endswith('.ndjson.gz')
+    rows = [json.loads(line) for line in gzip.decompress(response.data).splitlines()]
+    assert [row['name'] for row in rows] == ['Ana', 'Ben']
+
+
+def test_unsupported_format_runs_no_query(client, models_module, monkeypatch):
+    models = models_module
+    class_id = str(models.StudentClassDAO.add_class('Music').id)
+
+    def no_query(*args, **kwargs):
+        raise AssertionError("the format is validated before any query")
+    import classes  # pylint: disable=import-outside-toplevel
+    import student_dao  # pylint: disable=import-outside-toplevel
+    monkeypatch.setattr(student_dao, 'stream_records', no_query)
+    monkeypatch.setattr(classes, 'stream_records', no_query)
+    monkeypatch.setattr(models.StudentClassDAO, 'get_class_by_id', no_query)
+
+    for url in ('/export/students', '/export/classes', '/export/roster/{0}'.format(class_id)):
+        response = client.get(url + '?format=xml')
+        assert response.status_code == 400
+        assert response.json == {'message': 'Unsupported export format'}
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+test_import.py tests the bulk import of students from CSV and NDJSON
+uploads: the rows are loaded with COPY batch by batch, and the rows which
+can not be imported are reported by row number
+"""
+
+import io
+import itertools
+import json
+import importer
+import configuration
+
+# every upload from an address of its own, /import_students is rate limited per client
+ADDRESSES = ('10.96.{0}.{1}'.format(index // 250, index % 250 + 1)
+             for index in itertools.count())
+
+
+def upload(client, tokens, body, content_type):
+    """
+    :param client: flask test client
+    :param tokens: xsrf tokens fixture
+    :param body: str uploaded
+    :param content_type:
+    :return: response
+    """
+    return client.post('/import_students', data=body.encode('utf-8'),
+                       content_type=content_type, headers={'X-XSRF-Token': tokens[0]},
+                       environ_base={'REMOTE_ADDR': next(ADDRESSES)})
+
+
+def imported_students(models):
+    """
+    :param models: models module
+    :return: sorted (name, class_id, enrolled) of the students in the database
+    """
+    models.DB.session.rollback()
+    return sorted((row.name, row.class_id and str(row.class_id), row.enrolled_on is not None)
+                  for row in models.DB.session.query(models.Student))
+
+
+def test_lines_are_split_across_chunks():
+    body = 'name\nZoë\r\n"Ann, Jr."\nlast'.encode('utf-8-sig')
+    lines = list(importer.iter_lines(io.BytesIO(body), chunk_size=1))
+    assert lines == ['name\n', 'Zoë\r\n', '"Ann, Jr."\n', 'last']
+    assert [row.student_name for row in importer.iter_csv_rows(lines)] == [
+        'Zoë', 'Ann, Jr.', 'last']
+
+
+def test_csv_import_reports_every_failed_row(client, models_module, tokens, monkeypatch):
+    models = models_module
+    monkeypatch.setattr(configuration, 'IMPORT_BATCH_SIZE', 2)
+    class_id = str(models.StudentClassDAO.add_class('Art').id)
+    unknown_class_id = str(models.uuid7())
+    body = '\n'.join([
+        'student_name,class_id',
+        'Ana,{0}'.format(class_id),
+        ',',
+        '"Ben ""B"", Jr.",',
+        'Cy,{0}'.format(unknown_class_id),
+        'Dee,not-a-uuid',
+        '{0},'.format('x' * 101),
+        'Eli,{0}'.format(class_id.upper()),
+        'Fay',
+    ]) + '\n'
+    response = upload(client, tokens, body, 'text/csv')
+    assert response.status_code == 200
+    report = response.json['message']
+    assert (report['imported'], report['failed']) == (4, 4)
+    # unknown class ids are found when their batch is loaded, after the malformed rows
+    errors = {error['row']: error['error'] for error in report['errors']}
+    assert sorted(errors) == [2, 4, 5, 6]
+    assert errors[4] == 'Class {0} does not exist'.format(unknown_class_id)
+    assert imported_students(models) == [
+        ('Ana', class_id, True), ('Ben "B", Jr.', None, False), ('Eli', class_id, True),
+        ('Fay', None, False)]
+    statistics, unassigned = models.ClassStatisticsDAO.get_class_statistics()
+    assert ([row.student_count for row in statistics], unassigned) == ([2], 2)
+
+
+def test_ndjson_import_and_reported_errors_limit(client, models_module, tokens, monkeypatch):
+    models = models_module
+    monkeypatch.setattr(configuration, 'IMPORT_MAX_REPORTED_ERRORS', 2)
+    body = '\n'.join([
+        json.dumps({'student_name': 'Ana'}),
+        '',
+        '{"name": "Ben"',
+        json.dumps(['Cy']),
+        json.dumps({'name': 'Dee', 'class_id': 7}),
+        json.dumps({'name': 'Eli'}),
+    ])
+    response = upload(client, tokens, body, 'application/x-ndjson')
+    assert response.status_code == 200
+    report = response.json['message']
+    assert (report['imported'], report['failed']) == (2, 3)
+    assert [error['row'] for error in report['errors']] == [3, 4]
+    assert imported_students(models) == [('Ana', None, False), ('Eli', None, False)]
+
+
+def test_rejected_uploads(client, models_module, tokens):
+    models = models_module
+    assert upload(client, tokens, 'name\nAna\n', 'application/json').status_code == 415
+    response = client.post('/import_students', data=b'name\nAna\n', content_type='text/csv',
+                           environ_base={'REMOTE_ADDR': next(ADDRESSES)})
+    assert response.status_code == 401
+    assert imported_students(models) == []
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+test_jobs.py tests the background jobs: submission, claims, resumption of
+stale jobs and the heartbeat of running ones
+"""
+
+import threading
+import time
+import flask
+import jobs
+import configuration
+
+
+def age_job(models, job_id, seconds):
+    """
+    Moves the last checkpoint or heartbeat of a job back in time
+    :param models: models module
+    :param job_id:
+    :param seconds: age
+    :return:
+    """
+    models.DB.session.execute(
+        "UPDATE job SET updated_on = now() - :seconds * interval '1 second' WHERE id = :id",
+        {'seconds': seconds, 'id': job_id})
+    models.DB.session.commit()
+
+
+def test_submitted_job_runs_in_chunks(client, models_module, tokens, monkeypatch):
+    models = models_module
+    monkeypatch.setattr(configuration, 'JOB_CHUNK_SIZE', 2)
+    class_id = str(models.StudentClassDAO.add_class('Art').id)
+    student_ids = [str(models.StudentDAO.add_student(student_name=name).id)
+                   for name in ('Al', 'Bo', 'Cy')]
+    response = client.post('/jobs', json={
+        'kind': 'assign_students', 'xsrf_token': tokens[0],
+        'assignments': {student_id: class_id for student_id in student_ids}})
+    assert response.status_code == 202
+    job_id = response.json['id']
+
+    assert models.JobDAO.claim_job('worker') == job_id
+    assert models.JobDAO.claim_job('other') is None
+    assert models.JobDAO.run_job(job_id, 'worker') == jobs.SUCCEEDED
+    status = client.get('/jobs/{0}'.format(job_id)).json
+    assert (status['state'], status['processed'], status['total']) == ('succeeded', 3, 3)
+    assert status['result']['assigned'] == 3 and status['attempts'] == 1
+    assert [record.id for record in models.StudentDAO.get_student_records_by_class_id(
+        class_id)] == student_ids
+
+
+def test_stale_job_is_reclaimed(models_module):
+    models = models_module
+    job_id = str(models.JobDAO.create_job('rebuild_stats', {}).id)
+    assert models.JobDAO.claim_job('first') == job_id
+    age_job(models, job_id, configuration.JOB_STALE_SECONDS - 10)
+    assert models.JobDAO.claim_job('second') is None
+
+    age_job(models, job_id, configuration.JOB_STALE_SECONDS + 10)
+    assert models.JobDAO.claim_job('second') == job_id
+    # the first worker finds out at its next checkpoint and leaves the job
+    assert models.JobDAO.run_job(job_id, 'first') is None
+    assert models.JobDAO.run_job(job_id, 'second') == jobs.SUCCEEDED
+    job = models.JobDAO.get_job(job_id)
+    assert (job.state, job.attempts, job.owner) == (jobs.SUCCEEDED, 2, 'second')
+
+
+def test_heartbeat_keeps_a_long_job(models_module):
+    models = models_module
+    job_id = str(models.JobDAO.create_job('rebuild_stats', {}).id)
+    assert models.JobDAO.claim_job('first') == job_id
+    age_job(models, job_id, configuration.JOB_STALE_SECONDS + 10)
+
+    assert models.JobDAO.heartbeat_job(job_id, 'first')
+    assert not models.JobDAO.heartbeat_job(job_id, 'intruder')
+    assert models.JobDAO.claim_job('second') is None
+    assert models.JobDAO.get_job(job_id).attempts == 1
+
+
+def test_runner_beats_while_the_job_runs():
+    claimed = ['job-1']
+    beats = []
+    finished = threading.Event()
+
+    def run(job_id, token):  # pylint: disable=unused-argument
+        time.sleep(0.3)
+        finished.set()
+        return jobs.SUCCEEDED
+
+    runner = jobs.JobRunner(flask.Flask(__name__), lambda token: claimed.pop() if claimed else None,
+                            run, 1, 60, lambda job_id, token: beats.append((job_id, token)), 0.05)
+    runner.start()
+    assert finished.wait(5)
+    for _ in range(100):
+        if runner.finished[jobs.SUCCEEDED]:
+            break
+        time.sleep(0.01)
+    assert runner.finished[jobs.SUCCEEDED] == 1
+    assert len(beats) >= 3
+    assert {job_id for job_id, _ in beats} == {'job-1'}
+    assert len({token for _, token in beats}) == 1
+    count = len(beats)
+    time.sleep(0.2)
+    assert len(beats) == count
+
+
+def test_idle_workers_run_the_housekeeping():
+    claimed = ['job-1']
+    ran = []
+    idle = threading.Event()
+
+    def housekeeping():
+        failing = not idle.is_set()
+        idle.set()
+        if failing:
+            raise RuntimeError("housekeeping failed")
+
+    runner = jobs.JobRunner(flask.Flask(__name__), lambda token: claimed.pop() if claimed else None,
+                            lambda job_id, token: ran.append(job_id), 1, 0.05,
+                            idle=housekeeping)
+    runner.start()
+    assert idle.wait(5)
+    # the failed housekeeping does not stop the worker
+    idle.clear()
+    assert idle.wait(5)
+    assert ran == ['job-1']
+    # the worker outlives the test
+    runner.poll_seconds = 3600
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+"""
+test_lint.py runs pylint with the .pylintrc of the repository, which loads
+the pylint_flask_sqlalchemy plugin of requirements.txt, over the modules,
+the benchmarks and the tests. It is skipped when pylint is not installed
+"""
+
+import glob
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_pylint():
+    pytest.importorskip('pylint')
+    pytest.importorskip('pylint_flask_sqlalchemy')
+    paths = sorted(glob.glob(os.path.join(ROOT, '*.py'))) + [os.path.join(ROOT, 'benchmarks')] \
+        + sorted(glob.glob(os.path.join(ROOT, 'tests', '*.py')))
+    result = subprocess.run(
+        [sys.executable, '-m', 'pylint', '--rcfile', os.path.join(ROOT, '.pylintrc'),
+         '--score', 'n'] + paths, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True, check=False)
+    assert result.returncode == 0, result.stdout
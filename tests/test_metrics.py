@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+test_metrics.py tests the /metrics exposition and its sum over the worker
+processes
+"""
+
+import json
+import os
+import metrics
+
+
+def make_registry(requests, latency, busy):
+    """
+    :param requests: value of the counter
+    :param latency: value observed by the histogram
+    :param busy: value of the gauge
+    :return: Registry
+    """
+    registry = metrics.Registry()
+    counter = registry.register(metrics.Counter('requests_total', 'Requests', ('endpoint',)))
+    counter.inc(('home',), requests)
+    histogram = registry.register(metrics.Histogram('latency_seconds', 'Latency', (),
+                                                    (0.1, 1.0)))
+    histogram.observe(latency)
+    registry.register_callback('busy', 'Busy workers', 'gauge', 'state', lambda: {'busy': busy})
+    return registry
+
+
+def write_snapshot(directory, pid, registry):
+    """
+    :param directory: snapshot directory
+    :param pid: process id the snapshot is written as
+    :param registry: Registry
+    :return:
+    """
+    with open(os.path.join(str(directory), '{0}.json'.format(pid)), 'w',
+              encoding='utf-8') as snapshot:
+        json.dump(registry.collect(), snapshot)
+
+
+def test_snapshots_sum_the_workers(tmp_path):
+    snapshots = metrics.SnapshotDirectory(str(tmp_path), 5)
+    # a running worker and one which exited, whose gauge no longer counts
+    write_snapshot(tmp_path, os.getppid(), make_registry(2, 0.5, 1))
+    write_snapshot(tmp_path, 2 ** 22 + 1, make_registry(3, 0.05, 7))
+
+    text = metrics.Registry().render(snapshots.collect(make_registry(5, 2.0, 1)))
+    assert 'requests_total{endpoint="home"} 10' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert 'latency_seconds_count 3' in text
+    assert 'busy{state="busy"} 2' in text
+    assert '{0}.json'.format(os.getpid()) in os.listdir(str(tmp_path))
+
+    snapshots.clear()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_metrics_endpoint(client):
+    assert client.get('/').status_code == 200
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    text = response.data.decode('utf-8')
+    assert 'studentmanagement_requests_total{endpoint="show_all",method="GET",status="200"}' \
+        in text
+    assert '# TYPE studentmanagement_request_duration_seconds histogram' in text
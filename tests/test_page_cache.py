@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+test_page_cache.py tests the cache of the rendered pages: pages are cached
+per data version with a strong ETag, answered with 304 while the data is
+unchanged, and rendered again once a change bumped DATA_VERSION
+"""
+
+
+def test_unchanged_page_is_answered_with_304(client, models_module):
+    import handler  # pylint: disable=import-outside-toplevel
+    models = models_module
+    models.StudentDAO.add_student(student_name='Ana')
+    response = client.get('/')
+    assert response.status_code == 200 and b'Ana' in response.data
+    assert response.headers['Cache-Control'] == 'no-cache'
+    etag = response.headers['ETag']
+
+    hits = handler.RENDER_CACHE.hits
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert (response.status_code, response.data) == (304, b'')
+    assert response.headers['ETag'] == etag
+    assert handler.RENDER_CACHE.hits == hits + 1
+
+    # the change bumps DATA_VERSION, the page cached under the old version is not used
+    version = models.DATA_VERSION.value
+    models.StudentDAO.add_student(student_name='Ben')
+    assert models.DATA_VERSION.value > version
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and b'Ben' in response.data
+    assert response.headers['ETag'] != etag
+    assert client.get('/', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_degraded_page_is_not_cached(client, models_module, monkeypatch):
+    models = models_module
+    models.StudentDAO.add_student(student_name='Ana')
+
+    def unavailable(*args, **kwargs):
+        raise RuntimeError("database unavailable")
+    with monkeypatch.context() as patch:
+        patch.setattr(models.StudentDAO, 'get_unassigned_students_page', unavailable)
+        response = client.get('/')
+        assert response.status_code == 200 and b'Ana' not in response.data
+    etag = response.headers['ETag']
+
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and b'Ana' in response.data
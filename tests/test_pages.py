@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+test_pages.py tests the keyset pagination of the student and class lists
+and the round trip of its page cursors
+"""
+
+import datetime
+import html
+import re
+
+
+def walk_pages(client, url, key, page_size):
+    """
+    :param client: flask test client
+    :param url: list API
+    :param key: key of the rows in the response
+    :param page_size:
+    :return: list of the pages, every page a list of the ids of its rows
+    """
+    pages = []
+    cursor = None
+    while True:
+        query = 'page_size={0}'.format(page_size) + ('&cursor=' + cursor if cursor else '')
+        response = client.get('{0}?{1}'.format(url, query))
+        assert response.status_code == 200
+        pages.append([row['id'] for row in response.json[key]])
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            return pages
+
+
+def test_cursor_round_trip(models_module):
+    models = models_module
+    created_on = datetime.datetime(2020, 2, 29, 23, 59, 59, 123456)
+    cursor = models.PageCursor.encode(created_on, 'abc')
+    assert models.PageCursor.decode(cursor) == (created_on, 'abc')
+    for malformed in ('', 'not a cursor', cursor[:-4]):
+        try:
+            models.PageCursor.decode(malformed)
+        except ValueError:
+            continue
+        raise AssertionError("{0!r} was decoded".format(malformed))
+
+
+def test_student_pages_cover_every_student_once(client, models_module):
+    models = models_module
+    # students created at the same time are ordered by id
+    created_on = datetime.datetime.now().replace(microsecond=0)
+    expected = []
+    for index in range(7):
+        student_id = models.uuid7()
+        models.DB.session.execute(models.Student.__table__.insert().values(
+            id=student_id, name='Student {0}'.format(index),
+            created_on=created_on + datetime.timedelta(seconds=index // 3)))
+        expected.append((index // 3, student_id))
+    models.DB.session.commit()
+
+    pages = walk_pages(client, '/api/students', 'students', 3)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sum(pages, []) == [student_id for _, student_id in sorted(expected)]
+    assert client.get('/api/students?cursor=garbage').status_code == 400
+
+
+def test_class_pages(client, models_module):
+    models = models_module
+    class_ids = [str(models.StudentClassDAO.add_class('Class {0}'.format(index)).id)
+                 for index in range(4)]
+    assert walk_pages(client, '/api/classes', 'classes', 2) == [class_ids[:2], class_ids[2:]]
+    assert walk_pages(client, '/api/classes', 'classes', 10) == [class_ids]
+
+
+def test_home_page_pages_through_the_unassigned_students(client, models_module):
+    models = models_module
+    class_id = str(models.StudentClassDAO.add_class('Art').id)
+    for name in ('Ana', 'Ben', 'Cy'):
+        models.StudentDAO.add_student(class_id=class_id, student_name=name)
+    unassigned = [str(models.StudentDAO.add_student(student_name=name).id)
+                  for name in ('Dee', 'Eli')]
+
+    url = '/?page_size=1'
+    shown = []
+    while url:
+        page = client.get(url).data.decode('utf-8')
+        rows = re.findall(r'<tr id="unassigned-([0-9a-f-]+)"', page)
+        assert len(rows) == 1
+        shown += rows
+        next_link = re.search(r'href="(/\?[^"]*unassigned_cursor=[^"]+)"', page)
+        url = next_link and html.unescape(next_link.group(1))
+    assert shown == unassigned
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+test_replicas.py tests the routing of reads to a read replica: the replica
+is a second PostgreSQL database named by STUDENT_MANAGEMENT_TEST_REPLICA_DB_URL,
+holding its own rows so the tests see which database answered, and the tests
+are skipped when it is not set
+"""
+# pylint: disable=redefined-outer-name
+
+import datetime
+import os
+import time
+import pytest
+import configuration
+
+TEST_REPLICA_DB_URL_ENV_VAR = "STUDENT_MANAGEMENT_TEST_REPLICA_DB_URL"
+UNREACHABLE_DB_URL = "postgresql://postgres:@/postgres?host=/nonexistent"
+RETRY_SECONDS = 0.5
+
+
+@pytest.fixture
+def replica(app, models_module, monkeypatch):
+    """
+    :return: models, reading from the replica bind 'replica0'
+    """
+    url = os.environ.get(TEST_REPLICA_DB_URL_ENV_VAR)
+    if not url:
+        pytest.skip("{0} is not set".format(TEST_REPLICA_DB_URL_ENV_VAR))
+    models = models_module
+    monkeypatch.setitem(app.config['SQLALCHEMY_BINDS'], 'replica0', url)
+    import database  # pylint: disable=import-outside-toplevel
+    router = models.ReplicaRouter(['replica0'], RETRY_SECONDS)
+    # the routing session reads database.REPLICA_ROUTER, models re-exports it
+    monkeypatch.setattr(database, 'REPLICA_ROUTER', router)
+    monkeypatch.setattr(models, 'REPLICA_ROUTER', router)
+    engine = models.DB.get_engine(app, 'replica0')
+    with engine.connect() as connection:
+        connection.execute("DROP SCHEMA public CASCADE")
+        connection.execute("CREATE SCHEMA public")
+        models.DB.Model.metadata.create_all(bind=connection)
+        models.upgrade_schema(connection)
+        models.create_search_indexes(connection)
+    yield models
+    models.DB.session.remove()
+    engine.dispose()
+
+
+def add_replica_student(models, name):
+    """
+    Adds a student to the replica only
+    :param models: models module
+    :param name: name of the student
+    :return:
+    """
+    with models.DB.get_engine(bind='replica0').connect() as connection:
+        connection.execute(models.Student.__table__.insert().values(
+            id=models.uuid7(), name=name, created_on=datetime.datetime.now()))
+
+
+def request(models, client, method, url, **kwargs):
+    """
+    Sends a request in a new session, as the requests of a server run in
+    app contexts of their own, while the tests keep one open
+    :param models: models module
+    :param client: flask test client
+    :param method: http method
+    :param url:
+    :return: response
+    """
+    models.DB.session.remove()
+    return client.open(url, method=method, **kwargs)
+
+
+def student_names(models, client):
+    """
+    :param models: models module
+    :param client: flask test client
+    :return: names of the students listed by /api/students
+    """
+    response = request(models, client, 'GET', '/api/students')
+    assert response.status_code == 200
+    return [student['name'] for student in response.json['students']]
+
+
+def test_reads_go_to_the_replica(app, replica, tokens):
+    models = replica
+    add_replica_student(models, 'Rita')
+    writer = app.test_client()
+    response = request(models, writer, 'POST', '/add_student',
+                       data={'student_name': 'Paul', 'xsrf_token': tokens[0]})
+    assert response.status_code == 200
+
+    assert student_names(models, app.test_client()) == ['Rita']
+    assert models.REPLICA_ROUTER.reads['replica0'] >= 1
+    assert not models.REPLICA_ROUTER.failovers
+
+
+def test_writer_reads_its_writes_from_the_primary(app, replica, tokens, monkeypatch):
+    models = replica
+    monkeypatch.setattr(configuration, 'REPLICA_READ_YOUR_WRITES_SECONDS', 1)
+    add_replica_student(models, 'Rita')
+    writer = app.test_client()
+    assert student_names(models, writer) == ['Rita']
+    assert 'Set-Cookie' not in request(models, writer, 'GET', '/api/students').headers
+
+    response = request(models, writer, 'POST', '/add_student',
+                       data={'student_name': 'Paul', 'xsrf_token': tokens[0]})
+    cookie = response.headers['Set-Cookie']
+    assert cookie.startswith(configuration.REPLICA_READ_PRIMARY_COOKIE + '=1;')
+    assert 'Max-Age=1' in cookie and 'HttpOnly' in cookie
+    assert student_names(models, writer) == ['Paul']
+    assert student_names(models, app.test_client()) == ['Rita']
+
+    # the cookie expires once the replica has caught up, the cookie jar of
+    # the test client only drops it when asked to
+    time.sleep(1.5)
+    writer.cookie_jar.clear_expired_cookies()
+    assert student_names(models, writer) == ['Rita']
+
+
+def test_failed_replica_is_skipped_for_the_retry_seconds(app, replica, monkeypatch):
+    models = replica
+    models.StudentDAO.add_student(student_name='Paul')
+    add_replica_student(models, 'Rita')
+    monkeypatch.setitem(app.config['SQLALCHEMY_BINDS'], 'replica0', UNREACHABLE_DB_URL)
+    client = app.test_client()
+
+    assert student_names(models, client) == ['Paul']
+    assert models.REPLICA_ROUTER.failovers['replica0'] == 1
+    assert models.REPLICA_ROUTER.choose() is None
+    reads = models.REPLICA_ROUTER.reads['replica0']
+    assert student_names(models, client) == ['Paul']
+    assert models.REPLICA_ROUTER.reads['replica0'] == reads
+    assert models.REPLICA_ROUTER.failovers['replica0'] == 1
+
+    # the replica is back, and read from again after RETRY_SECONDS
+    monkeypatch.setitem(app.config['SQLALCHEMY_BINDS'], 'replica0',
+                        os.environ[TEST_REPLICA_DB_URL_ENV_VAR])
+    assert student_names(models, client) == ['Paul']
+    time.sleep(RETRY_SECONDS + 0.1)
+    assert student_names(models, client) == ['Rita']
+    assert models.REPLICA_ROUTER.reads['replica0'] == reads + 1
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""
+test_schema.py tests the schema upgrades run at startup and the lookups of
+tables by name
+"""
+
+from sqlalchemy import MetaData, Table, text
+
+
+def test_table_exists_quotes_names(models_module):
+    models = models_module
+    connection = models.DB.session.connection()
+    connection.execute(text('CREATE SCHEMA "Reports"'))
+    connection.execute(text('CREATE TABLE "Reports"."MixedCase" (id integer)'))
+
+    assert models.table_exists(connection, Table('MixedCase', MetaData(), schema='Reports'))
+    assert not models.table_exists(connection, Table('mixedcase', MetaData(), schema='Reports'))
+    assert not models.table_exists(connection, Table('MixedCase', MetaData()))
+    assert models.table_exists(connection, models.StudentArchive.__table__)
+    models.DB.session.rollback()
+
+
+def test_upgrade_schema_adds_dropped_columns(models_module):
+    models = models_module
+    with models.DB.engine.connect() as connection:
+        connection.execute(text("ALTER TABLE studentclass DROP COLUMN closed_on"))
+        models.upgrade_schema(connection)
+        assert connection.execute(text(
+            "SELECT count(*) FROM information_schema.columns "
+            "WHERE table_name = 'studentclass' AND column_name = 'closed_on'")).scalar() == 1
+
+
+def test_archive_partitions_are_created_once(models_module):
+    models = models_module
+    partition = Table('student_archive_1999', MetaData())
+    models.create_archive_partitions([1999])
+    models.create_archive_partitions([1999])
+    assert models.table_exists(models.DB.session.connection(), partition)
+    models.DB.session.commit()
+    assert models.table_exists(models.DB.session.connection(), partition)
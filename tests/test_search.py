@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+test_search.py tests the student name search of /api/students/search
+"""
+
+
+def add_students(client, tokens, names):
+    """
+    :param client: flask test client
+    :param tokens: xsrf tokens
+    :param names: names of the students to add
+    :return:
+    """
+    for name in names:
+        response = client.post('/add_student', data={'student_name': name,
+                                                      'xsrf_token': tokens[0]})
+        assert response.status_code == 200
+
+
+def test_prefix_search_runs_in_the_database(client, models_module, tokens, monkeypatch):
+    models = models_module
+    add_students(client, tokens, ['Maria Lopez', 'mario Rossi', 'Marta', 'Ma_x', 'Zoe'])
+
+    def no_index():
+        raise AssertionError("PostgreSQL must not build the in-process index")
+    monkeypatch.setattr(models.NAME_INDEX, 'get', no_index)
+
+    response = client.get('/api/students/search?q=MAR')
+    assert response.status_code == 200
+    names = [student['name'] for student in response.json['students']]
+    assert names[:3] == ['Maria Lopez', 'mario Rossi', 'Marta']
+    assert all(student['score'] == 1.0 for student in response.json['students'][:3])
+    # LIKE wildcards are searched literally
+    response = client.get('/api/students/search?q=ma_')
+    assert [student['name'] for student in response.json['students']][:1] == ['Ma_x']
+    if not models.trigram_search_available():
+        assert len(response.json['students']) == 1
+    assert client.get('/api/students/search?q=%20').status_code == 400
+
+
+def test_in_process_index_on_other_databases(models_module, monkeypatch):
+    models = models_module
+    for name in ('Nadia', 'Nadine', 'Omar'):
+        models.StudentDAO.add_student(student_name=name)
+    monkeypatch.setattr(models.DB.engine.dialect, 'name', 'sqlite')
+
+    results = models.StudentDAO.search_students('nad', limit=5)
+    assert [result.name for result in results] == ['Nadia', 'Nadine']
+    assert [result.name for result in models.StudentDAO.search_students('omarx')] == ['Omar']
+
+
+def test_in_process_index_follows_the_writes(models_module, monkeypatch):
+    models = models_module
+    nadia, nadine = (models.StudentDAO.add_student(student_name=name).id
+                     for name in ('Nadia', 'Nadine'))
+    monkeypatch.setattr(models.DB.engine.dialect, 'name', 'sqlite')
+    assert [result.name for result in models.StudentDAO.search_students('nad')] == [
+        'Nadia', 'Nadine']
+    rebuilds = models.NAME_INDEX.rebuilds
+
+    models.StudentDAO.add_student(student_name='Nadir')
+    models.StudentDAO.update_student(str(nadia), 'Ophelia')
+    models.StudentDAO.delete_student(id=str(nadine))
+    with models.unit_of_work():
+        nadja = models.StudentDAO.add_student(student_name='Nadja')
+        models.StudentDAO.delete_student(id=str(nadja.id))
+    assert [result.name for result in models.StudentDAO.search_students('nad')] == ['Nadir']
+    assert [result.name for result in models.StudentDAO.search_students('ophelia')] == [
+        'Ophelia']
+    assert models.NAME_INDEX.rebuilds == rebuilds
+
+    # a write of another process bumps the version without events of this one
+    models.DB.session.execute(models.Student.__table__.insert().values(
+        id=models.uuid7(), name='Nadim'))
+    models.DB.session.commit()
+    models.DATA_VERSION.bump()
+    assert [result.name for result in models.StudentDAO.search_students('nad')] == [
+        'Nadim', 'Nadir']
+    assert models.NAME_INDEX.rebuilds == rebuilds + 1
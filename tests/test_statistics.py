@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+test_statistics.py tests the incrementally maintained class statistics
+against their rebuild from the student table, before and after their deltas
+are compacted, and that concurrent writers do not wait for each other
+"""
+
+import datetime
+import threading
+import pytest
+
+
+def statistics(models):
+    """
+    :param models: models module
+    :return: dict of class id (or UNASSIGNED_CLASS_KEY) -> (student_count, last_enrolled_on)
+    """
+    classes, unassigned = models.ClassStatisticsDAO.get_class_statistics()
+    result = {str(row.class_id): (row.student_count, row.last_enrolled_on) for row in classes}
+    result[models.UNASSIGNED_CLASS_KEY] = (unassigned, None)
+    return result
+
+
+def counters(models):
+    """
+    :param models: models module
+    :return: dict of class id (or UNASSIGNED_CLASS_KEY) -> (student_count, last_enrolled_on)
+             of the class_statistics rows alone
+    """
+    return {str(row.class_id): (row.student_count, row.last_enrolled_on)
+            for row in models.ClassStatistics.query.all()}
+
+
+@pytest.mark.parametrize('dialect_name', ['postgresql', 'sqlite'])
+def test_record_changes_matches_rebuild(models_module, monkeypatch, dialect_name):
+    models = models_module
+    # other databases take the update or insert path, with the same result
+    monkeypatch.setattr(models.DB.engine.dialect, 'name', dialect_name)
+    first = str(models.StudentClassDAO.add_class('Physics').id)
+    second = str(models.StudentClassDAO.add_class('Chemistry').id)
+    students = [models.StudentDAO.add_student(class_id=class_id, student_name=name)
+                for class_id, name in ((first, 'Ana'), (first, 'Ben'), (second, 'Cy'),
+                                       (None, 'Dee'))]
+    models.StudentDAO.assign_class(class_id=second, student_id=str(students[1].id))
+    models.StudentDAO.delete_student(id=str(students[2].id))
+    models.ClassStatisticsDAO.record_changes(
+        added=[(first, datetime.datetime.now() - datetime.timedelta(days=1))],
+        removed=[first])
+    incremental = statistics(models)
+    assert not counters(models)
+
+    # compacted two deltas at a time, by the path of the dialect
+    while models.ClassStatisticsDAO.compact(limit=2):
+        assert statistics(models) == incremental
+    assert not models.ClassStatisticsDelta.query.count()
+    compacted = counters(models)
+
+    monkeypatch.setattr(models.DB.engine.dialect, 'name', 'postgresql')
+    models.ClassStatisticsDAO.rebuild()
+    assert incremental == statistics(models)
+    assert compacted == counters(models)
+    assert incremental[first][0] == 1
+    assert incremental[second][0] == 1
+    assert incremental[models.UNASSIGNED_CLASS_KEY][0] == 1
+
+
+def test_writers_do_not_wait_for_the_counters(app, models_module):
+    models = models_module
+    models.StudentDAO.add_student(student_name='Ana')
+    models.ClassStatisticsDAO.compact()
+    results = []
+
+    def add_unassigned_student():
+        with app.app_context():
+            try:
+                # fails instead of waiting for the transaction of the test
+                models.DB.session.execute("SET LOCAL lock_timeout = '2s'")
+                results.append(models.StudentDAO.add_student(student_name='Ben').name)
+            except Exception as exception:  # pylint: disable=broad-except
+                results.append(exception)
+            finally:
+                models.DB.session.remove()
+
+    with models.unit_of_work():
+        models.StudentDAO.add_student(student_name='Cy')
+        writer = threading.Thread(target=add_unassigned_student)
+        writer.start()
+        writer.join(10)
+    assert results == ['Ben']
+    assert statistics(models)[models.UNASSIGNED_CLASS_KEY] == (3, None)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+test_versions.py tests the optimistic concurrency of the student and class
+updates: the version checks of the conditional UPDATEs answered with 409,
+and the version_id_col checks of the ORM flushes
+"""
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm.exc import StaleDataError
+
+
+def test_stale_student_update_is_answered_with_409(client, models_module, tokens):
+    models = models_module
+    student_id = str(models.StudentDAO.add_student(student_name='Ana').id)
+
+    response = client.put('/update_student', data={
+        'student_id': student_id, 'student_name': 'Anna', 'version': '1',
+        'xsrf_token': tokens[0]})
+    assert response.status_code == 200
+    response = client.put('/update_student', data={
+        'student_id': student_id, 'student_name': 'Hanna', 'version': '1',
+        'xsrf_token': tokens[0]})
+    assert response.status_code == 409
+    student = models.StudentDAO.get_student_by_id(student_id)
+    assert (student.name, student.version) == ('Anna', 2)
+
+    # without a version the update overwrites
+    response = client.put('/update_student', data={
+        'student_id': student_id, 'student_name': 'Hanna', 'xsrf_token': tokens[0]})
+    assert response.status_code == 200
+
+
+def test_stale_class_updates_are_answered_with_409(client, models_module, tokens):
+    models = models_module
+    class_id = str(models.StudentClassDAO.add_class('Art').id)
+    assert models.StudentClassDAO.update_class_details(class_id=class_id, class_name='Arts')
+
+    response = client.put('/update_class_details', data={
+        'class_id': class_id, 'class_name': 'Fine arts', 'version': '1',
+        'xsrf_token': tokens[1]})
+    assert response.status_code == 409
+    response = client.put('/close_class', data={
+        'class_id': class_id, 'version': '1', 'xsrf_token': tokens[1]})
+    assert response.status_code == 409
+    response = client.post('/batch', json={'operations': [
+        {'op': 'add_student', 'student_name': 'Ben', 'xsrf_token': tokens[0]},
+        {'op': 'update_class_details', 'class_id': class_id, 'class_name': 'Fine arts',
+         'version': 1, 'xsrf_token': tokens[1]}]})
+    assert (response.status_code, response.json['index']) == (409, 1)
+
+    course = models.StudentClassDAO.get_class_by_id(class_id)
+    assert (course.name, course.version, course.closed_on) == ('Arts', 2, None)
+    assert models.StudentDAO.get_all_student_records() == []
+
+
+def test_orm_flush_of_a_stale_student_fails(models_module, monkeypatch):
+    models = models_module
+    class_id = str(models.StudentClassDAO.add_class('Art').id)
+    student_id = str(models.StudentDAO.add_student(student_name='Ana').id)
+    get_student_by_id = models.StudentDAO.get_student_by_id
+
+    def changed_after_read(student_id):
+        student = get_student_by_id(student_id)
+        # by another request, between the read and the flush of assign_class
+        with models.DB.engine.connect() as connection:
+            connection.execute(text("UPDATE student SET name = 'Anna', version = version + 1 "
+                                    "WHERE id = :id"), {'id': student_id})
+        return student
+    monkeypatch.setattr(models.StudentDAO, 'get_student_by_id', changed_after_read)
+
+    with pytest.raises(StaleDataError):
+        models.StudentDAO.assign_class(class_id=class_id, student_id=student_id)
+    models.DB.session.rollback()
+    student = get_student_by_id(student_id)
+    assert (student.name, student.class_id, student.version) == ('Anna', None, 2)
@@ -0,0 +1,7 @@
+#!/usr/bin/env python
+"""
+wsgi.py exposes the flask application to the production WSGI server,
+see `python3 manage.py serve`
+"""
+
+from handler import app as application  # pylint: disable=unused-import